@@ -0,0 +1,450 @@
+import argparse
+import csv
+import gzip
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse as up
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+from rdflib import Graph
+from impl import _applyUpdate, MetadataUploadHandler, ProcessDataUploadHandler, MetadataQueryHandler, ProcessDataQueryHandler
+from impl import BasicMashup, AdvancedMashup, NauticalChart, Acquisition, Processing, Modelling, Optimising, Exporting
+
+# LOCAL SPARQL ENDPOINT
+
+class LocalSparqlEndpoint(object):
+    # A stand-in for the triplestore that speaks the SPARQL 1.1 protocol over HTTP and keeps its data in an rdflib
+    # graph, so that the handlers can be tested and measured without a Blazegraph instance
+    def __init__(self, graph: Graph|None = None):
+        self.graph = graph if graph is not None else Graph()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.updates = 0
+        self.connections = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._requestHandler())
+        self.thread = None
+
+    def getUrl(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/sparql"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def _requestHandler(self):
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1 keeps the connections open between requests, like a real triplestore
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with endpoint.lock:
+                    endpoint.connections += 1
+
+            def do_GET(self):
+                parameters = up.parse_qs(up.urlparse(self.path).query)
+                self._answer(parameters.get("query", [None])[0], parameters.get("update", [None])[0])
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+                content_type = self.headers.get("Content-Type", "").split(";")[0].strip()
+                if content_type == "application/sparql-query":
+                    self._answer(body, None)
+                elif content_type == "application/sparql-update":
+                    self._answer(None, body)
+                else:
+                    parameters = up.parse_qs(body)
+                    self._answer(parameters.get("query", [None])[0], parameters.get("update", [None])[0])
+
+            def _answer(self, query, update):
+                try:
+                    with endpoint.lock:
+                        endpoint.requests += 1
+                        if update is not None:
+                            endpoint.updates += 1
+                            _applyUpdate(endpoint.graph, update)
+                            body, content_type = b"", "text/plain"
+                        elif query is not None:
+                            body, content_type = self._results(endpoint.graph.query(query))
+                        else:
+                            raise ValueError("Missing query or update")
+                except Exception as e:
+                    self._send(400, str(e).encode("utf-8"), "text/plain")
+                else:
+                    self._send(200, body, content_type)
+
+            def _results(self, result):
+                accept = self.headers.get("Accept", "")
+                for content_type, format in [("text/csv", "csv"), ("application/sparql-results+json", "json")]:
+                    if content_type in accept:
+                        return result.serialize(format=format), content_type
+                return result.serialize(format="xml"), "application/sparql-results+xml"
+
+            def _send(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                if body and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body, compresslevel=1)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+# MATERIALIZATION
+
+def makeActivityFrame(rows: int, objects: int = 1000) -> pd.DataFrame:
+    # A frame shaped like the result of ProcessDataQueryHandler.getAllActivities, after the fillna('') done by the mashup
+    types = ['acquisition', 'processing', 'modelling', 'optimising', 'exporting']
+    return pd.DataFrame({
+        'activityId': [f"{types[i % 5]}-{i}" for i in range(rows)],
+        'responsible institute': ['Philology'] * rows,
+        'responsible person': ['Grace Hopper'] * rows,
+        'tool': ['Gimp, Blender, Instant Meshes'] * rows,
+        'start date': ['2023-05-07'] * rows,
+        'end date': ['2023-06-07'] * rows,
+        'objectId': [i % objects + 1 for i in range(rows)],
+        'technique': ['Photogrammetry' if i % 5 == 0 else '' for i in range(rows)],
+    })
+
+def makeObjects(objects: int = 1000) -> dict:
+    return {str(i): NauticalChart(str(i), "Nautical chart", "BUB", "Bologna", "1482", []) for i in range(1, objects + 1)}
+
+def buildActivitiesWithIterrows(df: pd.DataFrame, objects: dict) -> list:
+    # The row-by-row loop used by BasicMashup before the shared materialization, kept as a reference
+    dict_of_classes = {'acquisition': Acquisition, 'processing': Processing, 'modelling': Modelling,
+                       'optimising': Optimising, 'exporting': Exporting}
+    list_of_activities = []
+    for i, row in df.iterrows():
+        act_refersTo = objects.get(str(df.loc[i]["objectId"]))
+        act_institute = df.loc[i]["responsible institute"]
+        act_person = df.loc[i]["responsible person"]
+        act_start = df.loc[i]["start date"]
+        act_end = df.loc[i]["end date"]
+        act_tool = df.loc[i]["tool"]
+        act_type = re.search(r'^[^-]*', df.loc[i]["activityId"]).group(0)
+        if dict_of_classes[act_type] == Acquisition:
+            act_technique = df.loc[i]["technique"]
+            result_activity = Acquisition(act_refersTo, act_institute, act_technique, act_person, act_start, act_end, act_tool)
+        else:
+            result_activity = dict_of_classes[act_type](act_refersTo, act_institute, act_person, act_start, act_end, act_tool)
+        list_of_activities.append(result_activity)
+    return list_of_activities
+
+def benchmarkMaterialization(sizes: list[int], referenceLimit: int) -> list[dict]:
+    mashup = BasicMashup()
+    objects = makeObjects()
+    results = []
+    for size in sizes:
+        df = makeActivityFrame(size)
+        start = time.perf_counter()
+        mashup._buildActivities(df, objects)
+        vectorized = time.perf_counter() - start
+
+        reference = None
+        if size <= referenceLimit:
+            start = time.perf_counter()
+            buildActivitiesWithIterrows(df, objects)
+            reference = time.perf_counter() - start
+
+        results.append({
+            "benchmark": "materialization",
+            "rows": size,
+            "vectorized_seconds": round(vectorized, 4),
+            "iterrows_seconds": round(reference, 4) if reference is not None else None,
+            "speedup": round(reference / vectorized, 1) if reference is not None else None,
+        })
+        print(results[-1])
+    return results
+
+# SYNTHETIC DATA
+
+# The values are drawn, in a fixed cycle, from vocabularies shaped like the ones of data/meta.csv and data/process.json,
+# so that the same size always produces the same files and the partial-name queries match a stable share of the rows
+_TYPES = ['Nautical chart', 'Printed volume', 'Herbarium', 'Printed material', 'Specimen', 'Painting', 'Map',
+          'Manuscript volume', 'Manuscript plate', 'Model']
+_OWNERS = [('BUB', 'Bologna'), ('Accademia Carrara', 'Bergamo'), ('Sistema Museale di Ateneo di Bologna', 'Bologna'),
+           ('Biblioteca Capitolare', 'Verona')]
+_INSTITUTES = ['Council', 'Philology', 'Engineering', 'Heritage', 'Architecture']
+_RESPONSIBLE = ['Alice Liddell', 'Grace Hopper', 'Ada Lovelace', 'Alan Turing', 'Katherine Johnson', 'Edsger Dijkstra']
+_TOOLS = ['Nikon D7200 Nikor 50mm', '3DF Zephyr', 'Blender', 'Instant Meshes', 'Gimp', 'Adobe Photoshop']
+_TECHNIQUES = ['Photogrammetry', 'Structured-light 3D scanner']
+
+def writeMetadataCsv(path: str, objects: int, authors: int = 500):
+    # A CSV shaped like data/meta.csv, with objects that have from zero to two authors each. As in writeProcessJson,
+    # the rows are written one at a time
+    with open(path, mode='w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(["Id", "Type", "Title", "Date", "Author", "Owner", "Place"])
+        for i in range(1, objects + 1):
+            people = [(i + k) % authors for k in range(i % 3)]
+            names = [f"Author {j}, Name (VIAF:{100000 + j})" for j in people]
+            owner, place = _OWNERS[i % len(_OWNERS)]
+            writer.writerow([i, _TYPES[i % len(_TYPES)], f"Title {i}", str(1400 + i % 500), "; ".join(names), owner, place])
+
+def writeProcessJson(path: str, objects: int):
+    # A JSON array shaped like data/process.json, with the five activities of every object. The records are written
+    # one at a time, so that the largest sizes do not have to be held in memory.
+    with open(path, mode='w', encoding='utf-8') as f:
+        f.write("[\n")
+        for i in range(1, objects + 1):
+            record = {"object id": str(i)}
+            day = i % 300
+            for k, activity in enumerate(['acquisition', 'processing', 'modelling', 'optimising', 'exporting']):
+                start = pd.Timestamp("2023-01-01") + pd.Timedelta(days=day + 2 * k)
+                values = {"responsible institute": _INSTITUTES[(i + k) % len(_INSTITUTES)],
+                          "responsible person": _RESPONSIBLE[(i + k) % len(_RESPONSIBLE)]}
+                if activity == 'acquisition':
+                    values["technique"] = _TECHNIQUES[i % len(_TECHNIQUES)]
+                values["tool"] = [_TOOLS[(i + k + t) % len(_TOOLS)] for t in range(i % 3)]
+                # One record in ten is still in progress and has no end date
+                values["start date"] = start.strftime("%Y-%m-%d")
+                values["end date"] = "" if i % 10 == k else (start + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+                record[activity] = values
+            f.write(("" if i == 1 else ",\n") + json.dumps(record))
+        f.write("\n]\n")
+
+def generateDataset(directory: str, objects: int) -> tuple[str, str]:
+    meta = os.path.join(directory, f"meta-{objects}.csv")
+    process = os.path.join(directory, f"process-{objects}.json")
+    writeMetadataCsv(meta, objects, authors=max(10, objects // 2))
+    writeProcessJson(process, objects)
+    return meta, process
+
+# METADATA UPLOAD
+
+def benchmarkMetadataUpload(sizes: list[int], referenceLimit: int, batchSize: int = 10000,
+                            workers: int|None = None) -> list[dict]:
+    workers = workers or os.cpu_count() or 1
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        # The upload handler appends the uploaded graph to Graph_db.ttl in the working directory
+        os.chdir(directory)
+        try:
+            for size in sizes:
+                path = os.path.join(directory, f"meta-{size}.csv")
+                writeMetadataCsv(path, size)
+                result = {"benchmark": "metadata upload", "objects": size}
+                # A batch size of 1 sends one update per triple, as the per-triple store.add loop did. The parallel
+                # upload serialises the triples in worker processes; the stand-in endpoint still parses them in this one
+                for name, batch, processes in [("batched", batchSize, 1), ("parallel", batchSize, workers), ("per_triple", 1, 1)]:
+                    if name == "per_triple" and size > referenceLimit:
+                        result[f"{name}_seconds"] = None
+                        continue
+                    with LocalSparqlEndpoint() as endpoint:
+                        handler = MetadataUploadHandler()
+                        handler.setDbPathOrUrl(endpoint.getUrl())
+                        handler.setBatchSize(batch)
+                        handler.setWorkers(processes)
+                        handler.pushDataToDb(path)
+                        report = handler.getLastReport()
+                    result["triples"] = report["triples"]
+                    result[f"{name}_seconds"] = round(report["seconds"], 4)
+                    result[f"{name}_requests"] = report["requests"]
+                print(result)
+                results.append(result)
+        finally:
+            os.chdir(cwd)
+    return results
+
+# QUERIES
+
+def measure(benchmark: str, function, *args, repeat: int = 1, memory: bool = True) -> dict:
+    # The time of each of the repeated calls (the best and the median are reported) and, in one further call traced
+    # with tracemalloc, the peak of the memory allocated by Python, numpy and pandas. The stand-in endpoint runs in
+    # the same process, so its allocations are part of the peak of the graph queries.
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            function(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {"benchmark": benchmark,
+            "best_seconds": round(timings[0], 4),
+            "median_seconds": round(timings[len(timings) // 2], 4),
+            "peak_bytes": peak,
+            "results": len(result) if hasattr(result, "__len__") else None}
+
+def _queryCases(metadata: MetadataQueryHandler, process: ProcessDataQueryHandler, basic: BasicMashup,
+                advanced: AdvancedMashup, objects: int) -> list[tuple]:
+    # Every public query method of the handlers and of the mashups, with arguments matching some of the generated data
+    person, object_id, ids = "VIAF:100001", "2", [str(i) for i in range(1, min(objects, 500) + 1)]
+    handler_cases = [
+        (metadata, "getById", "2"), (metadata, "getById", person), (metadata, "getAllPeople"),
+        (metadata, "getAllCulturalHeritageObjects"), (metadata, "getAuthorsOfCulturalHeritageObject", object_id),
+        (metadata, "getCulturalHeritageObjectsAuthoredBy", person), (metadata, "getAuthorsOfCulturalHeritageObjects", ids),
+        (metadata, "getCulturalHeritageObjectsByIds", ids),
+        (process, "getById", "2"), (process, "getAllActivities"), (process, "getActivitiesByResponsibleInstitution", "Phil"),
+        (process, "getActivitiesByResponsiblePerson", "Grace"), (process, "getActivitiesUsingTool", "Blender"),
+        (process, "getActivitiesStartedAfter", "2023-06-01"), (process, "getActivitiesEndedBefore", "2023-03-01"),
+        (process, "getActivitiesByObjectIds", ids), (process, "getActivitiesInTimeFrame", "2023-04-01", "2023-06-10"),
+        (process, "getAcquisitionsByTechnique", "Photo"),
+    ]
+    mashup_cases = [
+        (basic, "getEntityById", "2"), (basic, "getEntityById", person), (basic, "getAllPeople"),
+        (basic, "getAllCulturalHeritageObjects"), (basic, "getAuthorsOfCulturalHeritageObject", object_id),
+        (basic, "getCulturalHeritageObjectsAuthoredBy", person), (basic, "getAllActivities"),
+        (basic, "getActivitiesByResponsibleInstitution", "Phil"), (basic, "getActivitiesByResponsiblePerson", "Grace"),
+        (basic, "getActivitiesUsingTool", "Blender"), (basic, "getActivitiesStartedAfter", "2023-06-01"),
+        (basic, "getActivitiesEndedBefore", "2023-03-01"), (basic, "getAcquisitionsByTechnique", "Photo"),
+        (basic, "getActivitiesInTimeFrame", "2023-04-01", "2023-06-10"),
+        (advanced, "getActivitiesOnObjectsAuthoredBy", person), (advanced, "getObjectsHandledByResponsiblePerson", "Grace"),
+        (advanced, "getObjectsHandledByResponsibleInstitution", "Phil"),
+        (advanced, "getAuthorsOfObjectsAcquiredInTimeFrame", "2023-04-01", "2023-06-10"),
+    ]
+    return handler_cases + mashup_cases
+
+def benchmarkQueries(sizes: list[int], repeat: int = 3, memory: bool = True) -> list[dict]:
+    # For each size, the generated files are uploaded to a stand-in SPARQL endpoint and to a fresh SQLite database,
+    # then every query method is measured against them
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            for size in sizes:
+                meta, process = generateDataset(directory, size)
+                database = os.path.join(directory, f"relational-{size}.db")
+                with LocalSparqlEndpoint() as endpoint:
+                    metadata_upload = MetadataUploadHandler()
+                    metadata_upload.setDbPathOrUrl(endpoint.getUrl())
+                    process_upload = ProcessDataUploadHandler()
+                    process_upload.setDbPathOrUrl(database)
+                    # The uploads add to what is already stored, so every call starts again from empty stores
+                    def emptyGraph():
+                        endpoint.graph.remove((None, None, None))
+
+                    def emptyDatabase():
+                        for suffix in ["", "-wal", "-shm"]:
+                            if os.path.exists(database + suffix):
+                                os.remove(database + suffix)
+
+                    for handler, path, reset in [(metadata_upload, meta, emptyGraph), (process_upload, process, emptyDatabase)]:
+                        requests = endpoint.requests
+                        result = measure(f"{type(handler).__name__}.pushDataToDb",
+                                         lambda path: reset() or handler.pushDataToDb(path), path, memory=memory)
+                        result.update(objects=size, requests=(endpoint.requests - requests) / (1 + memory))
+                        print(result)
+                        results.append(result)
+
+                    metadata = MetadataQueryHandler()
+                    metadata.setDbPathOrUrl(endpoint.getUrl())
+                    process_query = ProcessDataQueryHandler()
+                    process_query.setDbPathOrUrl(database)
+                    basic, advanced = BasicMashup(), AdvancedMashup()
+                    for mashup in (basic, advanced):
+                        mashup.addMetadataHandler(metadata)
+                        mashup.addProcessHandler(process_query)
+
+                    for target, method, *args in _queryCases(metadata, process_query, basic, advanced, size):
+                        requests = endpoint.requests
+                        result = measure(f"{type(target).__name__}.{method}", getattr(target, method), *args,
+                                         repeat=repeat, memory=memory)
+                        result.update(objects=size, arguments=[a if isinstance(a, str) else f"{len(a)} ids" for a in args],
+                                      requests=(endpoint.requests - requests) / (repeat + memory))
+                        print(result)
+                        results.append(result)
+                    process_query.close()
+        finally:
+            os.chdir(cwd)
+    return results
+
+def environment() -> dict:
+    # What the results depend on besides the code, and the commit of the code when run inside the repository
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": sys.version.split()[0], "pandas": pd.__version__,
+            "platform": platform.platform(), "processor": platform.processor() or platform.machine()}
+
+def compareResults(baseline: dict, current: dict) -> list[dict]:
+    # The ratio between the best times of the same benchmark, on the same size and arguments, in two result files
+    def key(result):
+        return (result["benchmark"], result.get("objects", result.get("rows")), json.dumps(result.get("arguments")))
+    previous = {key(result): result for result in baseline["results"] if "best_seconds" in result}
+    comparison = []
+    for result in current["results"]:
+        before = previous.get(key(result))
+        if before is not None and "best_seconds" in result and before["best_seconds"]:
+            comparison.append({"benchmark": result["benchmark"], "objects": key(result)[1],
+                               "arguments": result.get("arguments"), "before_seconds": before["best_seconds"],
+                               "after_seconds": result["best_seconds"],
+                               "ratio": round(result["best_seconds"] / before["best_seconds"], 2)})
+    return comparison
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the data science project")
+    parser.add_argument("--suite", choices=["materialization", "upload", "queries", "all"], default="all")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--query-sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="numbers of generated objects for the query suite")
+    parser.add_argument("--reference-limit", type=int, default=100000,
+                        help="largest size for which the slow row-by-row reference is also measured")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes of the parallel metadata upload, by default the number of CPUs")
+    parser.add_argument("--repeat", type=int, default=3, help="timed calls of every query method")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace the memory of the query methods")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=None, help="a JSON file written by a previous run to compare with")
+    args = parser.parse_args()
+
+    results = []
+    if args.suite in ("materialization", "all"):
+        results += benchmarkMaterialization(args.sizes, args.reference_limit)
+    if args.suite in ("upload", "all"):
+        results += benchmarkMetadataUpload([size // 100 for size in args.sizes], args.reference_limit // 100,
+                                            workers=args.workers)
+    if args.suite in ("queries", "all"):
+        results += benchmarkQueries(args.query_sizes, args.repeat, not args.no_memory)
+
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, mode='w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        for row in compareResults(baseline, report):
+            print(row)
@@ -2,14 +2,67 @@ import pandas as pd
 import urllib.parse as up
 import sqlite3 as sq
 import re
-from datetime import datetime
-from rdflib import Graph, Namespace, URIRef, Literal, RDF
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+import weakref
+import io
+import shutil
+import tempfile
+import math
+import asyncio
+import contextvars
+import inspect
+import gzip
+import socket
+import http.client
+from collections import OrderedDict
+from functools import wraps, lru_cache, partial
+from contextlib import contextmanager
+from itertools import islice, chain, count
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import date
+from rdflib import Graph, Namespace, URIRef, Literal, RDF, XSD
 from rdflib.plugins.stores.sparqlstore import SPARQLUpdateStore
-from sparql_dataframe import get
+
+# pyarrow is only needed for the Parquet snapshots of the process data
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    from pyarrow.fs import LocalFileSystem
+except ImportError:
+    pa = pc = ds = LocalFileSystem = None
 
 # DATA-MODEL
 
+# The classes below use __slots__ to keep millions of instances small. Besides the validating constructors,
+# they offer a _fromStore fast path for values read from our own databases, which skips the checks and
+# interns the strings that repeat across many instances (owners, places, institutes, people, tools).
+# The object of an activity and the authors of an object can also be given as a key plus a _BatchLoader,
+# in which case they are resolved on the first call to refersTo() / getAuthors().
+
+class _BatchLoader(object):
+    # Resolve all the pending keys with a single call to load(keys) the first time any of them is requested
+    __slots__ = ('load', 'keys', 'values')
+
+    def __init__(self, load, keys):
+        self.load = load
+        self.keys = keys
+        self.values = None
+
+    def get(self, key):
+        if self.values is None:
+            self.values = self.load(self.keys)
+            self.keys = None
+        return self.values.get(key)
+
 class IdentifiableEntity(object):
+    __slots__ = ('id',)
+
     def __init__(self, id:str):
         if not isinstance(id, str):
             raise ValueError("IdentifiableEntity.id must be a string")
@@ -19,17 +72,28 @@ class IdentifiableEntity(object):
         return self.id
 
 class Person(IdentifiableEntity):
+    __slots__ = ('name',)
+
     def __init__(self, id: str, name: str):
         super().__init__(id)
         if not isinstance(name, str):
             raise ValueError("Person.name must be a string")
         self.name = name
 
+    @classmethod
+    def _fromStore(cls, id: str, name: str):
+        person = cls.__new__(cls)
+        person.id = id
+        person.name = name
+        return person
+
     def getName(self):
         return self.name
 
 
 class CulturalHeritageObject(IdentifiableEntity):
+    __slots__ = ('title', 'owner', 'place', 'date', 'authors', '_authorsLoader')
+
     def __init__(self, id: str, title: str, owner: str, place: str, date: str|None=None, authors: Person|list[Person]|None=None):
         super().__init__(id)
         if not isinstance(title, str):
@@ -47,11 +111,25 @@ class CulturalHeritageObject(IdentifiableEntity):
         self.place = place
         self.date = date
         self.authors = list()
+        self._authorsLoader = None
 
         if type(authors) == Person:
-            self.authors.append(Person)
+            self.authors.append(authors)
         elif type(authors) == list:
             self.authors = authors
+
+    @classmethod
+    def _fromStore(cls, id: str, title: str, owner: str, place: str, date: str|None, authors: list[Person]|None, authorsLoader: _BatchLoader|None = None):
+        # authors is None when they are resolved lazily, through authorsLoader.get(id)
+        obj = cls.__new__(cls)
+        obj.id = id
+        obj.title = title
+        obj.owner = _intern(owner)
+        obj.place = _intern(place)
+        obj.date = date
+        obj.authors = authors
+        obj._authorsLoader = authorsLoader
+        return obj
         
     def getTitle(self):
         return self.title
@@ -68,39 +146,44 @@ class CulturalHeritageObject(IdentifiableEntity):
         return None
     
     def getAuthors(self):
+        if self._authorsLoader is not None:
+            self.authors = self._authorsLoader.get(self.id) or []
+            self._authorsLoader = None
         return self.authors
         
 class NauticalChart(CulturalHeritageObject):
-    pass
+    __slots__ = ()
 
 class ManuscriptPlate(CulturalHeritageObject):
-    pass
+    __slots__ = ()
 
 class ManuscriptVolume(CulturalHeritageObject):
-    pass
+    __slots__ = ()
 
 class PrintedVolume(CulturalHeritageObject):
-    pass
+    __slots__ = ()
 
 class PrintedMaterial(CulturalHeritageObject):
-    pass
+    __slots__ = ()
 
 class Herbarium(CulturalHeritageObject):
-    pass
+    __slots__ = ()
 
 class Specimen(CulturalHeritageObject):
-    pass
+    __slots__ = ()
 
 class Painting(CulturalHeritageObject):
-    pass
+    __slots__ = ()
 
 class Model(CulturalHeritageObject):
-    pass
+    __slots__ = ()
 
 class Map(CulturalHeritageObject):
-    pass
+    __slots__ = ()
 
 class Activity(object):
+    __slots__ = ('object', 'institute', 'person', 'start', 'end', 'tool', '_objectLoader')
+
     def __init__(self,
                  object: CulturalHeritageObject,
                  institute: str,
@@ -131,6 +214,20 @@ class Activity(object):
         self.person = person
         self.start = start
         self.end = end
+        self._objectLoader = None
+
+    @classmethod
+    def _fromStore(cls, object: CulturalHeritageObject|str, institute: str, person: str|None, start: str|None, end: str|None, tool: list[str], objectLoader: _BatchLoader|None = None):
+        # object is the id of the object when it is resolved lazily, through objectLoader.get(object)
+        activity = cls.__new__(cls)
+        activity.object = object
+        activity.institute = _intern(institute)
+        activity.person = _intern(person)
+        activity.start = start
+        activity.end = end
+        activity.tool = [_intern(t) for t in tool]
+        activity._objectLoader = objectLoader
+        return activity
 
     def getResponsibleInstitute(self):
         return self.institute
@@ -154,9 +251,14 @@ class Activity(object):
         return self.tool
     
     def refersTo(self):
+        if self._objectLoader is not None:
+            self.object = self._objectLoader.get(self.object)
+            self._objectLoader = None
         return self.object
 
 class Acquisition(Activity):
+    __slots__ = ('technique',)
+
     def __init__(self,
                  object: CulturalHeritageObject,
                  institute: str,
@@ -170,25 +272,656 @@ class Acquisition(Activity):
             raise ValueError("Acquisition.technique must be a string")
         
         self.technique = technique
+
+    @classmethod
+    def _fromStore(cls, object: CulturalHeritageObject|str, institute: str, person: str|None, start: str|None, end: str|None, tool: list[str], objectLoader: _BatchLoader|None = None, technique: str = ""):
+        activity = super()._fromStore(object, institute, person, start, end, tool, objectLoader)
+        activity.technique = _intern(technique)
+        return activity
         
     def getTechnique(self):
         return self.technique
 
 class Processing(Activity):
-    pass
+    __slots__ = ()
 
 class Modelling(Activity):
-    pass
+    __slots__ = ()
 
 class Optimising(Activity):
-    pass
+    __slots__ = ()
 
 class Exporting(Activity):
-    pass
+    __slots__ = ()
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+# Type-dispatch tables used to build objects from the values stored in the databases
+_OBJECT_CLASSES = {'NauticalChart': NauticalChart, 'ManuscriptPlate': ManuscriptPlate, 'ManuscriptVolume': ManuscriptVolume,
+                   'PrintedVolume': PrintedVolume, 'PrintedMaterial': PrintedMaterial, 'Herbarium': Herbarium,
+                   'Specimen': Specimen, 'Painting': Painting, 'Model': Model, 'Map': Map}
+_ACTIVITY_CLASSES = {'acquisition': Acquisition, 'processing': Processing, 'modelling': Modelling,
+                     'optimising': Optimising, 'exporting': Exporting}
+
+def _dateColumn(dates: pd.Series) -> pd.Series:
+    # The dates of a SPARQL result as strings, NaN when not bound. The result of a query whose dates are all years
+    # is read as integers (or as floats when some are missing), the others as strings
+    return dates.apply(lambda x: str(int(x)) if pd.api.types.is_integer(x) or (isinstance(x, float) and x.is_integer()) else x)
+
+def _dateString(value) -> str|None:
+    # Dates come back from the CSV results of SPARQL queries as strings, numbers or NaN (when not bound)
+    if value is None or value == "" or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
  
+# CACHE
+
+class QueryCache(object):
+    # Every cache is registered here, so that upload handlers can invalidate the entries of the store they
+    # write to without knowing which query handlers are attached to which cache
+    instances = weakref.WeakSet()
+
+    def __init__(self, maxSize: int = 1024, ttl: float|None = None):
+        if not isinstance(maxSize, int) or maxSize <= 0:
+            raise ValueError("QueryCache.maxSize must be a positive integer")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("QueryCache.ttl must be a positive number or None")
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        QueryCache.instances.add(self)
+
+    def getHits(self):
+        return self.hits
+
+    def getMisses(self):
+        return self.misses
+
+    def getSize(self):
+        return len(self.entries)
+
+    def lookup(self, key):
+        # Return a (found, value) pair; expired entries are dropped on access
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def store(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, dbPathOrUrl: str|None = None) -> int:
+        # Drop all the entries, or only those computed against the given database
+        with self.lock:
+            if dbPathOrUrl is None:
+                removed = len(self.entries)
+                self.entries.clear()
+                return removed
+            store = _storeKey(dbPathOrUrl)
+            keys = [key for key in self.entries if key[0] == store]
+            for key in keys:
+                del self.entries[key]
+            return len(keys)
+
+    @classmethod
+    def invalidateStore(cls, dbPathOrUrl: str) -> int:
+        return sum(cache.invalidate(dbPathOrUrl) for cache in list(cls.instances))
+
+def _storeKey(dbPathOrUrl: str) -> str:
+    # URLs are kept as they are, while relative and absolute paths to the same database must produce the same key
+    if len(up.urlparse(dbPathOrUrl).scheme) and len(up.urlparse(dbPathOrUrl).netloc):
+        return dbPathOrUrl.rstrip('/')
+    return os.path.abspath(dbPathOrUrl)
+
+def _cacheArgument(value):
+    if isinstance(value, (list, tuple, set, pd.Series)):
+        return tuple(str(v) for v in value)
+    return value
+
+def _cachedQuery(method):
+    # Serve the result of a query method from the cache attached to the handler, if any. DataFrames are copied
+    # in both directions, so callers can modify the returned frames without corrupting the cache
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache = self.getCache()
+        if cache is None:
+            return method(self, *args, **kwargs)
+
+        key = (_storeKey(self.getDbPathOrUrl()), method.__qualname__,
+               tuple(_cacheArgument(a) for a in args), tuple(sorted((k, _cacheArgument(v)) for k, v in kwargs.items())))
+        found, value = cache.lookup(key)
+        if found:
+            return value.copy()
+
+        value = method(self, *args, **kwargs)
+        if isinstance(value, pd.DataFrame):
+            cache.store(key, value.copy())
+        return value
+    return wrapper
+
+# INSTRUMENTATION
+
+# Listeners registered here receive a dict when every backend round-trip (a SPARQL query or update, a SQLite read, a
+# Parquet scan) and every public mashup method starts and ends. The end events add the duration, the number of rows
+# (or of returned items), the error if any and, for mashup methods, the number of round-trips made during the call.
+# With no listener registered the hooks only check an empty tuple.
+class Instrumentation(object):
+    listeners = ()
+    lock = threading.Lock()
+    calls = count(1)
+
+    @classmethod
+    def addListener(cls, listener) -> bool:
+        if not callable(listener):
+            return False
+        with cls.lock:
+            cls.listeners = cls.listeners + (listener,)
+        return True
+
+    @classmethod
+    def removeListener(cls, listener) -> bool:
+        with cls.lock:
+            if listener not in cls.listeners:
+                return False
+            cls.listeners = tuple(other for other in cls.listeners if other != listener)
+        return True
+
+    @classmethod
+    def cleanListeners(cls) -> bool:
+        with cls.lock:
+            cls.listeners = ()
+        return True
+
+    @classmethod
+    def emit(cls, event: dict):
+        for listener in cls.listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print("An error occurred in an instrumentation listener:", e)
+
+class _CallFrame(object):
+    __slots__ = ('callId', 'name', 'roundTrips')
+
+    def __init__(self, name: str):
+        self.callId = next(Instrumentation.calls)
+        self.name = name
+        self.roundTrips = 0
+
+# The mashup whose public method is running in the current context, if any. Every top-level call collects the
+# errors of the handlers in a list of its own, kept in its context (a thread, or an asyncio task) after it returns:
+# concurrent calls on the same mashup, from several threads or gathered on an event loop, do not reset each other's
+# errors. The list of the last call started anywhere is the mashup's handlerErrors.
+_MASHUP_CALL = contextvars.ContextVar("_MASHUP_CALL", default=None)
+_HANDLER_ERRORS = contextvars.ContextVar("_HANDLER_ERRORS", default=None)
+
+def _enterMashup(mashup):
+    if _MASHUP_CALL.get() is mashup:
+        return None
+    mashup.handlerErrors = []
+    _HANDLER_ERRORS.set((weakref.ref(mashup), mashup.handlerErrors))
+    return _MASHUP_CALL.set(mashup)
+
+def _exitMashup(token):
+    if token is not None:
+        _MASHUP_CALL.reset(token)
+
+# The mashup calls in progress in the current context, outermost first. BasicMashup._collect copies the context into
+# its worker threads, so the round-trips made there are counted as well.
+_CALL_STACK = contextvars.ContextVar("_CALL_STACK", default=())
+
+def _queryHash(query) -> str|None:
+    return hashlib.sha1(str(query).encode("utf-8")).hexdigest()[:16] if query is not None else None
+
+def _traced(kind: str, backend: str, query, function, *args, **kwargs):
+    # Run one backend round-trip, announcing it to the listeners
+    if not Instrumentation.listeners:
+        return function(*args, **kwargs)
+
+    stack = _CALL_STACK.get()
+    with Instrumentation.lock:
+        for frame in stack:
+            frame.roundTrips += 1
+    event = {"event": "start", "kind": kind, "name": kind, "backend": _storeKey(backend), "queryHash": _queryHash(query),
+             "callId": stack[0].callId if stack else None, "call": stack[0].name if stack else None, "time": time.time()}
+    Instrumentation.emit(event)
+    start = time.perf_counter()
+    result, error = None, None
+    try:
+        result = function(*args, **kwargs)
+        return result
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        Instrumentation.emit(dict(event, event="end", seconds=time.perf_counter() - start, error=error,
+                                  rows=len(result) if hasattr(result, "__len__") else None))
+
+def _beginCall(mashup, method) -> tuple:
+    frame = _CallFrame(f"{type(mashup).__name__}.{method.__name__}")
+    stack = _CALL_STACK.get()
+    token = _CALL_STACK.set(stack + (frame,))
+    event = {"event": "start", "kind": "mashup", "name": frame.name, "backend": None, "queryHash": None,
+             "callId": frame.callId, "call": stack[0].name if stack else frame.name, "depth": len(stack),
+             "time": time.time()}
+    Instrumentation.emit(event)
+    return frame, token, event, time.perf_counter()
+
+def _endCall(frame: _CallFrame, token, event: dict, start: float, result, error: Exception|None, rows: int|None = None):
+    _CALL_STACK.reset(token)
+    if rows is None and hasattr(result, "__len__"):
+        rows = len(result)
+    Instrumentation.emit(dict(event, event="end", seconds=time.perf_counter() - start, error=error, rows=rows,
+                              roundTrips=frame.roundTrips))
+
+def _tracedMethod(method):
+    # Announce the calls to a public mashup method, with the round-trips they made, for the synchronous methods and
+    # for the coroutines of the async mashups alike
+    if asyncio.iscoroutinefunction(method):
+        @wraps(method)
+        async def coroutineWrapper(self, *args, **kwargs):
+            mashup_token = _enterMashup(self)
+            try:
+                if not Instrumentation.listeners:
+                    return await method(self, *args, **kwargs)
+
+                frame, token, event, start = _beginCall(self, method)
+                result, error = None, None
+                try:
+                    result = await method(self, *args, **kwargs)
+                    return result
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    _endCall(frame, token, event, start, result, error)
+            finally:
+                _exitMashup(mashup_token)
+        return coroutineWrapper
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        mashup_token = _enterMashup(self)
+        try:
+            if not Instrumentation.listeners:
+                return method(self, *args, **kwargs)
+
+            frame, token, event, start = _beginCall(self, method)
+            result, error = None, None
+            try:
+                result = method(self, *args, **kwargs)
+                return result
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                _endCall(frame, token, event, start, result, error)
+        finally:
+            _exitMashup(mashup_token)
+    return wrapper
+
+def _tracedIterator(method):
+    # The iter* methods return generators, whose call starts when the first item is requested and ends when they are
+    # exhausted or closed; the end event counts the items yielded. Every step runs in a context of its own call, so
+    # that its round-trips are counted in it whichever context consumes the generator
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        items = method(self, *args, **kwargs)
+        if inspect.isasyncgen(items):
+            return _tracedAsyncItems(self, method, items)
+        return _tracedItems(self, method, items)
+    return wrapper
+
+def _beginItems(mashup, method) -> tuple:
+    return _enterMashup(mashup), _beginCall(mashup, method) if Instrumentation.listeners else None
+
+def _endItems(state: tuple, rows: int, error: Exception|None):
+    mashup_token, call = state
+    if call is not None:
+        _endCall(*call, None, error, rows)
+    _exitMashup(mashup_token)
+
+def _tracedItems(mashup, method, items):
+    context = contextvars.copy_context()
+    state = context.run(_beginItems, mashup, method)
+    rows, error = 0, None
+    try:
+        while True:
+            try:
+                item = context.run(next, items)
+            except StopIteration:
+                return
+            rows += 1
+            yield item
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        context.run(items.close)
+        context.run(_endItems, state, rows, error)
+
+async def _nextItem(items):
+    return await items.__anext__()
+
+async def _tracedAsyncItems(mashup, method, items):
+    # The steps run as tasks created in the context of the call, which they copy
+    context = contextvars.copy_context()
+    state = context.run(_beginItems, mashup, method)
+    rows, error = 0, None
+    try:
+        while True:
+            try:
+                item = await context.run(asyncio.ensure_future, _nextItem(items))
+            except StopAsyncIteration:
+                return
+            rows += 1
+            yield item
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        await items.aclose()
+        context.run(_endItems, state, rows, error)
+
+class QueryStats(object):
+    # A listener aggregating the end events: p50/p95 latency of every mashup method and backend, and the round-trips
+    # made by each top-level mashup call
+    def __init__(self):
+        self.durations = {}
+        self.roundTrips = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, event: dict):
+        if event["event"] != "end":
+            return
+        name = event["name"] if event["kind"] == "mashup" else f'{event["kind"]} {event["backend"]}'
+        with self.lock:
+            self.durations.setdefault(name, []).append(event["seconds"])
+            if event["error"] is not None:
+                self.errors[name] = self.errors.get(name, 0) + 1
+            if event["kind"] == "mashup" and not event["depth"]:
+                self.roundTrips.setdefault(name, []).append(event["roundTrips"])
+
+    def getReport(self) -> dict:
+        with self.lock:
+            report = {}
+            for name, durations in self.durations.items():
+                durations = sorted(durations)
+                report[name] = {"calls": len(durations), "p50": _percentile(durations, 0.5),
+                                "p95": _percentile(durations, 0.95), "max": durations[-1],
+                                "errors": self.errors.get(name, 0)}
+                if name in self.roundTrips:
+                    trips = self.roundTrips[name]
+                    report[name]["roundTripsPerCall"] = sum(trips) / len(trips)
+                    report[name]["maxRoundTrips"] = max(trips)
+            return report
+
+    def reset(self) -> bool:
+        with self.lock:
+            self.durations, self.roundTrips, self.errors = {}, {}, {}
+        return True
+
+def _percentile(values: list, fraction: float):
+    # Nearest-rank percentile of sorted values
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+# SPARQL CLIENT
+
+class SparqlClient(object):
+    # The HTTP client of one SPARQL endpoint, shared by all the handlers of the process. Connections are kept alive
+    # and reused, at most maxConnections requests are in flight at the same time, and responses may be gzip-compressed.
+    # Results are asked as CSV, which pandas parses with its C reader straight into typed columns (the same frames
+    # sparql_dataframe produced), while JSON or TSV results would need every RDF term to be unwrapped in Python.
+    clients = {}
+    lock = threading.Lock()
+
+    def __init__(self, url: str, maxConnections: int = 8, timeout: float|None = None):
+        parsed = up.urlsplit(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ValueError(f"{url} is not the URL of a SPARQL endpoint")
+        self.url = url
+        self.secure = parsed.scheme == "https"
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+        self.maxConnections = maxConnections
+        self.timeout = timeout
+        self.idle = []
+        self.active = 0
+        self.requests = 0
+        self.connections = 0
+        self.condition = threading.Condition()
+
+    @classmethod
+    def forEndpoint(cls, url: str) -> 'SparqlClient':
+        key = _storeKey(url)
+        with cls.lock:
+            client = cls.clients.get(key)
+            if client is None:
+                client = cls.clients[key] = cls(url)
+            return client
+
+    @classmethod
+    def closeAll(cls) -> bool:
+        with cls.lock:
+            clients, cls.clients = list(cls.clients.values()), {}
+        for client in clients:
+            client.close()
+        return True
+
+    def getMaxConnections(self):
+        return self.maxConnections
+
+    def setMaxConnections(self, maxConnections: int) -> bool:
+        if not isinstance(maxConnections, int) or maxConnections < 1:
+            return False
+        with self.condition:
+            self.maxConnections = maxConnections
+            self.condition.notify_all()
+        return True
+
+    def getTimeout(self):
+        return self.timeout
+
+    def setTimeout(self, timeout: float|None) -> bool:
+        if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+            return False
+        self.timeout = timeout
+        return True
+
+    def close(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for con in idle:
+            con.close()
+
+    def _acquire(self) -> tuple[http.client.HTTPConnection, bool]:
+        # An idle connection if there is one, a new one otherwise; the flag tells whether the connection was reused
+        with self.condition:
+            while self.active >= self.maxConnections:
+                self.condition.wait()
+            self.active += 1
+            if self.idle:
+                return self.idle.pop(), True
+        # A connection that cannot be opened gives its slot back, or enough failures would block every later request
+        try:
+            return self._connect(), False
+        except Exception:
+            self._release(None)
+            raise
+
+    def _release(self, con: http.client.HTTPConnection|None):
+        with self.condition:
+            self.active -= 1
+            if con is not None:
+                self.idle.append(con)
+            self.condition.notify()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        with self.condition:
+            self.connections += 1
+        connection_class = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+        con = connection_class(self.host, self.port, timeout=self.timeout)
+        # Requests are small and sent in one write: waiting to coalesce them (Nagle) would only add latency
+        con.connect()
+        con.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return con
+
+    def _post(self, con: http.client.HTTPConnection, query: str) -> tuple[int, bytes, bool]:
+        con.request("POST", self.path, body=query.encode("utf-8"),
+                    headers={"Content-Type": "application/sparql-query", "Accept": "text/csv",
+                             "Accept-Encoding": "gzip", "Connection": "keep-alive"})
+        response = con.getresponse()
+        body = response.read()
+        if response.getheader("Content-Encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        return response.status, body, response.will_close
+
+    def select(self, query: str) -> pd.DataFrame:
+        con = None
+        try:
+            con, reused = self._acquire()
+            try:
+                status, body, will_close = self._post(con, query)
+            except (http.client.HTTPException, ConnectionError):
+                # The endpoint may have closed a connection while it was idle: queries are safe to send again
+                con.close()
+                if not reused:
+                    raise
+                con = self._connect()
+                status, body, will_close = self._post(con, query)
+        except Exception:
+            # Without a connection, _acquire has already given the slot back
+            if con is not None:
+                con.close()
+                self._release(None)
+            raise
+        if will_close:
+            con.close()
+            con = None
+        self._release(con)
+        with self.condition:
+            self.requests += 1
+
+        if status != 200:
+            raise ValueError(f"The SPARQL endpoint answered {status}: {body[:500].decode('utf-8', 'replace')}")
+        return pd.read_csv(io.BytesIO(body), sep=",")
+
+# GRAPH BACKENDS
+
+# Besides a SPARQL endpoint, the graph database can be a local RDF file. The file is parsed once into an in-memory,
+# indexed rdflib graph, shared by all the handlers of the process and parsed again only when the file changes on
+# disk. Queries and updates then run in-process, without any HTTP round-trip.
+_GRAPH_FORMATS = {"ttl": "turtle", "nt": "nt", "n3": "n3", "rdf": "xml", "owl": "xml", "jsonld": "json-ld"}
+_LOCAL_GRAPHS = {}
+_LOCAL_GRAPHS_LOCK = threading.Lock()
+
+def _graphFormat(dbPathOrUrl: str) -> str|None:
+    # The rdflib format of a local RDF file, or None for URLs and other paths
+    if len(up.urlparse(dbPathOrUrl).scheme) and len(up.urlparse(dbPathOrUrl).netloc):
+        return None
+    return _GRAPH_FORMATS.get(os.path.splitext(dbPathOrUrl)[1][1:].lower())
+
+def _localGraph(path: str) -> Graph:
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    with _LOCAL_GRAPHS_LOCK:
+        cached = _LOCAL_GRAPHS.get(path)
+        if cached is None or cached[0] != mtime:
+            graph = Graph()
+            if mtime is not None:
+                graph.parse(path, format=_graphFormat(path))
+            cached = _LOCAL_GRAPHS[path] = (mtime, graph)
+        return cached[1]
+
+def _saveLocalGraph(path: str, graph: Graph):
+    path = os.path.abspath(path)
+    graph.serialize(path + ".tmp", format=_graphFormat(path))
+    os.replace(path + ".tmp", path)
+    with _LOCAL_GRAPHS_LOCK:
+        _LOCAL_GRAPHS[path] = (os.path.getmtime(path), graph)
+
+def _sparqlSelect(dbPathOrUrl: str, query: str) -> pd.DataFrame:
+    # Runs a SELECT query against a SPARQL endpoint or a local RDF file. Local results go through the same CSV
+    # serialisation as the endpoint's, so the dataframes have the same columns and types either way
+    if _graphFormat(dbPathOrUrl):
+        return _traced("sparql", dbPathOrUrl, query, _localSelect, dbPathOrUrl, query)
+    return _traced("sparql", dbPathOrUrl, query, SparqlClient.forEndpoint(dbPathOrUrl).select, query)
+
+def _localSelect(path: str, query: str) -> pd.DataFrame:
+    result = _localGraph(path).query(query)
+    return pd.read_csv(io.BytesIO(result.serialize(format='csv')), sep=",")
+
+_DATA_OPERATION = re.compile(r"(INSERT|DELETE) DATA \{\n(.*)\n\}", re.S)
+
+def _applyUpdate(graph: Graph, update: str):
+    # rdflib's SPARQL Update parser is very slow on large requests, so INSERT DATA and DELETE DATA operations made of
+    # N-Triples statements, which is what MetadataUploadHandler sends, are read with the N-Triples parser instead
+    operations = [_DATA_OPERATION.fullmatch(operation.strip()) for operation in update.split("\n;\n")]
+    if all(operations):
+        for operation in operations:
+            triples = Graph().parse(data=operation.group(2), format="nt")
+            if operation.group(1) == "INSERT":
+                graph += triples
+            else:
+                graph -= triples
+    else:
+        graph.update(update)
+
+class _LocalGraphStore(object):
+    # The part of SPARQLUpdateStore used by MetadataUploadHandler, for a local RDF file. Updates are applied to the
+    # shared graph on commit, and the file is written once, when the store is closed
+    def __init__(self, path: str, autocommit: bool = True):
+        self.path = path
+        self.graph = _localGraph(path)
+        self.autocommit = autocommit
+        self.pending = []
+        self.changed = False
+
+    def query(self, query: str):
+        return self.graph.query(query)
+
+    def update(self, update: str):
+        self.pending.append(update)
+        if self.autocommit:
+            self.commit()
+
+    def commit(self):
+        for update in self.pending:
+            _applyUpdate(self.graph, update)
+        self.changed = self.changed or bool(self.pending)
+        self.pending = []
+
+    def close(self):
+        if self.changed:
+            _saveLocalGraph(self.path, self.graph)
+
 # HANDLERS
 
 class Handler(object):
+    # Besides .db paths and URLs, the local files a handler can use, as functions telling whether a path is one:
+    # local RDF files for the metadata handlers, Parquet snapshots for ProcessDataQueryHandler
+    localStores = ()
+
     def __init__(self):
         self.dbPathOrUrl = ""
     def getDbPathOrUrl(self):
@@ -200,105 +933,510 @@ class Handler(object):
         elif len(up.urlparse(newpath).scheme) and len(up.urlparse(newpath).netloc):
             self.dbPathOrUrl = newpath
             return True
+        elif any(isStore(newpath) for isStore in self.localStores):
+            self.dbPathOrUrl = newpath
+            return True
         return False
 
 class UploadHandler(Handler):
     def __init__(self):
         super().__init__()
+        self.lastReport = {}
+    def getLastReport(self) -> dict:
+        # Figures about the last call to pushDataToDb, such as the number of rows written and the throughput
+        return self.lastReport
     def pushDataToDb(self):
         pass
 
+# The five activity tables of the relational database, with the fields each activity has in the JSON file
+_ACTIVITY_FIELDS = {
+    'acquisition': ['responsible institute', 'responsible person', 'technique', 'tool', 'start date', 'end date'],
+    'processing': ['responsible institute', 'responsible person', 'tool', 'start date', 'end date'],
+    'modelling': ['responsible institute', 'responsible person', 'tool', 'start date', 'end date'],
+    'optimising': ['responsible institute', 'responsible person', 'tool', 'start date', 'end date'],
+    'exporting': ['responsible institute', 'responsible person', 'tool', 'start date', 'end date'],
+}
+
+def _createActivityTables(con: sq.Connection, unique: bool = False):
+    # Every table has its internal id as primary key and is indexed on objectId and on the dates, so that lookups by
+    # object and the date range filters of ProcessDataQueryHandler do not scan the whole table. The indexes are also
+    # added to databases created before the tables had them. With unique, the objectId index is a unique one, which
+    # the upserts of ProcessDataUploadHandler need as conflict target.
+    # The dates are also stored as days since 1970-01-01 (NULL when empty), indexed together for time-frame queries.
+    con.create_function("epochDay", 1, _epochDay, deterministic=True)
+    for table, fields in _ACTIVITY_FIELDS.items():
+        columns = ", ".join(f'"{field}" TEXT' for field in fields)
+        con.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ("{table}Id" TEXT PRIMARY KEY, {columns}, "objectId" INTEGER, '
+                    f'"rowHash" TEXT, "startDay" INTEGER, "endDay" INTEGER)')
+        table_info = list(con.execute(f'PRAGMA table_info("{table}")'))
+        if not any(column[5] for column in table_info):
+            # Tables created without the primary key get an index on the internal id instead
+            con.execute(f'CREATE INDEX IF NOT EXISTS "{table}_{table}Id" ON "{table}" ("{table}Id")')
+        if "rowHash" not in [column[1] for column in table_info]:
+            con.execute(f'ALTER TABLE "{table}" ADD COLUMN "rowHash" TEXT')
+        if "startDay" not in [column[1] for column in table_info]:
+            con.execute(f'ALTER TABLE "{table}" ADD COLUMN "startDay" INTEGER')
+            con.execute(f'ALTER TABLE "{table}" ADD COLUMN "endDay" INTEGER')
+            con.execute(f'UPDATE "{table}" SET "startDay" = epochDay("start date"), "endDay" = epochDay("end date")')
+        is_unique = any(index[1] == f"{table}_objectId" and index[2] for index in con.execute(f'PRAGMA index_list("{table}")'))
+        if unique and not is_unique:
+            con.execute(f'DROP INDEX IF EXISTS "{table}_objectId"')
+            con.execute(f'CREATE UNIQUE INDEX "{table}_objectId" ON "{table}" ("objectId")')
+        con.execute(f'CREATE INDEX IF NOT EXISTS "{table}_objectId" ON "{table}" ("objectId")')
+        con.execute(f'CREATE INDEX IF NOT EXISTS "{table}_start_date" ON "{table}" ("start date")')
+        con.execute(f'CREATE INDEX IF NOT EXISTS "{table}_end_date" ON "{table}" ("end date")')
+        con.execute(f'CREATE INDEX IF NOT EXISTS "{table}_days" ON "{table}" ("startDay", "endDay")')
+
+# Full-text side index over the fields searched by partial name. The trigram tokenizer lets SQLite answer
+# LIKE '%x%' patterns of at least three characters from the index, with the same semantics as on the tables.
+# The other columns returned by the queries are stored (not indexed) too, so that lookups never go back to
+# the five tables.
+_SEARCH_COLUMNS = {'institute': '"responsible institute"', 'person': '"responsible person"', 'tool': 'tool', 'technique': 'technique'}
+
+def _hasSearchIndex(con: sq.Connection) -> bool:
+    return con.execute("SELECT 1 FROM sqlite_master WHERE name = 'activity_search'").fetchone() is not None
+
+def _searchKey(table: str, row: str) -> str:
+    # The index row of an activity is numbered after its internal id ('acquisition-N' is 5 * N + 0, 'processing-N' is
+    # 5 * N + 1...), so that the triggers find the index row of an updated or deleted activity directly
+    position = list(_ACTIVITY_FIELDS).index(table)
+    return f'CAST(substr({row}."{table}Id", {len(table) + 2}) AS INTEGER) * {len(_ACTIVITY_FIELDS)} + {position}'
+
+def _searchValues(table: str, row: str) -> str:
+    technique = f'{row}.technique' if table == 'acquisition' else 'NULL'
+    return (f'{_searchKey(table, row)}, {row}."{table}Id", {row}."responsible institute", {row}."responsible person", '
+            f'{row}.tool, {technique}, {row}."start date", {row}."end date", {row}.objectId')
+
+def _createSearchIndex(con: sq.Connection) -> bool:
+    # The index is filled with the rows already stored, then triggers keep it in sync with the five tables
+    if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'exporting_search_delete'").fetchone():
+        return True
+    try:
+        con.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS activity_search USING fts5(activityId UNINDEXED, institute, person, tool,
+                       technique, startDate UNINDEXED, endDate UNINDEXED, objectId UNINDEXED, tokenize='trigram')""")
+    except sq.OperationalError as e:
+        # This SQLite build has no FTS5 or no trigram tokenizer: the queries keep using LIKE on the tables
+        print(f"The search index could not be created: {e}")
+        return False
+    # An index created without the triggers is filled again, with the numbering they expect
+    con.execute("DELETE FROM activity_search")
+    columns = "rowid, activityId, institute, person, tool, technique, startDate, endDate, objectId"
+    for table in _ACTIVITY_FIELDS:
+        con.execute(f'INSERT INTO activity_search ({columns}) SELECT {_searchValues(table, table)} FROM "{table}"')
+        con.execute(f"""CREATE TRIGGER IF NOT EXISTS "{table}_search_insert" AFTER INSERT ON "{table}" BEGIN
+                            INSERT INTO activity_search ({columns}) VALUES ({_searchValues(table, "new")});
+                        END""")
+        con.execute(f"""CREATE TRIGGER IF NOT EXISTS "{table}_search_update" AFTER UPDATE ON "{table}" BEGIN
+                            DELETE FROM activity_search WHERE rowid = {_searchKey(table, "old")};
+                            INSERT INTO activity_search ({columns}) VALUES ({_searchValues(table, "new")});
+                        END""")
+        con.execute(f"""CREATE TRIGGER IF NOT EXISTS "{table}_search_delete" AFTER DELETE ON "{table}" BEGIN
+                            DELETE FROM activity_search WHERE rowid = {_searchKey(table, "old")};
+                        END""")
+    return True
+
+def _iterJsonArray(path: str, blockSize: int = 1 << 20):
+    # Yield the elements of the top-level JSON array contained in a file one at a time, reading at most
+    # blockSize characters at once, so that memory does not depend on the size of the file
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r'\s*')
+    with open(path, mode='r', encoding='utf-8') as f:
+        buffer = f.read(blockSize)
+        pos = whitespace.match(buffer).end()
+        # The whitespace before the array may be longer than a block
+        while pos == len(buffer) and buffer:
+            buffer = f.read(blockSize)
+            pos = whitespace.match(buffer).end()
+        if buffer[pos:pos + 1] != '[':
+            raise ValueError(f"{path} does not contain a JSON array")
+        pos += 1
+        expect_element = True
+        empty = True
+        eof = False
+
+        while True:
+            pos = whitespace.match(buffer, pos).end()
+            if pos == len(buffer):
+                if eof:
+                    raise ValueError(f"{path} ends before the end of the JSON array")
+                buffer = f.read(blockSize)
+                eof = not buffer
+                pos = 0
+                continue
+
+            if buffer[pos] == ']' and (empty or not expect_element):
+                return
+            if not expect_element:
+                if buffer[pos] != ',':
+                    raise ValueError(f"{path} contains an invalid JSON array")
+                pos += 1
+                expect_element = True
+                continue
+
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+                # A value is only complete once the character following it has been read: until then a number may
+                # go on in the next block ('1' of '1.5e10'), as may one that stops on a character that can extend it
+                # ('1' of '1.' + '5e10')
+                following = whitespace.match(buffer, end).end()
+                truncated = following == len(buffer) or (
+                    isinstance(element, (int, float)) and not isinstance(element, bool) and buffer[end] in '.eE+-0123456789')
+                if truncated and not eof:
+                    raise json.JSONDecodeError("Truncated value", buffer, end)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                block = f.read(blockSize)
+                eof = not block
+                buffer = buffer[pos:] + block
+                pos = 0
+                continue
+
+            yield element
+            pos = end
+            expect_element = False
+            empty = False
+
+def _iterChunks(iterable, size: int):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
 class ProcessDataUploadHandler(UploadHandler):
     def __init__(self):
         super().__init__()
+        self.searchIndex = False
+        # In upsert mode the activities of objects already in the database are updated when their content changed,
+        # instead of being skipped. Each table then has a unique index on objectId, used as conflict target
+        self.upsert = False
+        # With writeAheadLog, the upload switches the database file to the WAL journal, so that readers do not block
+        # the writer and the other way around. The switch is permanent (it is a property of the file) and SQLite
+        # keeps the -wal and -shm files next to it, so the journal mode is left alone unless this is enabled
+        self.writeAheadLog = False
+
+    def setSearchIndex(self, enabled: bool) -> bool:
+        # When enabled, pushDataToDb creates (and fills with the rows already stored) the full-text index used by
+        # ProcessDataQueryHandler for partial-name lookups. An index that already exists is always kept up to date.
+        if not isinstance(enabled, bool):
+            return False
+        self.searchIndex = enabled
+        return True
 
-    def pushDataToDb(self, path: str):
+    def setUpsert(self, enabled: bool) -> bool:
+        if not isinstance(enabled, bool):
+            return False
+        self.upsert = enabled
+        return True
+
+    def setWriteAheadLog(self, enabled: bool) -> bool:
+        if not isinstance(enabled, bool):
+            return False
+        self.writeAheadLog = enabled
+        return True
+
+    def pushDataToDb(self, path: str, chunkSize: int|None = None):
+        # By default the whole JSON file is loaded at once. With chunkSize, the JSON array is parsed incrementally
+        # and normalised chunkSize records at a time, so memory stays bounded whatever the size of the file.
+        # Either way, all the rows are written in a single transaction.
         try:
-            length_activity = 0
-            try:
-                with sq.connect(self.getDbPathOrUrl()) as con:
-                    q1= "SELECT * FROM acquisition;" 
-                    q2 = "SELECT objectId FROM acquisition;"
-                    q1_table = pd.read_sql(q1, con)
-                    q2_list = pd.read_sql(q2, con)['objectId'].tolist()
-                    length_activity = len(q1_table)
-            except:
-                pass
-
-            # Create one dataframe from json file
-            activities = pd.read_json(path)
-            
-            # Create 5 dataframes for each activity from activities dataframe and store them in one dictionary
-            activities_column_names = activities.columns[1:].tolist()
-            objectId = activities['object id'].tolist()
-            json_dataframes = {}
-            for column_name in activities_column_names:
-                column = activities[column_name]
-                df = pd.DataFrame(column.tolist())
-                df = df.applymap(lambda x: None if x == '' or x == [] else x) # replace empty strings and empty lists with None
-                df = df.applymap(lambda x: ', '.join(x) if isinstance(x, list) else x) # replace lists with strings they contain
-                internalId = []
-                for idx, row in df.iterrows():
-                    internalId.append(f"{column_name}-" +str(idx+length_activity))
-                df.insert(0, f"{column_name}Id", pd.Series(internalId, dtype = "object"))
-                df.insert(len(df.columns), "objectId", pd.Series(objectId, dtype = "object"))
-                json_dataframes[column_name] = df
-            
-            # Solve data duplication problem. 5 dataframes created at this point are compared
-            # with 5 dataframes (derived from 5 tables contained in DB). Comparison are made across all columns except the first
-            # 1) Check if there are some data in DB 2) If yes, create 5 dataframes from 5 tables of DB 3) Compare 5 current dataframes
-            # with 5 DB dataframes, leave 5 dfs with unique data
-            if length_activity:
-                result_dfs = {}
-                for df_name, df_json in json_dataframes.items():
-
-                    # Perform row-wise comparison and filter out rows from df_1 that are not in df_0
-                    filtered_df_1 = df_json[~df_json['objectId'].isin(q2_list)]
-
-                    # Add the filtered dataframe to the result_dfs dictionary
-                    result_dfs[df_name] = filtered_df_1
-            
-            # Upload 5 dataframes to database
+            start_time = time.perf_counter()
+
             with sq.connect(self.getDbPathOrUrl()) as con:
-                if length_activity:
-                    for key in result_dfs.keys():
-                        result_dfs[key].to_sql(f"{key}", con, if_exists="append", index=False)
+                if self.writeAheadLog:
+                    con.execute("PRAGMA journal_mode = WAL")
+                # Schema changes and rows are written in the same transaction
+                con.execute("BEGIN")
+                _createActivityTables(con, unique=self.upsert)
+                if self.searchIndex or _hasSearchIndex(con):
+                    _createSearchIndex(con)
+                search_index = _hasSearchIndex(con)
+
+                # The internal ids ('acquisition-N') of new activities continue after the ones already used. Without
+                # upsert, the activities of objects that are already in the database are not added again
+                next_activity = con.execute('SELECT MAX(CAST(substr(acquisitionId, 13) AS INTEGER)) + 1 FROM acquisition').fetchone()[0] or 0
+                existing_objects = set() if self.upsert else {str(row[0]) for row in con.execute("SELECT objectId FROM acquisition")}
+                counts_before = {table: con.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in _ACTIVITY_FIELDS}
+
+                if chunkSize:
+                    chunks = _iterChunks(_iterJsonArray(path), chunkSize)
                 else:
-                    for key in json_dataframes.keys():
-                        json_dataframes[key].to_sql(f"{key}", con, if_exists="append", index=False)       
+                    with open(path, mode='r', encoding='utf-8') as f:
+                        chunks = [json.load(f)]
+
+                statements = {}
+                for table, fields in _ACTIVITY_FIELDS.items():
+                    columns = ", ".join(f'"{column}"' for column in [f"{table}Id"] + fields + ["objectId", "rowHash", "startDay", "endDay"])
+                    placeholders = ", ".join("?" * (len(fields) + 5))
+                    statements[table] = f'INSERT INTO "{table}" ({columns}) VALUES ({placeholders})'
+                    if self.upsert:
+                        # Rows whose hash did not change are left untouched
+                        updates = ", ".join(f'"{column}" = excluded."{column}"' for column in fields + ["rowHash", "startDay", "endDay"])
+                        statements[table] += (f' ON CONFLICT ("objectId") DO UPDATE SET {updates}'
+                                              f' WHERE "{table}"."rowHash" IS NOT excluded."rowHash"')
+
+                records = 0
+                rows = 0
+                skipped = 0
+                for chunk in chunks:
+                    table_rows = {table: [] for table in _ACTIVITY_FIELDS}
+                    for idx, record in enumerate(chunk, start=records):
+                        object_id = record["object id"]
+                        if str(object_id) in existing_objects:
+                            skipped += len(_ACTIVITY_FIELDS)
+                            continue
+                        for table, fields in _ACTIVITY_FIELDS.items():
+                            activity = record.get(table) or {}
+                            values = [_activityValue(activity.get(field)) for field in fields]
+                            start, end = values[fields.index('start date')], values[fields.index('end date')]
+                            table_rows[table].append((f"{table}-{idx + next_activity}", *values, object_id, _rowHash(values),
+                                                      _epochDay(start), _epochDay(end)))
+                    records += len(chunk)
+
+                    for table, values in table_rows.items():
+                        rows += con.executemany(statements[table], values).rowcount
+
+                inserted = sum(con.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] - count
+                               for table, count in counts_before.items())
+
+            seconds = time.perf_counter() - start_time
+            self.lastReport = {"records": records, "rows": rows, "inserted": inserted, "updated": rows - inserted,
+                               "unchanged": records * len(_ACTIVITY_FIELDS) - rows - skipped, "skipped": skipped,
+                               "seconds": seconds, "rowsPerSecond": rows / seconds if seconds else None,
+                               "searchIndex": search_index}
             return True
-            
 
         except Exception as e:
             print(str(e))
             return False
+        finally:
+            # Cached query results computed against this database may be stale now
+            QueryCache.invalidateStore(self.getDbPathOrUrl())
+
+_EPOCH = date(1970, 1, 1).toordinal()
+
+def _epochDay(value: str|None) -> int|None:
+    # The days since 1970-01-01 of an ISO date ('YYYY-MM-DD', possibly followed by a time), None if empty or malformed
+    try:
+        return date.fromisoformat(value[:10]).toordinal() - _EPOCH
+    except (TypeError, ValueError):
+        return None
+
+def _rowHash(values: list) -> str:
+    return hashlib.sha1(json.dumps(values).encode('utf-8')).hexdigest()
+
+def _activityValue(value):
+    # Empty strings and empty lists are stored as NULL, lists as the strings they contain joined by ', '
+    if value == '' or value == []:
+        return None
+    if isinstance(value, list):
+        return ', '.join(value)
+    return value
+
+_NT_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n", "\r": "\\r"})
+
+def _ntTerm(term) -> str:
+    # The N-Triples form of a term, which is also valid in SPARQL. Unlike term.n3(), literals are always written on
+    # one line, so that each statement takes exactly one line
+    if isinstance(term, Literal):
+        text = '"' + str(term).translate(_NT_ESCAPES) + '"'
+        if term.language:
+            return f"{text}@{term.language}"
+        if term.datatype:
+            return f"{text}^^<{term.datatype}>"
+        return text
+    return term.n3()
+
+def _ntStatements(triples, batchSize: int):
+    # Serialises the triples as N-Triples statements, in blocks of batchSize lines
+    for chunk in _iterChunks(triples, batchSize):
+        yield "\n".join(f"{_ntTerm(s)} {_ntTerm(p)} {_ntTerm(o)} ." for s, p, o in chunk)
+
+def _dataUpdate(statements: str, operation: str = "INSERT DATA") -> str:
+    return f"{operation} {{\n{statements}\n}}"
+
+def _dataUpdates(triples, batchSize: int, operation: str = "INSERT DATA"):
+    # batchSize N-Triples statements in each INSERT DATA (or DELETE DATA) update
+    for statements in _ntStatements(triples, batchSize):
+        yield _dataUpdate(statements, operation)
+
+def _plainTriple(triple):
+    # Stores may return plain literals typed as xsd:string. They are the same literals as the ones we upload
+    s, p, o = triple
+    if isinstance(o, Literal) and o.datatype == XSD.string:
+        o = Literal(str(o))
+    return (s, p, o)
+
+def _contentHash(texts: pd.Series) -> pd.Series:
+    return texts.map(lambda text: hashlib.sha1(text.encode('utf-8')).hexdigest())
+
+def _objectHashes(meta_df: pd.DataFrame) -> pd.Series:
+    # The content hash of each row of the metadata CSV, i.e. of a cultural heritage object and its authors
+    return _contentHash(meta_df.astype(str).apply(lambda column: column.str.strip()).agg('\x1f'.join, axis=1))
+
+def _nextNumber(entities: pd.Series, prefix: str) -> int:
+    # The first free N for new entities named prefix + N
+    numbers = entities[entities.str.startswith(prefix)].str[len(prefix):]
+    numbers = pd.to_numeric(numbers, errors='coerce').dropna()
+    return int(numbers.max()) + 1 if len(numbers) else 0
+
+# Namespaces of the graph database
+_METADATA_NS = {
+    "Classes": "https://github.com/Sergpoipoip/DHDK_DS-project/classes/",
+    "Attributes": "https://github.com/Sergpoipoip/DHDK_DS-project/attributes/",
+    "Relations": "https://github.com/Sergpoipoip/DHDK_DS-project/relations/",
+    "Entities": "https://github.com/Sergpoipoip/DHDK_DS-project/entities/",
+}
+_PREDICATES = {key: URIRef(_METADATA_NS["Attributes"] + key) for key in ['id', 'title', 'date', 'owner', 'place', 'name', 'hash']}
+_AUTHOR = URIRef(_METADATA_NS["Relations"] + "author")
+_PERSON = URIRef(_METADATA_NS["Classes"] + "Person")
+
+# An author in the 'Author' column, e.g. "Benincasa, Grazioso (ULAN:500114874)". Authors are separated by ';'
+_AUTHOR_PATTERN = re.compile(r"(?:^|;)\s*(?P<name>[^();]+?)\s*\((?P<id>[^;]*?)\)")
+
+def _metadataTriples(meta_df: pd.DataFrame, subjects: pd.Series, authors_df: pd.DataFrame,
+                     person_subjects: dict, people_df: pd.DataFrame, hashes: pd.Series|None = None):
+    # The triples of the persons in people_df (columns id, name and subject) and of the cultural heritage objects in
+    # meta_df, whose subjects are in the series aligned with it. authors_df holds the id of each author of each object,
+    # indexed by the object's row, and person_subjects gives the subject of every author. With hashes, the content
+    # hash of each object and, in people_df['hash'], of each person is included as well
+    for person_id, person_name, subject in zip(people_df['id'], people_df['name'], people_df['subject']):
+        yield (subject, RDF.type, _PERSON)
+        yield (subject, _PREDICATES['id'], Literal(person_id))
+        yield (subject, _PREDICATES['name'], Literal(person_name))
+
+    type_classes = {object_type: URIRef(_METADATA_NS["Classes"] + ''.join(word.capitalize() for word in object_type.lower().split()))
+                    for object_type in meta_df['Type'].unique()}
+    for subject, object_type in zip(subjects, meta_df['Type']):
+        yield (subject, RDF.type, type_classes[object_type])
+
+    # The attributes one column at a time
+    for column in meta_df.columns:
+        if column not in ['Type', 'Author']:
+            predicate = _PREDICATES[column.lower()]
+            filled = meta_df[column].astype(bool)
+            for subject, value in zip(subjects[filled], meta_df[column][filled]):
+                yield (subject, predicate, Literal(str(value).strip()))
+
+    for subject, person_id in zip(subjects[authors_df.index], authors_df['id']):
+        yield (subject, _AUTHOR, person_subjects[person_id])
+
+    if hashes is not None:
+        for subject, value in chain(zip(subjects, hashes), zip(people_df['subject'], people_df['hash'])):
+            yield (subject, _PREDICATES['hash'], Literal(value))
+
+def _addMetadata(graph: Graph, *args, **kwargs):
+    for triple in _metadataTriples(*args, **kwargs):
+        graph.add(triple)
+
+def _objectSubjects(meta_df: pd.DataFrame, firstNumber: int) -> pd.Series:
+    # The subjects of the objects in the rows of meta_df, culturalObject-N with N = firstNumber + the row's index
+    entities = _METADATA_NS["Entities"]
+    return pd.Series([URIRef(entities + f"culturalObject-{idx + firstNumber}") for idx in meta_df.index],
+                     index=meta_df.index, dtype=object)
+
+def _metadataStatements(meta_df: pd.DataFrame, firstNumber: int, authors_df: pd.DataFrame, person_subjects: dict,
+                        people_df: pd.DataFrame, batchSize: int) -> tuple[list[str], int]:
+    # Runs in the worker processes of a parallel upload, on a range of rows of the CSV. All the subjects are known in
+    # advance, so the ranges are independent: the triples are serialised as blocks of batchSize N-Triples statements,
+    # returned with their number. A triple may only repeat within a row, so removing the repetitions of the range is
+    # enough for the statements of all the ranges to be the ones of the whole graph
+    triples = list(dict.fromkeys(_metadataTriples(meta_df, _objectSubjects(meta_df, firstNumber), authors_df,
+                                                  person_subjects, people_df)))
+    return list(_ntStatements(triples, batchSize)), len(triples)
+
+def _parseAuthors(authors: pd.Series) -> pd.DataFrame:
+    # Parses the 'Author' column in one pass. Each match is an author of the object in that row, in order, with the
+    # name before the parentheses and the id inside them
+    return authors.str.extractall(_AUTHOR_PATTERN).reset_index(level='match', drop=True).reindex(columns=['name', 'id'])
 
 class MetadataUploadHandler(UploadHandler):
+    localStores = (_graphFormat,)
+
     def __init__(self):
         super().__init__()
+        # The graph is sent to the endpoint as INSERT DATA updates of batchSize triples each. With singleTransaction,
+        # all the updates go in one request, which the endpoint applies atomically
+        self.batchSize = 10000
+        self.singleTransaction = False
+        # In upsert mode objects and persons are matched to the ones in the database by their ids, and only the
+        # triples of the ones whose content hash changed are sent, as DELETE DATA and INSERT DATA updates. Graph_db.ttl
+        # only records the plain uploads
+        self.upsert = False
+        # With workers > 1 the triples of a plain upload are serialised by that many processes, each taking a range of
+        # rows of the CSV, and sent as they come. Upserts are always computed in this process
+        self.workers = 1
+
+    def getBatchSize(self):
+        return self.batchSize
+
+    def setBatchSize(self, batchSize: int):
+        if not isinstance(batchSize, int) or isinstance(batchSize, bool) or batchSize < 1:
+            return False
+        self.batchSize = batchSize
+        return True
+
+    def setSingleTransaction(self, enabled: bool):
+        if not isinstance(enabled, bool):
+            return False
+        self.singleTransaction = enabled
+        return True
+
+    def setUpsert(self, enabled: bool):
+        if not isinstance(enabled, bool):
+            return False
+        self.upsert = enabled
+        return True
+
+    def getWorkers(self):
+        return self.workers
+
+    def setWorkers(self, workers: int):
+        if not isinstance(workers, int) or isinstance(workers, bool) or workers < 1:
+            return False
+        self.workers = workers
+        return True
+
+    def _sendUpdates(self, store: SPARQLUpdateStore|_LocalGraphStore, updates) -> dict:
+        # In a single transaction the updates are only sent, all together, by the commit
+        batches = 0
+        for update in updates:
+            if self.singleTransaction:
+                store.update(update)
+            else:
+                _traced("sparql update", self.getDbPathOrUrl(), update, store.update, update)
+            batches += 1
+        if self.singleTransaction and batches:
+            _traced("sparql update", self.getDbPathOrUrl(), None, store.commit)
+        store.close()
+        return {"batches": batches, "requests": 1 if self.singleTransaction and batches else batches}
+
+    def _openStore(self) -> SPARQLUpdateStore|_LocalGraphStore:
+        endpoint = self.getDbPathOrUrl()
+        if _graphFormat(endpoint):
+            return _LocalGraphStore(endpoint, autocommit=not self.singleTransaction)
+        store = SPARQLUpdateStore(autocommit=not self.singleTransaction)
+        store.open((endpoint, endpoint))
+        return store
     
     def pushDataToDb(self, path: str):
         try:
             my_graph = Graph()
             
             # Define namespaces
-            ns_dict = {
-                "Classes": "https://github.com/Sergpoipoip/DHDK_DS-project/classes/",
-                "Attributes": "https://github.com/Sergpoipoip/DHDK_DS-project/attributes/",
-                "Relations": "https://github.com/Sergpoipoip/DHDK_DS-project/relations/",
-                "Entities": "https://github.com/Sergpoipoip/DHDK_DS-project/entities/",
-            }
+            ns_dict = _METADATA_NS
 
             for prefix, uri in ns_dict.items():
                 my_graph.bind(prefix, Namespace(uri))
 
-            predicates = {key: URIRef(ns_dict["Attributes"] + key) for key in ['id', 'title', 'date', 'owner', 'place', 'name']}
-            author = URIRef(ns_dict["Relations"] + "author")
-            Person = URIRef(ns_dict["Classes"] + "Person")
-
             # Create a dataframe based on a provided csv file
             meta_df = pd.read_csv(path, keep_default_na=False)
 
+            if self.upsert:
+                return self._pushChangesToDb(meta_df)
+
             # Here we solve a problem with populating RDF DB that already contains some data. In order to populate it correctly
             # with new data we need to create correct indexes of Entities:culturalObject- and Entities:person-. To do this we
             # need to find out the total number of culturalObjects and persons already contained in the RDF DB. So, we build
@@ -324,7 +1462,7 @@ class MetadataUploadHandler(UploadHandler):
                                             }
                                         }
                                     '''
-            df_res = get(endpoint, query_to_find_total_number_of_culturalObjects_and_persons, True)
+            df_res = _sparqlSelect(endpoint, query_to_find_total_number_of_culturalObjects_and_persons)
             
             ids_of_meta_df = meta_df['Id'].astype(int).tolist()
             if all(num > df_res['culturalObjectCount'][0] for num in ids_of_meta_df):
@@ -344,106 +1482,43 @@ class MetadataUploadHandler(UploadHandler):
                             Attributes:id ?id .
                         }
                         """
-                df_with_all_people_from_db = get(endpoint, query_to_get_all_people, True)
+                df_with_all_people_from_db = _sparqlSelect(endpoint, query_to_get_all_people)
 
                 # Create a dictionary where keys are ids of authors contained in DB and values are Entities:person-
                 index_dict = df_with_all_people_from_db.set_index('id')['entity'].to_dict()
-                
-                filter_list = sorted(list(index_dict.keys()))
-                
-                # Split the 'Author' column by ';' and expand it into separate rows
-                authors_expanded = meta_df['Author'].str.split('; ', expand=True)
 
-                rows = []
+                authors_df = _parseAuthors(meta_df['Author'])
 
-                # Iterate over the columns of the expanded DataFrame
-                for col in authors_expanded.columns:
-                    # Extract the author name and ID from each column and append to the 'rows' list
-                    author_id_split = authors_expanded[col].str.split('(', expand=True)
-                    author_id_split.columns = ['Author', 'Author_ID']
-                    author_id_split['Author_ID'] = author_id_split['Author_ID'].str[:-1]
-                    rows.extend(author_id_split.values.tolist())
-
-                # Create a new DataFrame from the 'rows' list
-                new_df = pd.DataFrame(rows, columns=['Author', 'Author_ID'])
-
-                # Drop rows with NaN values
-                new_df.dropna(inplace=True)
-                new_df.drop_duplicates(ignore_index=True)
-                
-                # Create a DataFrame with all the persons from csv file that are not present in RDF DB
-                filtered_df = new_df[~new_df['Author_ID'].isin(filter_list)]
-            
-
-                # Add all the persons to the graph
-                object_id_author = {}
-                ids_of_unique_authors = {}
+                # Add to the graph only the persons that are not already in the DB, numbered in order of appearance
+                new_people = authors_df[~authors_df['id'].isin(set(index_dict))].drop_duplicates('id')
                 author_id = df_res['personCount'][0]
+                new_people = new_people.assign(subject=[URIRef(ns_dict["Entities"] + f'person-{author_id + k}')
+                                                        for k in range(len(new_people))])
+                person_subjects = {person_id: URIRef(subject) for person_id, subject in index_dict.items()}
+                person_subjects.update(zip(new_people['id'], new_people['subject']))
+
+                # The report times building the triples as well as sending them, which overlap in a parallel upload
+                culturalObject_id = int(df_res['culturalObjectCount'][0])
+                start_time = time.perf_counter()
+                if self.workers > 1:
+                    triples, sent = self._pushInParallel(meta_df, culturalObject_id, authors_df, person_subjects, new_people)
+                else:
+                    # Add all the cultural heritage objects to the graph
+                    subjects = _objectSubjects(meta_df, culturalObject_id)
+                    _addMetadata(my_graph, meta_df, subjects, authors_df, person_subjects, new_people)
 
-                for _, row in meta_df.iterrows():
-                    if row['Author']:
-                        pattern_id = r'\((.*?)\)' # regex pattern to match the substring within parentheses, i.e. the id part
-                        pattern_name = r'^([^()]+)'
-                        authors = [s.strip() for s in row['Author'].split(";")]
-
-                        for author_str in authors:
-                            match_id = re.search(pattern_id, author_str)
-                            match_name = re.search(pattern_name, author_str)
-
-                            if match_id and match_name:
-                                person_id = match_id.group(1)
-                                person_name = match_name.group(1).strip()
-                                object_id = row['Id']
-
-                                if person_id not in ids_of_unique_authors and person_id in filtered_df['Author_ID'].tolist():
-                                    subject = URIRef(ns_dict["Entities"] + f'person-{author_id}')
-                                    author_id += 1
-
-                                    my_graph.add((subject, RDF.type, Person))
-                                    my_graph.add((subject, predicates['id'], Literal(person_id)))
-                                    my_graph.add((subject, predicates['name'], Literal(person_name)))
-                                    ids_of_unique_authors[person_id] = subject
-
-                                if person_id in list(ids_of_unique_authors.keys()):
-                                    subject = ids_of_unique_authors[person_id]
-                                else:
-                                    subject = URIRef(index_dict[person_id])
-                                object_id_author.setdefault(object_id, []).append(subject)
-                
-                # Add all the cultural heritage objects to the graph
-                author_id = 0
-                culturalObject_id = df_res['culturalObjectCount'][0]
-
-                for idx, row in meta_df.iterrows():
-                    subject = URIRef(ns_dict["Entities"] + f"culturalObject-{idx+culturalObject_id}")
-
-                    object_type = ''.join(word.capitalize() for word in row['Type'].lower().split())
-                    my_graph.add((subject, RDF.type, URIRef(ns_dict["Classes"] + object_type)))
-
-                    for column in meta_df.columns:
-                        if column not in ['Type', 'Author'] and row[column]:
-                            predicate = column.lower()
-                            my_graph.add((subject, predicates[predicate], Literal(str(row[column]).strip())))
-
-                    if row['Author']:
-                        author_id += 1
-                        for person in object_id_author.get(row['Id'], []):
-                            my_graph.add((subject, author, person))
-                
-
-                # Update the RDF database
-                store = SPARQLUpdateStore()
-                endpoint = self.getDbPathOrUrl()
-
-                store.open((endpoint, endpoint))
+                    # Update the RDF database
+                    sent = self._sendUpdates(self._openStore(), _dataUpdates(my_graph.triples((None, None, None)), self.batchSize))
+                    triples = len(my_graph)
 
-                for triple in my_graph.triples((None, None, None)):
-                    store.add(triple)
-                store.close()
+                seconds = time.perf_counter() - start_time
+                self.lastReport = {"triples": triples, **sent,
+                                   "seconds": seconds, "triplesPerSecond": triples / seconds if seconds else None}
 
-                # Serialize the RDF graph in order to make human-readable its content
-                with open('Graph_db.ttl', mode='a', encoding='utf-8') as f:
-                    f.write(my_graph.serialize(format='turtle'))
+                # Serialize the RDF graph in order to make human-readable its content. A local RDF file already is
+                if self.workers == 1 and not _graphFormat(self.getDbPathOrUrl()):
+                    with open('Graph_db.ttl', mode='a', encoding='utf-8') as f:
+                        f.write(my_graph.serialize(format='turtle'))
 
                 return True
             
@@ -452,15 +1527,153 @@ class MetadataUploadHandler(UploadHandler):
         except Exception as e:
             print(str(e))
             return False
+        finally:
+            # Cached query results computed against this database may be stale now
+            QueryCache.invalidateStore(self.getDbPathOrUrl())
+
+    def _pushInParallel(self, meta_df: pd.DataFrame, firstNumber: int, authors_df: pd.DataFrame, person_subjects: dict,
+                        people_df: pd.DataFrame) -> tuple[int, dict]:
+        # The rows are split in ranges, a few per worker so that the first updates are sent early and a slow range
+        # does not keep the other workers idle. The ranges are handed out in order and their statements sent as soon as
+        # each range is done; the new persons go with the first range. Graph_db.ttl gets the statements as N-Triples,
+        # which are also Turtle. As in the serial upload, they are only written there once all of them have been sent:
+        # meanwhile they are kept in a temporary file, which a failed upload discards
+        ranges = min(len(meta_df), self.workers * 4) or 1
+        bounds = [len(meta_df) * k // ranges for k in range(ranges + 1)]
+        parts = [meta_df.iloc[bounds[k]:bounds[k + 1]] for k in range(ranges)]
+        authors = [authors_df[authors_df.index.isin(part.index)] for part in parts]
+        subjects = [{person_id: person_subjects[person_id] for person_id in part['id'].unique()} for part in authors]
+        people = [people_df if k == 0 else people_df.iloc[:0] for k in range(ranges)]
+        counts = []
+
+        def updates(results, log):
+            for statements, triples in results:
+                counts.append(triples)
+                for block in statements:
+                    if log:
+                        log.write(block + "\n")
+                    yield _dataUpdate(block)
+
+        log = None if _graphFormat(self.getDbPathOrUrl()) else tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = executor.map(_metadataStatements, parts, [firstNumber] * ranges, authors, subjects, people,
+                                       [self.batchSize] * ranges)
+                sent = self._sendUpdates(self._openStore(), updates(results, log))
+            if log:
+                log.seek(0)
+                with open('Graph_db.ttl', mode='a', encoding='utf-8') as f:
+                    shutil.copyfileobj(log, f)
+        finally:
+            if log:
+                log.close()
+        return sum(counts), sent
+
+    def _pushChangesToDb(self, meta_df: pd.DataFrame):
+        start_time = time.perf_counter()
+        endpoint = self.getDbPathOrUrl()
+        entities = _METADATA_NS["Entities"]
+
+        # The ids and content hashes of all the objects and persons already in the DB
+        query = """
+                PREFIX Attributes: <https://github.com/Sergpoipoip/DHDK_DS-project/attributes/>
+
+                SELECT ?entity ?id ?hash
+                WHERE {
+                    ?entity Attributes:id ?id .
+                    OPTIONAL {
+                        ?entity Attributes:hash ?hash .
+                    }
+                }
+                """
+        existing = _sparqlSelect(endpoint, query)
+        existing = existing.astype({'entity': str, 'id': str}).fillna({'hash': ''})
+        is_person = existing['entity'].str.startswith(entities + 'person-')
+        objects_db, people_db = existing[~is_person], existing[is_person]
+
+        # The objects whose id is new or whose content changed
+        hashes = _objectHashes(meta_df)
+        stored_hashes = dict(zip(objects_db['id'], objects_db['hash']))
+        ids = meta_df['Id'].astype(str)
+        changed = ids.map(stored_hashes) != hashes
+        changed_df = meta_df[changed]
+
+        object_entities = dict(zip(objects_db['id'], objects_db['entity']))
+        next_object = _nextNumber(objects_db['entity'], entities + 'culturalObject-')
+        subjects = []
+        for object_id in ids[changed]:
+            if object_id in object_entities:
+                subjects.append(URIRef(object_entities[object_id]))
+            else:
+                subjects.append(URIRef(entities + f"culturalObject-{next_object}"))
+                next_object += 1
+        subjects = pd.Series(subjects, index=changed_df.index, dtype=object)
+
+        # The authors of those objects whose id is new or whose name changed
+        authors_df = _parseAuthors(changed_df['Author'])
+        people_df = authors_df.drop_duplicates('id')
+        people_df = people_df.assign(hash=_contentHash(people_df['name']))
+        stored_hashes = dict(zip(people_db['id'], people_db['hash']))
+        people_df = people_df[people_df['id'].map(stored_hashes) != people_df['hash']]
+
+        person_subjects = {person_id: URIRef(entity) for person_id, entity in zip(people_db['id'], people_db['entity'])}
+        next_person = _nextNumber(people_db['entity'], entities + 'person-')
+        people_subjects = []
+        for person_id in people_df['id']:
+            if person_id not in person_subjects:
+                person_subjects[person_id] = URIRef(entities + f'person-{next_person}')
+                next_person += 1
+            people_subjects.append(person_subjects[person_id])
+        people_df = people_df.assign(subject=pd.Series(people_subjects, index=people_df.index, dtype=object))
+
+        desired = Graph()
+        _addMetadata(desired, changed_df, subjects, authors_df, person_subjects, people_df, hashes[changed])
+        desired = set(desired)
+
+        # Compare with the triples the changed objects and persons have now, and send only the difference
+        store = self._openStore()
+        known = set(object_entities.values()) | set(people_db['entity'])
+        current = set()
+        for chunk in _iterChunks([subject for subject in chain(subjects, people_df['subject']) if str(subject) in known], 500):
+            query = "SELECT ?s ?p ?o WHERE { VALUES ?s { %s } ?s ?p ?o }" % " ".join(_ntTerm(subject) for subject in chunk)
+            rows = _traced("sparql", self.getDbPathOrUrl(), query, lambda: list(store.query(query)))
+            current.update(_plainTriple(row) for row in rows)
+
+        deleted, inserted = current - desired, desired - current
+        sent = self._sendUpdates(store, chain(_dataUpdates(deleted, self.batchSize, "DELETE DATA"),
+                                              _dataUpdates(inserted, self.batchSize, "INSERT DATA")))
+
+        seconds = time.perf_counter() - start_time
+        triples = len(deleted) + len(inserted)
+        self.lastReport = {"objects": len(meta_df), "changedObjects": len(changed_df),
+                           "unchangedObjects": len(meta_df) - len(changed_df), "changedPeople": len(people_df),
+                           "inserted": len(inserted), "deleted": len(deleted), "triples": triples, **sent,
+                           "seconds": seconds, "triplesPerSecond": triples / seconds if seconds else None}
+        return True
+
+def _valuesBlock(values) -> str:
+    # Render a list of strings as the content of a SPARQL VALUES block of plain literals
+    return " ".join('"%s"' % str(v).replace('\\', '\\\\').replace('"', '\\"') for v in values)
 
 class QueryHandler(Handler):
     def __init__(self):
         super().__init__()
+        self.cache = None
+
+    def getCache(self):
+        return self.cache
+
+    def setCache(self, cache: QueryCache|None) -> bool:
+        if cache is not None and not isinstance(cache, QueryCache):
+            return False
+        self.cache = cache
+        return True
 
+    @_cachedQuery
     def getById(self, Id: str):
         db_path = self.getDbPathOrUrl()
 
-        if not len(up.urlparse(db_path).scheme) and not len(up.urlparse(db_path).netloc):
+        if not len(up.urlparse(db_path).scheme) and not len(up.urlparse(db_path).netloc) and not _graphFormat(db_path):
             return pd.DataFrame()
         
         else:
@@ -502,7 +1715,7 @@ class QueryHandler(Handler):
                         """ % Id
 
             try:
-                df = get(endpoint, query, True)
+                df = _sparqlSelect(endpoint, query)
 
                 if len(df):
                     columns_to_process = ['entity'] if len(df.columns) == 3 else ['entity', 'type', 'author']
@@ -517,148 +1730,437 @@ class QueryHandler(Handler):
                 print(f"trying to reconnect via local connection at http://127.0.0.1:9999/blazegraph/sparql")
                 try:
                     endpoint = "http://127.0.0.1:9999/blazegraph/sparql"
-                    df = get(endpoint, query, True)
+                    df = _sparqlSelect(endpoint, query)
                 except Exception as e2:
                     print(f"couldn't connect to blazegraph due to the following error: {e2}")
                     return None
             
         return df.drop_duplicates()
     
+@lru_cache(maxsize=None)
+def _activitiesQuery(condition: str|None, orderBy: bool, tables: tuple|None = None) -> str:
+    # The union of the five activity tables, optionally filtered by a condition on named parameters. The text of
+    # each query is built once, so that SQLite can reuse the statements it has already prepared on a connection.
+    union_query_parts = []
+    for table in tables or _ACTIVITY_FIELDS:
+        technique = 'technique' if table == 'acquisition' else 'NULL AS technique'
+        union_query_parts.append(f"""
+            SELECT "{table}Id" AS activityId, "responsible institute", "responsible person", tool, "start date", "end date", objectId, {technique}
+            FROM "{table}"
+            {"WHERE " + condition if condition else ""}
+        """)
+    query = '\nUNION ALL\n'.join(union_query_parts)
+    if orderBy:
+        # Sorting outside of the union keeps SQLite from scanning the objectId indexes instead of using the
+        # indexes matching the condition
+        query = f"SELECT * FROM ({query}) ORDER BY objectId"
+    return query
+
+@lru_cache(maxsize=None)
+def _activitiesStreamQuery(condition: str|None, tables: tuple|None = None) -> str:
+    # Sorting the compound select itself, and not a subquery of it, lets SQLite merge the objectId index scans of the
+    # tables, so that the first rows are returned without sorting all the others first
+    return _activitiesQuery(condition, False, tables) + "\nORDER BY objectId"
+
+@lru_cache(maxsize=None)
+def _acquisitionsQuery(condition: str) -> str:
+    return f"""
+        SELECT acquisitionId, "responsible institute", "responsible person", technique, tool, "start date", "end date", objectId
+        FROM acquisition
+        WHERE {condition}
+        ORDER BY objectId
+    """
+
+@lru_cache(maxsize=None)
+def _searchQuery(column: str, acquisitions: bool) -> str:
+    # The same columns as _activitiesQuery (or _acquisitionsQuery), read from the full-text index only
+    if acquisitions:
+        columns = 'activityId AS acquisitionId, institute AS "responsible institute", person AS "responsible person", technique, tool'
+    else:
+        columns = 'activityId, institute AS "responsible institute", person AS "responsible person", tool'
+    columns += ', startDate AS "start date", endDate AS "end date", objectId'
+    if not acquisitions:
+        columns += ', technique'
+    return f"""
+        SELECT {columns}
+        FROM activity_search
+        WHERE {column} LIKE :pattern
+        ORDER BY objectId
+    """
+
+# PARQUET SNAPSHOTS
+
+# The process data can be exported to a Parquet dataset, i.e. a directory whose name ends in '.parquet', partitioned
+# by activity type and start year (type=acquisition/year=2023/...). ProcessDataQueryHandler answers the same methods
+# from such a dataset: the partitions and the filters are pushed down to the Parquet reader, so that only the row
+# groups that can match are read, files are memory-mapped, and the columns become a DataFrame as a whole.
+# SQLite keeps the object ids that are not integers as text: a snapshot stores the integer ids in the int64 objectId
+# column and the others in objectText, and puts them back together in a single objectId column when it is read.
+_PARQUET_COLUMNS = ['activityId', 'responsible institute', 'responsible person', 'tool', 'start date', 'end date', 'objectId', 'technique']
+_PARQUET_READ_COLUMNS = _PARQUET_COLUMNS + ['objectText']
+_PARQUET_FIELDS = {'institute': 'responsible institute', 'person': 'responsible person', 'tool': 'tool', 'technique': 'technique'}
+_PARQUET_DATASETS = {}
+
+def _isParquet(path: str) -> bool:
+    return os.path.splitext(path.rstrip('/\\'))[1].lower() == '.parquet'
+
+def _parquetPartitioning():
+    return ds.partitioning(pa.schema([('type', pa.string()), ('year', pa.int32())]), flavor='hive')
+
+def _parquetSchema():
+    columns = [(column, pa.int64() if column == 'objectId' else pa.string()) for column in _PARQUET_READ_COLUMNS]
+    return pa.schema(columns + [('startDay', pa.int32()), ('endDay', pa.int32()), ('type', pa.string()), ('year', pa.int32())])
+
+def _parquetBatches(con: sq.Connection, batchSize: int):
+    # The rows of the five tables, sorted by objectId within each table, with the partition columns
+    for table in _ACTIVITY_FIELDS:
+        technique = 'technique' if table == 'acquisition' else 'NULL'
+        query = f"""
+            SELECT "{table}Id" AS activityId, "responsible institute", "responsible person", tool, "start date", "end date",
+                   CASE WHEN typeof(objectId) = 'integer' THEN objectId END AS objectId, {technique} AS technique,
+                   CASE WHEN typeof(objectId) != 'integer' THEN CAST(objectId AS TEXT) END AS objectText, epochDay("start date") AS startDay, epochDay("end date") AS endDay,
+                   '{table}' AS type,
+                   CASE WHEN "start date" GLOB '[0-9][0-9][0-9][0-9]*' THEN CAST(substr("start date", 1, 4) AS INTEGER) END AS year
+            FROM "{table}"
+            ORDER BY objectId
+        """
+        for df in pd.read_sql(query, con, chunksize=batchSize):
+            yield pa.RecordBatch.from_pandas(df, schema=_parquetSchema(), preserve_index=False)
+
+def _parquetFrame(table) -> pd.DataFrame:
+    # The objectId column as SQLite returns it: integers, with the ids stored as text among them if there are any
+    df = table.to_pandas()
+    text = df.pop('objectText')
+    if text.notna().any():
+        df['objectId'] = df['objectId'].astype('Int64').astype(object).where(text.isna(), text)
+    return df
+
+def _likePattern(partialName: str) -> str:
+    # The LIKE pattern of the SQLite queries, for pc.match_like: % and _ are wildcards in both, but Arrow also reads
+    # a backslash as an escape, which SQLite does not
+    return '%' + partialName.replace('\\', '\\\\') + '%'
+
+def _acquisitionColumns(df: pd.DataFrame) -> pd.DataFrame:
+    # The columns of the acquisition table, as returned by getAcquisitionsByTechnique on SQLite
+    return df.rename(columns={'activityId': 'acquisitionId'})[
+        ['acquisitionId', 'responsible institute', 'responsible person', 'technique', 'tool', 'start date', 'end date', 'objectId']]
+
+def _validChunkSize(chunkSize) -> bool:
+    if isinstance(chunkSize, int) and chunkSize > 0:
+        return True
+    print("An error occurred: chunkSize must be a positive integer")
+    return False
+
+def _parquetDataset(path: str):
+    # Datasets are discovered once, and again when the snapshot is replaced
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    cached = _PARQUET_DATASETS.get(path)
+    if cached is None or cached[0] != mtime:
+        dataset = ds.dataset(path, format='parquet', partitioning=_parquetPartitioning(),
+                             filesystem=LocalFileSystem(use_mmap=True))
+        cached = _PARQUET_DATASETS[path] = (mtime, dataset)
+    return cached[1]
+
+# Read connections are opened read-only and tuned for repeated queries: a 64 MiB page cache and 256 MiB of
+# memory-mapped I/O. The journal mode is a property of the database file, switched to WAL by the upload handler
+# when asked with setWriteAheadLog.
+_READ_PRAGMAS = ("PRAGMA cache_size = -65536", "PRAGMA mmap_size = 268435456")
+
+def _openReadConnection(path: str):
+    # check_same_thread is disabled because a pooled connection can be used by different threads, one at a time
+    con = sq.connect(f"file:{up.quote(os.path.abspath(path))}?mode=ro", uri=True, check_same_thread=False)
+    for pragma in _READ_PRAGMAS:
+        con.execute(pragma)
+    con.create_function("epochDay", 1, _epochDay, deterministic=True)
+    return con
+
 class ProcessDataQueryHandler(QueryHandler):
+    localStores = (_isParquet,)
+
     def __init__(self):
         super().__init__()
-    
-    def getAllActivities(self):
+        # Idle read connections, kept open across calls. Each query checks one out for the thread that runs it and
+        # gives it back afterwards; at most poolSize idle connections are kept, the others are closed
+        self.poolSize = 4
+        self.pool = []
+        self.poolLock = threading.Lock()
+        self.poolGeneration = 0
+
+    def setDbPathOrUrl(self, newpath):
+        result = super().setDbPathOrUrl(newpath)
+        if result:
+            self.close()
+        return result
+
+    def getPoolSize(self):
+        return self.poolSize
+
+    def setPoolSize(self, poolSize: int):
+        if not isinstance(poolSize, int) or isinstance(poolSize, bool) or poolSize < 0:
+            return False
+        with self.poolLock:
+            self.poolSize = poolSize
+            extra, self.pool = self.pool[poolSize:], self.pool[:poolSize]
+        for con in extra:
+            con.close()
+        return True
+
+    def close(self):
+        # Closes the idle connections. Connections in use are closed as soon as they are given back
+        with self.poolLock:
+            idle, self.pool = self.pool, []
+            self.poolGeneration += 1
+        for con in idle:
+            con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @contextmanager
+    def _connection(self):
+        with self.poolLock:
+            con = self.pool.pop() if self.pool else None
+            generation = self.poolGeneration
+        if con is None:
+            con = _openReadConnection(self.getDbPathOrUrl())
         try:
-            with sq.connect(self.getDbPathOrUrl()) as con:
-                tables = ['acquisition', 'processing', 'modelling', 'optimising', 'exporting']
-                union_query_parts = []
-                y = 'NULL AS technique'
-                x = 'technique'
-                for table in tables:
-                    union_query_parts.append(f"""
-                        SELECT {table}Id AS activityId, "responsible institute", "responsible person", tool, "start date", "end date", objectId, {x if table == 'acquisition' else y} 
-                        FROM {table}
-                    """)
-                query = '\nUNION ALL\n'.join(union_query_parts)
-                query_table = pd.read_sql(query, con)
-                return query_table
+            yield con
+        finally:
+            with self.poolLock:
+                if generation == self.poolGeneration and len(self.pool) < self.poolSize:
+                    self.pool.append(con)
+                    con = None
+            if con is not None:
+                con.close()
+
+    def exportToParquet(self, path: str, batchSize: int = 100000) -> bool:
+        # Writes the five activity tables of the database to a Parquet dataset, replacing the one at path, if any
+        if pa is None:
+            print("The Parquet export needs the pyarrow package")
+            return False
+        if not _isParquet(path):
+            print(f"{path} is not a path ending in .parquet")
+            return False
+        path = path.rstrip('/\\')
+        temporary = path + ".tmp"
+        try:
+            shutil.rmtree(temporary, ignore_errors=True)
+            with self._connection() as con:
+                ds.write_dataset(_parquetBatches(con, batchSize), temporary, schema=_parquetSchema(), format='parquet',
+                                 partitioning=_parquetPartitioning())
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(temporary, path)
+            return True
         except Exception as e:
             print("An error occurred:", e)
-    
-    def getActivitiesByResponsibleInstitution(self, partialName: str):
+            shutil.rmtree(temporary, ignore_errors=True)
+            return False
+        finally:
+            QueryCache.invalidateStore(path)
+
+    # Every query has a streaming counterpart, iter*, which returns a generator of DataFrames of at most chunkSize rows
+    # instead of a whole DataFrame. The rows are fetched from the database as the generator is consumed, sorted by
+    # objectId when the database is SQLite, in the order of the partitions when it is a Parquet snapshot.
+
+    def _scanParquet(self, expression=None, orderBy: bool = True, acquisitions: bool = False, chunkSize: int|None = None):
+        if acquisitions:
+            expression = (ds.field('type') == 'acquisition') & expression
+        if chunkSize is not None:
+            return self._iterParquet(expression, acquisitions, chunkSize)
         try:
-            with sq.connect(self.getDbPathOrUrl()) as con:
-                tables = ['acquisition', 'processing', 'modelling', 'optimising', 'exporting']
-                union_query_parts = []
-                y = 'NULL AS technique'
-                x = 'technique'
-                for table in tables:
-                    union_query_parts.append(f"""
-                        SELECT {table}Id AS activityId, "responsible institute", "responsible person", tool, "start date", "end date", objectId, {x if table == 'acquisition' else y}
-                        FROM {table}
-                        WHERE "responsible institute" LIKE '%{partialName}%'
-                    """) 
-                query = '\nUNION ALL\n'.join(union_query_parts) + 'ORDER BY objectId'
-                query_table = pd.read_sql(query, con)
-                return query_table
+            table = _traced("parquet", self.getDbPathOrUrl(), expression,
+                            _parquetDataset(self.getDbPathOrUrl()).to_table, columns=_PARQUET_READ_COLUMNS, filter=expression)
+            if orderBy:
+                # The integer ids first, then the text ones, as SQLite sorts them
+                table = table.sort_by([('objectId', 'ascending'), ('objectText', 'ascending')])
+            df = _parquetFrame(table)
+            return _acquisitionColumns(df) if acquisitions else df
         except Exception as e:
             print("An error occurred:", e)
-    
-    def getActivitiesByResponsiblePerson(self, partialName: str):
+
+    def _iterParquet(self, expression, acquisitions: bool, chunkSize: int):
+        if not _validChunkSize(chunkSize):
+            return
         try:
-            with sq.connect(self.getDbPathOrUrl()) as con:
-                tables = ['acquisition', 'processing', 'modelling', 'optimising', 'exporting']
-                union_query_parts = []
-                y = 'NULL AS technique'
-                x = 'technique'
-                for table in tables:
-                    union_query_parts.append(f"""
-                        SELECT {table}Id AS activityId, "responsible institute", "responsible person", tool, "start date", "end date", objectId, {x if table == 'acquisition' else y} 
-                        FROM {table}
-                        WHERE "responsible person" LIKE '%{partialName}%'
-                    """)
-                query = '\nUNION ALL\n'.join(union_query_parts) + 'ORDER BY objectId'
-                query_table = pd.read_sql(query, con)
-                return query_table
+            batches = _parquetDataset(self.getDbPathOrUrl()).to_batches(columns=_PARQUET_READ_COLUMNS, filter=expression,
+                                                                         batch_size=chunkSize)
+            while (batch := _traced("parquet", self.getDbPathOrUrl(), expression, next, batches, None)) is not None:
+                if batch.num_rows:
+                    df = _parquetFrame(batch)
+                    yield _acquisitionColumns(df) if acquisitions else df
         except Exception as e:
             print("An error occurred:", e)
 
-    def getActivitiesUsingTool(self, partialName: str):
+    def _readSql(self, con: sq.Connection, query: str, parameters: dict|None = None) -> pd.DataFrame:
+        return _traced("sqlite", self.getDbPathOrUrl(), query, pd.read_sql, query, con, params=parameters)
+
+    def _iterSql(self, query: str, parameters: dict|None, chunkSize: int):
+        # The pooled connection is held until the generator is exhausted or closed
+        if not _validChunkSize(chunkSize):
+            return
         try:
-            with sq.connect(self.getDbPathOrUrl()) as con:
-                tables = ['acquisition', 'processing', 'modelling', 'optimising', 'exporting']
-                union_query_parts = []
-                y = 'NULL AS technique'
-                x = 'technique'
-                for table in tables:
-                    union_query_parts.append(f"""
-                        SELECT {table}Id AS activityId, "responsible institute", "responsible person", tool, "start date", "end date", objectId, {x if table == 'acquisition' else y} 
-                        FROM {table}
-                        WHERE "tool" LIKE '%{partialName}%'
-                    """)
-                query = '\nUNION ALL\n'.join(union_query_parts) + 'ORDER BY objectId'
-                query_table = pd.read_sql(query, con)
-                return query_table
+            with self._connection() as con:
+                # Each chunk read is a round-trip of its own
+                chunks = pd.read_sql(query, con, params=parameters, chunksize=chunkSize)
+                while (df := _traced("sqlite", self.getDbPathOrUrl(), query, next, chunks, None)) is not None:
+                    yield df
         except Exception as e:
             print("An error occurred:", e)
 
-    def getActivitiesStartedAfter(self, date: str):
+    def _selectActivities(self, condition: str|None = None, parameters: dict|None = None, orderBy: bool = True,
+                          tables: tuple|None = None, chunkSize: int|None = None):
+        if chunkSize is not None:
+            return self._iterSql(_activitiesStreamQuery(condition, tables), parameters, chunkSize)
         try:
-            with sq.connect(self.getDbPathOrUrl()) as con:
-                tables = ['acquisition', 'processing', 'modelling', 'optimising', 'exporting']
-                union_query_parts = []
-                y = 'NULL AS technique'
-                x = 'technique'
-                for table in tables:
-                    union_query_parts.append(f"""
-                        SELECT {table}Id AS activityId, "responsible institute", "responsible person", tool, "start date", "end date", objectId, {x if table == 'acquisition' else y} 
-                        FROM {table}
-                        WHERE "start date" >= '{date}'
-                    """)
-                query = '\nUNION ALL\n'.join(union_query_parts) + 'ORDER BY objectId'
-                query_table = pd.read_sql(query, con)
-                return query_table
+            with self._connection() as con:
+                return self._readSql(con, _activitiesQuery(condition, orderBy, tables), parameters)
         except Exception as e:
-            print ("An error occured:", e) 
-
-    def getActivitiesEndedBefore(self, date: str):
+            print("An error occurred:", e)
+    
+    @_cachedQuery
+    def getAllActivities(self):
+        if _isParquet(self.getDbPathOrUrl()):
+            return self._scanParquet(orderBy=False)
+        return self._selectActivities(orderBy=False)
+
+    def iterAllActivities(self, chunkSize: int = 10000):
+        # Sorted by objectId, so that the activities on the same object come together
+        if _isParquet(self.getDbPathOrUrl()):
+            return self._scanParquet(chunkSize=chunkSize)
+        return self._selectActivities(chunkSize=chunkSize)
+    
+    def _selectMatching(self, column: str, partialName: str, acquisitions: bool = False, chunkSize: int|None = None):
+        # Partial-name lookups are answered by the full-text index when the database has one and the pattern is long
+        # enough to be looked up by trigrams; otherwise they are LIKE filters on the tables. Streams always use the
+        # LIKE filters, which return their first rows without reading the whole index.
+        if _isParquet(self.getDbPathOrUrl()):
+            return self._scanParquet(pc.match_like(ds.field(_PARQUET_FIELDS[column]), _likePattern(partialName), ignore_case=True),
+                                     acquisitions=acquisitions, chunkSize=chunkSize)
+        parameters = {"pattern": f"%{partialName}%"}
+        condition = f'{_SEARCH_COLUMNS[column]} LIKE :pattern'
+        if chunkSize is not None:
+            query = _acquisitionsQuery(condition) if acquisitions else _activitiesStreamQuery(condition)
+            return self._iterSql(query, parameters, chunkSize)
         try:
-            with sq.connect (self.getDbPathOrUrl()) as con:
-                tables = ['acquisition', 'processing', 'modelling', 'optimising', 'exporting']
-                union_query_parts = []
-                y = 'NULL AS technique'
-                x = 'technique'
-                for table in tables:
-                    union_query_parts.append(f"""
-                        SELECT {table}Id AS activityId, "responsible institute", "responsible person", tool, "start date", "end date", objectId, {x if table == 'acquisition' else y} 
-                        FROM {table}
-                        WHERE "end date" <= '{date}'
-                    """)
-                query = '\nUNION ALL\n'.join(union_query_parts) + 'ORDER BY objectId'
-                query_table = pd.read_sql(query, con)
-                return query_table
+            with self._connection() as con:
+                if len(partialName) >= 3 and _hasSearchIndex(con):
+                    query = _searchQuery(column, acquisitions)
+                elif acquisitions:
+                    query = _acquisitionsQuery(condition)
+                else:
+                    query = _activitiesQuery(condition, True)
+                return self._readSql(con, query, parameters)
         except Exception as e:
-            print ("An error occured:", e) 
+            print("An error occurred:", e)
+
+    @_cachedQuery
+    def getActivitiesByResponsibleInstitution(self, partialName: str):
+        return self._selectMatching('institute', partialName)
+
+    def iterActivitiesByResponsibleInstitution(self, partialName: str, chunkSize: int = 10000):
+        return self._selectMatching('institute', partialName, chunkSize=chunkSize)
+    
+    @_cachedQuery
+    def getActivitiesByResponsiblePerson(self, partialName: str):
+        return self._selectMatching('person', partialName)
+
+    def iterActivitiesByResponsiblePerson(self, partialName: str, chunkSize: int = 10000):
+        return self._selectMatching('person', partialName, chunkSize=chunkSize)
 
+    @_cachedQuery
+    def getActivitiesUsingTool(self, partialName: str):
+        return self._selectMatching('tool', partialName)
+
+    def iterActivitiesUsingTool(self, partialName: str, chunkSize: int = 10000):
+        return self._selectMatching('tool', partialName, chunkSize=chunkSize)
+
+    def _startedAfter(self, date: str, chunkSize: int|None = None):
+        if _isParquet(self.getDbPathOrUrl()):
+            expression = ds.field('start date') >= date
+            if date[:4].isdigit():
+                # Whole start-year partitions are skipped
+                expression = (ds.field('year') >= int(date[:4])) & expression
+            return self._scanParquet(expression, chunkSize=chunkSize)
+        return self._selectActivities('"start date" >= :date', {"date": date}, chunkSize=chunkSize)
+
+    @_cachedQuery
+    def getActivitiesStartedAfter(self, date: str):
+        return self._startedAfter(date)
+
+    def iterActivitiesStartedAfter(self, date: str, chunkSize: int = 10000):
+        return self._startedAfter(date, chunkSize)
+
+    def _endedBefore(self, date: str, chunkSize: int|None = None):
+        if _isParquet(self.getDbPathOrUrl()):
+            return self._scanParquet(ds.field('end date') <= date, chunkSize=chunkSize)
+        return self._selectActivities('"end date" <= :date', {"date": date}, chunkSize=chunkSize)
+
+    @_cachedQuery
+    def getActivitiesEndedBefore(self, date: str):
+        return self._endedBefore(date)
+
+    def iterActivitiesEndedBefore(self, date: str, chunkSize: int = 10000):
+        return self._endedBefore(date, chunkSize)
+
+    @_cachedQuery
+    def getActivitiesByObjectIds(self, objectIds: list[str]):
+        # The activities on the given objects. The ids are sent as a single JSON array parameter, so the text of the
+        # query does not depend on their number and each table is read through its objectId index. They are bound as
+        # text: the INTEGER affinity of the column turns '12' into 12, and ids that are not numbers are compared as
+        # they were stored
+        ids = list(dict.fromkeys(map(str, objectIds)))
+        if _isParquet(self.getDbPathOrUrl()):
+            # The integer ids are looked up in the int64 objectId column, the others in objectText
+            numbers = [int(i) for i in ids if re.fullmatch(r'-?\d+', i)]
+            return self._scanParquet(ds.field('objectId').isin(numbers) | ds.field('objectText').isin(ids))
+        return self._selectActivities('objectId IN (SELECT value FROM json_each(:ids))', {"ids": json.dumps(ids)})
+
+    def _inTimeFrame(self, start: str, end: str, types: list[str]|None, chunkSize: int|None = None):
+        # The activities that started on or after start and ended on or before end, optionally only the ones of the
+        # given types ('acquisition', 'processing'...). The dates are compared as days, on the (startDay, endDay) indexes
+        start_day, end_day = _epochDay(start), _epochDay(end)
+        if start_day is None or end_day is None:
+            print(f"An error occurred: {start} and {end} must be dates in the YYYY-MM-DD format")
+            return None
+        requested = set(_ACTIVITY_FIELDS) if types is None else {str(activity_type).lower() for activity_type in types}
+        if not requested or not requested <= set(_ACTIVITY_FIELDS):
+            print(f"An error occurred: the activity types must be some of {', '.join(_ACTIVITY_FIELDS)}")
+            return None
+        tables = tuple(table for table in _ACTIVITY_FIELDS if table in requested)
+
+        if _isParquet(self.getDbPathOrUrl()):
+            expression = ((ds.field('year') >= int(start[:4])) & ds.field('type').isin(list(tables)) &
+                          (ds.field('startDay') >= start_day) & (ds.field('endDay') <= end_day))
+            return self._scanParquet(expression, chunkSize=chunkSize)
+        return self._selectActivities('"startDay" >= :start AND "endDay" <= :end', {"start": start_day, "end": end_day},
+                                      tables=tables, chunkSize=chunkSize)
+
+    @_cachedQuery
+    def getActivitiesInTimeFrame(self, start: str, end: str, types: list[str]|None = None):
+        return self._inTimeFrame(start, end, types)
+
+    def iterActivitiesInTimeFrame(self, start: str, end: str, types: list[str]|None = None, chunkSize: int = 10000):
+        return self._inTimeFrame(start, end, types, chunkSize)
+
+    @_cachedQuery
     def getAcquisitionsByTechnique(self, partialName: str):
-        try:
-            with sq.connect (self.getDbPathOrUrl()) as con:
-                query = f"""
-                SELECT *
-                FROM acquisition 
-                WHERE technique LIKE '%{partialName}%'
-                ORDER BY objectId
-                """
-                query_table = pd.read_sql(query, con)
-                return query_table
-        except Exception as e:
-            print ("An error occured:", e) 
+        return self._selectMatching('technique', partialName, acquisitions=True)
+
+    def iterAcquisitionsByTechnique(self, partialName: str, chunkSize: int = 10000):
+        return self._selectMatching('technique', partialName, acquisitions=True, chunkSize=chunkSize)
 
 class MetadataQueryHandler(QueryHandler):
+    localStores = (_graphFormat,)
+
     def __init__(self):
         super().__init__()
     
+    @_cachedQuery
     def getAllPeople(self):
         endpoint = self.getDbPathOrUrl()
         query = """
@@ -672,7 +2174,7 @@ class MetadataQueryHandler(QueryHandler):
                             Attributes:id ?id .
                         }
                         """
-        df = get(endpoint, query, True)
+        df = _sparqlSelect(endpoint, query)
         
         df['entity'] = df['entity'].apply(lambda x: x.rsplit('/', 1)[-1])
         df_sorted = df.loc[df['entity'].str.extract(r'(\d+)', expand=False).astype(int).sort_values().index]
@@ -680,6 +2182,7 @@ class MetadataQueryHandler(QueryHandler):
 
         return df_sorted
 
+    @_cachedQuery
     def getAllCulturalHeritageObjects(self):
         endpoint = self.getDbPathOrUrl()
 
@@ -703,7 +2206,7 @@ class MetadataQueryHandler(QueryHandler):
                             } 
                         }
                         """
-        df = get(endpoint, query, True)
+        df = _sparqlSelect(endpoint, query)
 
         columns_to_process = ['entity', 'type', 'author']
         for column in columns_to_process:
@@ -714,84 +2217,68 @@ class MetadataQueryHandler(QueryHandler):
         
         return df_sorted
 
+    @_cachedQuery
     def getAuthorsOfCulturalHeritageObject(self, objectId: str):
         endpoint = self.getDbPathOrUrl()
 
+        # The object, its authors and their ids and names are resolved in a single join
         query = """
                         PREFIX Classes: <https://github.com/Sergpoipoip/DHDK_DS-project/classes/>
                         PREFIX Attributes: <https://github.com/Sergpoipoip/DHDK_DS-project/attributes/>
                         PREFIX Relations: <https://github.com/Sergpoipoip/DHDK_DS-project/relations/>
-                        PREFIX Entities: <https://github.com/Sergpoipoip/DHDK_DS-project/entities/>
 
-                        SELECT ?entity ?id ?author
+                        SELECT ?entity ?id ?name
                         WHERE {
-                            ?entity Attributes:id  "%s";
-                            a ?type ;
+                            ?object Attributes:id "%s" ;
+                            Relations:author ?entity .
+                            ?entity a Classes:Person ;
                             Attributes:id ?id ;
-                            Attributes:owner ?owner ;
-                            Attributes:place ?place ;
-                            Attributes:title ?title .
-                            OPTIONAL {
-                                ?entity Relations:author ?author .
-                            }
-                            OPTIONAL {
-                                ?entity Attributes:date ?date .
-                            }
+                            Attributes:name ?name .
                         }
                         """ % objectId
-        df = get(endpoint, query, True)
-        columns_to_process = ['entity', 'author']
-        for column in columns_to_process:
-            df[column] = df[column].apply(lambda x: x.rsplit('/', 1)[-1] if isinstance(x, str) else x)
+        df = _sparqlSelect(endpoint, query)
 
-        authors = [a for a in df['author']]
-        
-        if authors and not pd.isna(authors[0]):
-            all_dfs = []
-            for author in authors:
-                query_1 = """
-                                PREFIX Attributes: <https://github.com/Sergpoipoip/DHDK_DS-project/attributes/>
-                                PREFIX Classes: <https://github.com/Sergpoipoip/DHDK_DS-project/classes/>
-                                PREFIX Entities: <https://github.com/Sergpoipoip/DHDK_DS-project/entities/>
-
-                                SELECT ?entity ?id ?name
-                                WHERE {
-                                    Entities:%s a Classes:Person ;
-                                    Attributes:id ?id ;
-                                    Attributes:name ?name ;
-                                }
-                                """ % author
-                
-                df_main = get(endpoint, query_1, True)
-                id = df_main['id'][0]
+        if len(df):
+            df['entity'] = df['entity'].apply(lambda x: x.rsplit('/', 1)[-1] if isinstance(x, str) else x)
+            return df.drop_duplicates(ignore_index=True)
+        else:
+            return pd.DataFrame()
 
-                query_2 = """
-                                PREFIX Attributes: <https://github.com/Sergpoipoip/DHDK_DS-project/attributes/>
-                                PREFIX Classes: <https://github.com/Sergpoipoip/DHDK_DS-project/classes/>
-                                PREFIX Entities: <https://github.com/Sergpoipoip/DHDK_DS-project/entities/>
+    @_cachedQuery
+    def getAuthorsOfCulturalHeritageObjects(self, objectIds: list[str], batchSize: int = 500):
+        endpoint = self.getDbPathOrUrl()
 
-                                SELECT ?entity
-                                WHERE {
-                                    ?entity a Classes:Person ;
-                                    Attributes:id "%s" ;
-                                }
-                                """ % id
+        # Bulk variant of getAuthorsOfCulturalHeritageObject: one row per (objectId, author) pair
+        ids = list(dict.fromkeys(str(i) for i in objectIds))
+        all_dfs = []
+        for start in range(0, len(ids), batchSize):
+            query = """
+                        PREFIX Classes: <https://github.com/Sergpoipoip/DHDK_DS-project/classes/>
+                        PREFIX Attributes: <https://github.com/Sergpoipoip/DHDK_DS-project/attributes/>
+                        PREFIX Relations: <https://github.com/Sergpoipoip/DHDK_DS-project/relations/>
 
-            
-                df_entity = get(endpoint, query_2, True)
+                        SELECT ?objectId ?entity ?id ?name
+                        WHERE {
+                            VALUES ?objectId { %s }
+                            ?object Attributes:id ?objectId ;
+                            Relations:author ?entity .
+                            ?entity a Classes:Person ;
+                            Attributes:id ?id ;
+                            Attributes:name ?name .
+                        }
+                        """ % _valuesBlock(ids[start:start + batchSize])
+            all_dfs.append(_sparqlSelect(endpoint, query))
 
-                df_main['entity'] = df_main['entity'].fillna(df_entity['entity'][0])
-                columns_to_process = ['entity', 'name']
-                for column in columns_to_process:
-                    df_main[column] = df_main[column].apply(lambda x: x.rsplit('/', 1)[-1] if isinstance(x, str) else x)
-                all_dfs.append(df_main)
+        if not all_dfs:
+            return pd.DataFrame(columns=['objectId', 'entity', 'id', 'name'])
 
-            resultant_df = pd.concat(all_dfs, ignore_index=True)
+        df = pd.concat(all_dfs, ignore_index=True)
+        df['objectId'] = df['objectId'].astype(str)
+        df['entity'] = df['entity'].apply(lambda x: x.rsplit('/', 1)[-1] if isinstance(x, str) else x)
 
-            return resultant_df
-        else:
-            return pd.DataFrame()
+        return df.drop_duplicates(ignore_index=True)
         
+    @_cachedQuery
     def getCulturalHeritageObjectsAuthoredBy(self, personId: str):
         endpoint = self.getDbPathOrUrl()
 
@@ -809,7 +2296,7 @@ class MetadataQueryHandler(QueryHandler):
                                 }
                                 """ % personId
         
-        df_authorData_by_Id = get(endpoint, query, True)
+        df_authorData_by_Id = _sparqlSelect(endpoint, query)
         if len(df_authorData_by_Id):
             person = df_authorData_by_Id['entity'][0]
         else:
@@ -836,7 +2323,7 @@ class MetadataQueryHandler(QueryHandler):
                         }
                         ORDER BY ?id
                         """ % person
-        resultant_df = get(endpoint, query_1, True)
+        resultant_df = _sparqlSelect(endpoint, query_1)
 
         columns_to_process = ['entity', 'type', 'author']
         for column in columns_to_process:
@@ -844,10 +2331,191 @@ class MetadataQueryHandler(QueryHandler):
 
         return resultant_df
 
+    # Keyset pagination on the IRIs of the entities. Each page asks the database for the next pageSize entities after
+    # the last IRI seen, in the order of the IRIs, sorted and limited on the database side, so that only one page is
+    # held at a time. The filter and the order are on the entity variable itself, with no key computed per entity,
+    # but only a store that can seek to the cursor in its IRI index skips the earlier entities: the others still scan
+    # all the entities for each page, O(N) per page and O(N * N / pageSize) for the whole walk. The pages bound the
+    # size of each response, not the work of the database. The page of objects is chosen with the same required
+    # pattern as getAllCulturalHeritageObjects, so that every entity of the page has its rows in the result, and the
+    # walk ends on the first empty page: objects that getAll leaves out (no owner, no place...) do not end it early.
+    _PEOPLE_PAGE = """
+        PREFIX Attributes: <https://github.com/Sergpoipoip/DHDK_DS-project/attributes/>
+        PREFIX Classes: <https://github.com/Sergpoipoip/DHDK_DS-project/classes/>
+
+        SELECT ?entity ?name ?id
+        WHERE {
+            ?entity a Classes:Person ;
+            Attributes:name ?name ;
+            Attributes:id ?id .
+            FILTER(STR(?entity) > %s)
+        }
+        ORDER BY ?entity
+        LIMIT %d
+        """
+
+    _OBJECTS_PAGE = """
+        PREFIX Attributes: <https://github.com/Sergpoipoip/DHDK_DS-project/attributes/>
+        PREFIX Relations: <https://github.com/Sergpoipoip/DHDK_DS-project/relations/>
+
+        SELECT ?entity ?id ?type ?title ?date ?author ?owner ?place
+        WHERE {
+            {
+                SELECT DISTINCT ?entity
+                WHERE {
+                    ?entity a ?anyType ;
+                    Attributes:id ?anyId ;
+                    Attributes:title ?anyTitle ;
+                    Attributes:owner ?anyOwner ;
+                    Attributes:place ?anyPlace .
+                    FILTER(STR(?entity) > %s)
+                }
+                ORDER BY ?entity
+                LIMIT %d
+            }
+            ?entity a ?type ;
+            Attributes:id ?id ;
+            Attributes:title ?title ;
+            Attributes:owner ?owner ;
+            Attributes:place ?place .
+            OPTIONAL {
+                ?entity Relations:author ?author .
+            }
+            OPTIONAL {
+                ?entity Attributes:date ?date .
+            }
+        }
+        ORDER BY ?entity
+        """
+
+    def _iterPages(self, query: str, pageSize: int, columns: list[str], getAll):
+        if not isinstance(pageSize, int) or pageSize <= 0:
+            print("An error occurred: pageSize must be a positive integer")
+            return
+        endpoint = self.getDbPathOrUrl()
+        if _graphFormat(endpoint):
+            # A local graph is in memory as a whole anyway, and rdflib would filter and sort all the entities again for
+            # every page: the full result is read once and split into pages of entities, in the order of getAll
+            df = getAll()
+            pages = pd.factorize(df['entity'])[0] // pageSize
+            for _, page in df.groupby(pages, sort=True):
+                yield page.reset_index(drop=True)
+            return
+
+        cursor = ""
+        while True:
+            df = _sparqlSelect(endpoint, query % (_ntTerm(Literal(cursor)), pageSize))
+            if len(df) == 0:
+                return
+            cursor = df['entity'].iloc[-1]
+            for column in columns:
+                df[column] = df[column].apply(lambda x: x.rsplit('/', 1)[-1] if isinstance(x, str) else x)
+            if 'date' in df.columns:
+                df['date'] = _dateColumn(df['date'])
+            yield df.reset_index(drop=True)
+
+    def iterAllPeople(self, pageSize: int = 1000):
+        # The rows of getAllPeople as DataFrames of at most pageSize people, in the order of their IRIs (in the order
+        # of getAllPeople for a local RDF file)
+        return self._iterPages(self._PEOPLE_PAGE, pageSize, ['entity'], self.getAllPeople)
+
+    def iterAllCulturalHeritageObjects(self, pageSize: int = 1000):
+        # The rows of getAllCulturalHeritageObjects as DataFrames of the rows of at most pageSize objects (one row per
+        # author, as in the full result), in the order of their IRIs (in the order of the full result for a local file)
+        return self._iterPages(self._OBJECTS_PAGE, pageSize, ['entity', 'type', 'author'], self.getAllCulturalHeritageObjects)
+
+    @_cachedQuery
+    def getCulturalHeritageObjectsByIds(self, objectIds: list[str], batchSize: int = 500):
+        endpoint = self.getDbPathOrUrl()
+
+        # The objects and their authors are fetched together, one row per (object, author) pair. Ids are sent
+        # in VALUES blocks of at most batchSize elements, so the number of queries does not depend on the number
+        # of objects times the number of authors.
+        ids = list(dict.fromkeys(str(i) for i in objectIds))
+        all_dfs = []
+        for start in range(0, len(ids), batchSize):
+            query = """
+                        PREFIX Attributes: <https://github.com/Sergpoipoip/DHDK_DS-project/attributes/>
+                        PREFIX Relations: <https://github.com/Sergpoipoip/DHDK_DS-project/relations/>
+
+                        SELECT ?entity ?id ?type ?title ?date ?owner ?place ?author ?authorId ?authorName
+                        WHERE {
+                            VALUES ?id { %s }
+                            ?entity Attributes:id ?id ;
+                            a ?type ;
+                            Attributes:owner ?owner ;
+                            Attributes:place ?place ;
+                            Attributes:title ?title .
+                            OPTIONAL {
+                                ?entity Relations:author ?author .
+                                ?author Attributes:id ?authorId ;
+                                Attributes:name ?authorName .
+                            }
+                            OPTIONAL {
+                                ?entity Attributes:date ?date .
+                            }
+                        }
+                        """ % _valuesBlock(ids[start:start + batchSize])
+            all_dfs.append(_sparqlSelect(endpoint, query))
+
+        if not all_dfs:
+            return pd.DataFrame()
+
+        df = pd.concat(all_dfs, ignore_index=True)
+        columns_to_process = ['entity', 'type', 'author']
+        for column in columns_to_process:
+            df[column] = df[column].apply(lambda x: x.rsplit('/', 1)[-1] if isinstance(x, str) else x)
+        df['id'] = df['id'].astype(str)
+        df['date'] = _dateColumn(df['date'])
+
+        return df.drop_duplicates(ignore_index=True)
+
 class BasicMashup(object):
     def __init__(self) -> None:
         self.metadataQuery = []
         self.processQuery = []
+        self.maxWorkers = 1
+        self.handlerTimeout = None
+        # The errors of the handlers during the last top-level call (a public method not called by another one)
+        self.handlerErrors = []
+        # The calls that did not answer within handlerTimeout and are still running, by handler
+        self.lateCalls = {}
+        self.lock = threading.Lock()
+        self.lazyLoading = False
+
+    def setLazyLoading(self, lazy: bool) -> bool:
+        # In lazy mode, the objects of the activities and the authors of the objects are fetched (all together)
+        # on the first call to refersTo() / getAuthors() on any of the returned items
+        if not isinstance(lazy, bool):
+            return False
+        self.lazyLoading = lazy
+        return True
+
+    def setConcurrency(self, maxWorkers: int, timeout: float|None = None) -> bool:
+        # With maxWorkers > 1 the handlers are queried in parallel and any handler not answering within
+        # timeout seconds is skipped; with maxWorkers == 1 they are queried one after the other, as before
+        if not isinstance(maxWorkers, int) or maxWorkers < 1:
+            return False
+        if timeout is not None and timeout <= 0:
+            return False
+        self.maxWorkers = maxWorkers
+        self.handlerTimeout = timeout
+        return True
+
+    def _handlerErrors(self) -> list[dict]:
+        # The errors of the last top-level call made in the current context, or of the last one made anywhere
+        last = _HANDLER_ERRORS.get()
+        if last is not None and last[0]() is self:
+            return last[1]
+        return self.handlerErrors
+
+    def getHandlerErrors(self) -> list[dict]:
+        return self._handlerErrors()
+
+    def cleanHandlerErrors(self) -> bool:
+        self._handlerErrors().clear()
+        self.handlerErrors = []
+        return True
     
     def cleanMetadataHandlers(self) -> bool:
         self.metadataQuery = []
@@ -879,505 +2547,727 @@ class BasicMashup(object):
             print(e)
             return False
 
+    def _collect(self, handlers: list, methodName: str, *args) -> pd.DataFrame:
+        # Run the same query method on every handler and merge the partial frames once at the end. A failing,
+        # empty or (in concurrent mode) late handler does not prevent the others from contributing: its error
+        # is recorded in handlerErrors and the partial result is returned.
+        # A late call cannot be interrupted and keeps its thread until it returns. Meanwhile its handler is skipped by
+        # the next concurrent calls, so a handler that hangs holds at most one thread, whatever the number of calls.
+        results = []
+
+        if self.maxWorkers > 1 and len(handlers) > 1:
+            executor = ThreadPoolExecutor(max_workers=min(self.maxWorkers, len(handlers)))
+            futures = []
+            for handler in handlers:
+                with self.lock:
+                    late = handler in self.lateCalls
+                future = None if late else executor.submit(contextvars.copy_context().run, getattr(handler, methodName), *args)
+                futures.append((handler, future))
+            deadline = time.monotonic() + self.handlerTimeout if self.handlerTimeout is not None else None
+            for handler, future in futures:
+                if future is None:
+                    results.append((handler, TimeoutError(f"{methodName} was not called: an earlier call has not answered yet")))
+                    continue
+                try:
+                    remaining = max(0, deadline - time.monotonic()) if deadline is not None else None
+                    results.append((handler, future.result(timeout=remaining)))
+                except FutureTimeoutError:
+                    self._addLateCall(handler, future)
+                    results.append((handler, TimeoutError(f"{methodName} did not answer within {self.handlerTimeout} seconds")))
+                except Exception as e:
+                    results.append((handler, e))
+            executor.shutdown(wait=False, cancel_futures=True)
+        else:
+            for handler in handlers:
+                try:
+                    results.append((handler, getattr(handler, methodName)(*args)))
+                except Exception as e:
+                    results.append((handler, e))
+
+        return self._mergeResults(results, methodName)
+
+    def _addLateCall(self, handler, future):
+        with self.lock:
+            self.lateCalls[handler] = future
+        future.add_done_callback(partial(self._removeLateCall, handler))
+
+    def _removeLateCall(self, handler, future):
+        with self.lock:
+            if self.lateCalls.get(handler) is future:
+                del self.lateCalls[handler]
+        # The result of a late call is not used: its error, if any, is retrieved here so that it is not reported
+        if not future.cancelled():
+            future.exception()
+
+    def _mergeResults(self, results: list[tuple], methodName: str) -> pd.DataFrame:
+        frames = []
+        for handler, result in results:
+            if isinstance(result, pd.DataFrame):
+                if len(result):
+                    frames.append(result)
+            else:
+                error = result if isinstance(result, Exception) else ValueError(f"{methodName} returned no result")
+                self._handlerErrors().append({"handler": handler, "method": methodName, "error": error})
+
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True).drop_duplicates(ignore_index=True)
+
+    @_tracedMethod
     def getEntityById(self, id: str) -> IdentifiableEntity | None:
-        df = pd.DataFrame()
-        
-        for metaData_qh in self.metadataQuery:
-            meta_df_to_add = metaData_qh.getById(id)
-            df = pd.concat([df, meta_df_to_add], ignore_index=True)
+        df = self._collect(self.metadataQuery, "getById", id)
         
         if len(df) == 0:
             return None
         
         else:
             if ":" in id:
-                result_person = Person(id, df.loc[0]["name"])
+                result_person = Person(id, str(df.loc[0]["name"]))
                 return result_person
             else:
-                dict_of_classes = {'NauticalChart': NauticalChart, 'ManuscriptPlate': ManuscriptPlate, 'ManuscriptVolume': ManuscriptVolume,
-                                   'PrintedVolume': PrintedVolume, 'PrintedMaterial': PrintedMaterial, 'Herbarium': Herbarium,
-                                   'Specimen': Specimen, 'Painting': Painting, 'Model': Model, 'Map': Map}
-                list_of_authors = []
-                authors = metaData_qh.getAuthorsOfCulturalHeritageObject(id)
-                list_of_authors = [Person(row["id"], row["name"]) for _, row in authors.iterrows()]
-                
-                obj_title = df.loc[0]["title"]
-                obj_date = str(df.loc[0]["date"]) if df.loc[0]["date"] != "" else None
-                obj_authors = list_of_authors
-                obj_owner = df.loc[0]["owner"]
-                obj_place = df.loc[0]["place"]
-                obj_type = df.loc[0]["type"]
-                
-                result_object = dict_of_classes[obj_type](id, obj_title,
-                        obj_owner,
-                        obj_place,
-                        obj_date,
-                        obj_authors)
-                
-                return result_object
+                df['id'] = id
+                return self._buildObjects(df.head(1), self._getAuthorsByObjectIds([id]))[0]
+
+    def _buildPeople(self, df: pd.DataFrame) -> list[Person]:
+        return [Person._fromStore(str(person_id), str(name)) for person_id, name in zip(df['id'], df['name'])]
+
+    def _buildObjects(self, df: pd.DataFrame, authors: dict[str, list[Person]]|_BatchLoader) -> list[CulturalHeritageObject]:
+        # The columns are extracted once and zipped, instead of boxing every row into a Series
+        loader = authors if isinstance(authors, _BatchLoader) else None
+        list_of_objects = []
+        for obj_id, obj_type, obj_title, obj_date, obj_owner, obj_place in zip(df['id'].astype(str), df['type'], df['title'],
+                                                                               df['date'], df['owner'], df['place']):
+            result_object = _OBJECT_CLASSES[obj_type]._fromStore(obj_id, str(obj_title),
+                    str(obj_owner),
+                    str(obj_place),
+                    _dateString(obj_date),
+                    None if loader else authors.get(obj_id, []),
+                    loader)
+            list_of_objects.append(result_object)
+
+        return list_of_objects
+
+    def _buildActivities(self, df: pd.DataFrame, objects: dict[str, CulturalHeritageObject]|_BatchLoader) -> list[Activity]:
+        # The activity type is the prefix of the internal id ('acquisition-0'), which is called activityId in the
+        # union of all the tables and acquisitionId when only the acquisition table is queried. Activities whose
+        # object is not found in any metadata handler are skipped, unless objects are loaded lazily.
+        id_column = 'activityId' if 'activityId' in df.columns else 'acquisitionId'
+        types = df[id_column].str.partition('-')[0]
+        techniques = df['technique'] if 'technique' in df.columns else [''] * len(df)
+        loader = objects if isinstance(objects, _BatchLoader) else None
+
+        list_of_activities = []
+        for act_type, obj_id, act_institute, act_person, act_start, act_end, act_tool, act_technique in zip(
+                types, df['objectId'].astype(str), df['responsible institute'], df['responsible person'],
+                df['start date'], df['end date'], df['tool'], techniques):
+            act_refersTo = obj_id if loader else objects.get(obj_id)
+            if act_refersTo is None:
+                continue
+
+            act_class = _ACTIVITY_CLASSES[act_type]
+            act_tools = act_tool.split(", ") if act_tool else []
+            if act_class is Acquisition:
+                result_activity = Acquisition._fromStore(act_refersTo, act_institute, act_person,
+                        act_start,
+                        act_end,
+                        act_tools,
+                        loader,
+                        act_technique)
+            else:
+                result_activity = act_class._fromStore(act_refersTo, act_institute, act_person,
+                        act_start,
+                        act_end,
+                        act_tools,
+                        loader)
+
+            list_of_activities.append(result_activity)
+
+        return list_of_activities
 
+    def _getObjectsByIds(self, objectIds) -> dict[str, CulturalHeritageObject]:
+        # Batched counterpart of getEntityById used by the activity methods: all the distinct objects referred
+        # by an activity dataframe are fetched (with their authors) in a few queries instead of one per row
+        ids = list(dict.fromkeys(str(i) for i in objectIds))
+        if not ids:
+            return dict()
 
+        return self._objectsFromFrame(self._collect(self.metadataQuery, "getCulturalHeritageObjectsByIds", ids))
 
+    def _objectsFromFrame(self, df: pd.DataFrame) -> dict[str, CulturalHeritageObject]:
+        if len(df) == 0:
+            return dict()
+
+        # Group the authors by object first, so that every object is built only once
+        authors_df = df.dropna(subset=['authorId']).drop_duplicates(subset=['id', 'authorId'])
+        authors_df = authors_df.rename(columns={'id': 'objectId', 'authorId': 'id', 'authorName': 'name'})
+        objects = self._buildObjects(df.drop_duplicates(subset='id'), self._groupAuthors(authors_df))
+
+        return {obj.getId(): obj for obj in objects}
+
+    def _groupAuthors(self, df: pd.DataFrame) -> dict[str, list[Person]]:
+        authors = {}
+        for obj_id, person in zip(df['objectId'].astype(str), self._buildPeople(df)):
+            authors.setdefault(obj_id, []).append(person)
+        return authors
+
+    def _getAuthorsByObjectIds(self, objectIds) -> dict[str, list[Person]]:
+        # The authors of many objects are resolved with the bulk query of each metadata handler
+        ids = list(dict.fromkeys(str(i) for i in objectIds))
+        if not ids:
+            return dict()
+
+        return self._authorsFromFrame(self._collect(self.metadataQuery, "getAuthorsOfCulturalHeritageObjects", ids))
+
+    def _authorsFromFrame(self, df: pd.DataFrame) -> dict[str, list[Person]]:
+        if len(df) == 0:
+            return dict()
+
+        return self._groupAuthors(df.drop_duplicates(subset=['objectId', 'id']))
+
+    def _objectsFor(self, objectIds) -> dict[str, CulturalHeritageObject]|_BatchLoader:
+        if self.lazyLoading:
+            return _BatchLoader(self._getObjectsByIds, list(dict.fromkeys(str(i) for i in objectIds)))
+        return self._getObjectsByIds(objectIds)
+
+    def _authorsFor(self, objectIds) -> dict[str, list[Person]]|_BatchLoader:
+        if self.lazyLoading:
+            return _BatchLoader(self._getAuthorsByObjectIds, list(dict.fromkeys(str(i) for i in objectIds)))
+        return self._getAuthorsByObjectIds(objectIds)
+
+    @_tracedMethod
     def getAllPeople(self) -> list[Person]:
-        df = pd.DataFrame()
-        
-        for metaData_qh in self.metadataQuery:
-            meta_df_to_add = metaData_qh.getAllPeople()
-            df = pd.concat([df, meta_df_to_add], ignore_index=True).drop_duplicates()
+        df = self._collect(self.metadataQuery, "getAllPeople")
         
         if len(df) == 0:
             return list()
         
         else:
-            list_of_authors = [Person(row["id"], row["name"]) for _, row in df.iterrows()]
-            
-            return list_of_authors
+            return self._buildPeople(df)
 
+    @_tracedMethod
     def getAllCulturalHeritageObjects(self) -> list[CulturalHeritageObject]:
-        df = pd.DataFrame()
-        
-        for metaData_qh in self.metadataQuery:
-            meta_df_to_add = metaData_qh.getAllCulturalHeritageObjects()
-            df = pd.concat([df, meta_df_to_add], ignore_index=True).drop_duplicates()
+        df = self._collect(self.metadataQuery, "getAllCulturalHeritageObjects")
         
         if len(df) == 0:
             return list()
         
         else:
-            dict_of_classes = {'NauticalChart': NauticalChart, 'ManuscriptPlate': ManuscriptPlate, 'ManuscriptVolume': ManuscriptVolume,
-                                   'PrintedVolume': PrintedVolume, 'PrintedMaterial': PrintedMaterial, 'Herbarium': Herbarium,
-                                   'Specimen': Specimen, 'Painting': Painting, 'Model': Model, 'Map': Map}
             df.drop_duplicates(subset='id', inplace=True, ignore_index=True) 
-            list_of_objects = []
-            for i, row in df.iterrows():
-                authors_df = metaData_qh.getAuthorsOfCulturalHeritageObject(row['id'])
-                list_of_authors = [Person(row1["id"], row1["name"]) for _, row1 in authors_df.iterrows()]
-
-                obj_id = str(df.loc[i]["id"])
-                obj_title = df.loc[i]["title"]
-                obj_date = str(df.loc[i]["date"]) if df.loc[i]["date"] != "" else None
-                obj_authors = list_of_authors
-                obj_owner = df.loc[i]["owner"]
-                obj_place = df.loc[i]["place"]
-                obj_type = df.loc[i]["type"]
-                
-                result_object = dict_of_classes[obj_type](obj_id, obj_title,
-                        obj_owner,
-                        obj_place,
-                        obj_date,
-                        obj_authors)
-                
-                list_of_objects.append(result_object)
-            
-            return list_of_objects
+            return self._buildObjects(df, self._authorsFor(df["id"]))
 
+    @_tracedMethod
     def getAuthorsOfCulturalHeritageObject(self, objectId: str) -> list[Person]:
-        df = pd.DataFrame()
-        
-        for metaData_qh in self.metadataQuery:
-            meta_df_to_add = metaData_qh.getAuthorsOfCulturalHeritageObject(objectId)
-            df = pd.concat([df, meta_df_to_add], ignore_index=True).drop_duplicates()
+        df = self._collect(self.metadataQuery, "getAuthorsOfCulturalHeritageObject", objectId)
         
         if len(df) == 0:
             return list()
         
         else:
-            list_of_authors = [Person(row["id"], row["name"]) for _, row in df.iterrows()]
-            return list_of_authors
-
+            return self._buildPeople(df)
 
+    @_tracedMethod
     def getCulturalHeritageObjectsAuthoredBy(self, personId: str) -> list[CulturalHeritageObject]:
-        df = pd.DataFrame()
-        
-        for metaData_qh in self.metadataQuery:
-            meta_df_to_add = metaData_qh.getCulturalHeritageObjectsAuthoredBy(personId)
-            df = pd.concat([df, meta_df_to_add], ignore_index=True).drop_duplicates()
+        df = self._collect(self.metadataQuery, "getCulturalHeritageObjectsAuthoredBy", personId)
         
         if len(df) == 0:
             return list()
         
         else:
-            dict_of_classes = {'NauticalChart': NauticalChart, 'ManuscriptPlate': ManuscriptPlate, 'ManuscriptVolume': ManuscriptVolume,
-                                   'PrintedVolume': PrintedVolume, 'PrintedMaterial': PrintedMaterial, 'Herbarium': Herbarium,
-                                   'Specimen': Specimen, 'Painting': Painting, 'Model': Model, 'Map': Map}
             df.drop_duplicates(subset='id', inplace=True, ignore_index=True) 
-            list_of_objects = []
-            for i, row in df.iterrows():
-                authors_df = metaData_qh.getAuthorsOfCulturalHeritageObject(row['id'])
-                list_of_authors = [Person(row1["id"], row1["name"]) for _, row1 in authors_df.iterrows()]
-
-                obj_id = str(df.loc[i]["id"])
-                obj_title = df.loc[i]["title"]
-                obj_date = str(df.loc[i]["date"]) if df.loc[i]["date"] != "" else None
-                obj_authors = list_of_authors
-                obj_owner = df.loc[i]["owner"]
-                obj_place = df.loc[i]["place"]
-                obj_type = df.loc[i]["type"]
-                
-                result_object = dict_of_classes[obj_type](obj_id, obj_title,
-                        obj_owner,
-                        obj_place,
-                        obj_date,
-                        obj_authors)
-                
-                list_of_objects.append(result_object)
-            
-            return list_of_objects
+            return self._buildObjects(df, self._authorsFor(df["id"]))
 
-    def getAllActivities(self) -> list[Activity]:
-        df = pd.DataFrame()
-        
-        for process_qh in self.processQuery:
-            process_df_to_add = process_qh.getAllActivities()
-            df = pd.concat([df, process_df_to_add], ignore_index=True).drop_duplicates()
-            df.fillna('', inplace=True)
+    def _iterPages(self, methodName: str, pageSize: int):
+        # The pages of every metadata handler, one handler after the other. Only the ids already returned are kept,
+        # to skip the entities found in more than one graph; a failing handler is recorded in handlerErrors.
+        seen = set()
+        for handler in self.metadataQuery:
+            try:
+                for df in getattr(handler, methodName)(pageSize):
+                    df = df[~df['id'].astype(str).isin(seen)]
+                    if len(df):
+                        seen.update(df['id'].astype(str))
+                        yield df
+            except Exception as e:
+                self._handlerErrors().append({"handler": handler, "method": methodName, "error": e})
+
+    @_tracedIterator
+    def iterAllPeople(self, pageSize: int = 1000):
+        # Like getAllPeople, but the people are read and built one page at a time
+        for df in self._iterPages("iterAllPeople", pageSize):
+            yield from self._buildPeople(df)
+
+    @_tracedIterator
+    def iterAllCulturalHeritageObjects(self, pageSize: int = 1000):
+        # Like getAllCulturalHeritageObjects, but the objects and their authors are read and built one page at a time
+        for df in self._iterPages("iterAllCulturalHeritageObjects", pageSize):
+            df = df.drop_duplicates(subset='id', ignore_index=True)
+            yield from self._buildObjects(df, self._authorsFor(df["id"]))
+
+    def _activitiesFrom(self, methodName: str, *args) -> list[Activity]:
+        df = self._collect(self.processQuery, methodName, *args)
+        df.fillna('', inplace=True)
         
         if len(df) == 0:
             return list()
         
         else:
-            dict_of_classes = {'acquisition': Acquisition, 'processing': Processing, 'modelling': Modelling,
-                                   'optimising': Optimising, 'exporting': Exporting}
-            list_of_activities = []
-            for i, row in df.iterrows():
-
-                act_refersTo = self.getEntityById(str(df.loc[i]["objectId"]))
-                act_institute = df.loc[i]["responsible institute"]
-                act_person = df.loc[i]["responsible person"]
-                act_start = df.loc[i]["start date"]
-                act_end = df.loc[i]["end date"]
-                act_tool = df.loc[i]["tool"]
-                match_type = re.search(r'^[^-]*', df.loc[i]["activityId"])
-                act_type = match_type.group(0)
-                
-                if dict_of_classes[act_type] == Acquisition:
-                    act_technique = df.loc[i]["technique"]
-                    result_activity = dict_of_classes[act_type](act_refersTo, act_institute, act_technique, act_person,
-                            act_start,
-                            act_end,
-                            act_tool)
-                else:
-                    result_activity = dict_of_classes[act_type](act_refersTo, act_institute, act_person,
-                            act_start,
-                            act_end,
-                            act_tool)
-                
-                list_of_activities.append(result_activity)
-            
-            return list_of_activities
+            return self._buildActivities(df, self._objectsFor(df["objectId"]))
+
+    @_tracedMethod
+    def getAllActivities(self) -> list[Activity]:
+        return self._activitiesFrom("getAllActivities")
 
+    @_tracedMethod
     def getActivitiesByResponsibleInstitution(self, partialName: str) -> list[Activity]:
-        df = pd.DataFrame()
-        
-        for process_qh in self.processQuery:
-            process_df_to_add = process_qh.getActivitiesByResponsibleInstitution(partialName)
-            df = pd.concat([df, process_df_to_add], ignore_index=True).drop_duplicates()
-            df.fillna('', inplace=True)
-        
-        if len(df) == 0:
-            return list()
-        
-        else:
-            dict_of_classes = {'acquisition': Acquisition, 'processing': Processing, 'modelling': Modelling,
-                                   'optimising': Optimising, 'exporting': Exporting}
-            list_of_activities = []
-            for i, row in df.iterrows():
-
-                act_refersTo = self.getEntityById(str(df.loc[i]["objectId"]))
-                act_institute = df.loc[i]["responsible institute"]
-                act_person = df.loc[i]["responsible person"]
-                act_start = df.loc[i]["start date"]
-                act_end = df.loc[i]["end date"]
-                act_tool = df.loc[i]["tool"]
-                match_type = re.search(r'^[^-]*', df.loc[i]["activityId"])
-                act_type = match_type.group(0)
-                
-                if dict_of_classes[act_type] == Acquisition:
-                    act_technique = df.loc[i]["technique"]
-                    result_activity = dict_of_classes[act_type](act_refersTo, act_institute, act_technique, act_person,
-                            act_start,
-                            act_end,
-                            act_tool)
-                else:
-                    result_activity = dict_of_classes[act_type](act_refersTo, act_institute, act_person,
-                            act_start,
-                            act_end,
-                            act_tool)
-                
-                list_of_activities.append(result_activity)
-            
-            return list_of_activities
+        return self._activitiesFrom("getActivitiesByResponsibleInstitution", partialName)
 
+    @_tracedMethod
     def getActivitiesByResponsiblePerson(self, partialName: str) -> list[Activity]:
-        df = pd.DataFrame()
-        
-        for process_qh in self.processQuery:
-            process_df_to_add = process_qh.getActivitiesByResponsiblePerson(partialName)
-            df = pd.concat([df, process_df_to_add], ignore_index=True).drop_duplicates()
-            df.fillna('', inplace=True)
-        
-        if len(df) == 0:
-            return list()
-        
-        else:
-            dict_of_classes = {'acquisition': Acquisition, 'processing': Processing, 'modelling': Modelling,
-                                   'optimising': Optimising, 'exporting': Exporting}
-            list_of_activities = []
-            for i, row in df.iterrows():
-
-                act_refersTo = self.getEntityById(str(df.loc[i]["objectId"]))
-                act_institute = df.loc[i]["responsible institute"]
-                act_person = df.loc[i]["responsible person"]
-                act_start = df.loc[i]["start date"]
-                act_end = df.loc[i]["end date"]
-                act_tool = df.loc[i]["tool"]
-                match_type = re.search(r'^[^-]*', df.loc[i]["activityId"])
-                act_type = match_type.group(0)
-                
-                if dict_of_classes[act_type] == Acquisition:
-                    act_technique = df.loc[i]["technique"]
-                    result_activity = dict_of_classes[act_type](act_refersTo, act_institute, act_technique, act_person,
-                            act_start,
-                            act_end,
-                            act_tool)
-                else:
-                    result_activity = dict_of_classes[act_type](act_refersTo, act_institute, act_person,
-                            act_start,
-                            act_end,
-                            act_tool)
-                
-                list_of_activities.append(result_activity)
-            
-            return list_of_activities
+        return self._activitiesFrom("getActivitiesByResponsiblePerson", partialName)
 
+    @_tracedMethod
     def getActivitiesUsingTool(self, partialName: str) -> list[Activity]:
-        df = pd.DataFrame()
-        
-        for process_qh in self.processQuery:
-            process_df_to_add = process_qh.getActivitiesUsingTool(partialName)
-            df = pd.concat([df, process_df_to_add], ignore_index=True).drop_duplicates()
-            df.fillna('', inplace=True)
-        
-        if len(df) == 0:
-            return list()
-        
-        else:
-            dict_of_classes = {'acquisition': Acquisition, 'processing': Processing, 'modelling': Modelling,
-                                   'optimising': Optimising, 'exporting': Exporting}
-            list_of_activities = []
-            for i, row in df.iterrows():
-
-                act_refersTo = self.getEntityById(str(df.loc[i]["objectId"]))
-                act_institute = df.loc[i]["responsible institute"]
-                act_person = df.loc[i]["responsible person"]
-                act_start = df.loc[i]["start date"]
-                act_end = df.loc[i]["end date"]
-                act_tool = df.loc[i]["tool"]
-                match_type = re.search(r'^[^-]*', df.loc[i]["activityId"])
-                act_type = match_type.group(0)
-                
-                if dict_of_classes[act_type] == Acquisition:
-                    act_technique = df.loc[i]["technique"]
-                    result_activity = dict_of_classes[act_type](act_refersTo, act_institute, act_technique, act_person,
-                            act_start,
-                            act_end,
-                            act_tool)
-                else:
-                    result_activity = dict_of_classes[act_type](act_refersTo, act_institute, act_person,
-                            act_start,
-                            act_end,
-                            act_tool)
-                
-                list_of_activities.append(result_activity)
-            
-            return list_of_activities
+        return self._activitiesFrom("getActivitiesUsingTool", partialName)
 
+    @_tracedMethod
     def getActivitiesStartedAfter(self, date: str) -> list[Activity]:
-        df = pd.DataFrame()
-        
-        for process_qh in self.processQuery:
-            process_df_to_add = process_qh.getActivitiesStartedAfter(date)
-            df = pd.concat([df, process_df_to_add], ignore_index=True).drop_duplicates()
-            df.fillna('', inplace=True)
-        
-        if len(df) == 0:
-            return list()
-        
-        else:
-            dict_of_classes = {'acquisition': Acquisition, 'processing': Processing, 'modelling': Modelling,
-                                   'optimising': Optimising, 'exporting': Exporting}
-            list_of_activities = []
-            for i, row in df.iterrows():
-
-                act_refersTo = self.getEntityById(str(df.loc[i]["objectId"]))
-                act_institute = df.loc[i]["responsible institute"]
-                act_person = df.loc[i]["responsible person"]
-                act_start = df.loc[i]["start date"]
-                act_end = df.loc[i]["end date"]
-                act_tool = df.loc[i]["tool"].split(", ")
-                match_type = re.search(r'^[^-]*', df.loc[i]["activityId"])
-                act_type = match_type.group(0)
-                
-                if dict_of_classes[act_type] == Acquisition:
-                    act_technique = df.loc[i]["technique"]
-                    result_activity = dict_of_classes[act_type](act_refersTo, act_institute, act_technique, act_person,
-                            act_start,
-                            act_end,
-                            act_tool)
-                else:
-                    result_activity = dict_of_classes[act_type](act_refersTo, act_institute, act_person,
-                            act_start,
-                            act_end,
-                            act_tool)
-                
-                list_of_activities.append(result_activity)
-            
-            return list_of_activities
+        return self._activitiesFrom("getActivitiesStartedAfter", date)
 
+    @_tracedMethod
     def getActivitiesEndedBefore(self, date: str) -> list[Activity]:
-        df = pd.DataFrame()
-        
-        for process_qh in self.processQuery:
-            process_df_to_add = process_qh.getActivitiesEndedBefore(date)
-            df = pd.concat([df, process_df_to_add], ignore_index=True).drop_duplicates()
-            df.fillna('', inplace=True)
-        
-        if len(df) == 0:
-            return list()
-        
-        else:
-            dict_of_classes = {'acquisition': Acquisition, 'processing': Processing, 'modelling': Modelling,
-                                   'optimising': Optimising, 'exporting': Exporting}
-            list_of_activities = []
-            for i, row in df.iterrows():
-
-                act_refersTo = self.getEntityById(str(df.loc[i]["objectId"]))
-                act_institute = df.loc[i]["responsible institute"]
-                act_person = df.loc[i]["responsible person"]
-                act_start = df.loc[i]["start date"]
-                act_end = df.loc[i]["end date"]
-                act_tool = df.loc[i]["tool"]
-                match_type = re.search(r'^[^-]*', df.loc[i]["activityId"])
-                act_type = match_type.group(0)
-                
-                if dict_of_classes[act_type] == Acquisition:
-                    act_technique = df.loc[i]["technique"]
-                    result_activity = dict_of_classes[act_type](act_refersTo, act_institute, act_technique, act_person,
-                            act_start,
-                            act_end,
-                            act_tool)
-                else:
-                    result_activity = dict_of_classes[act_type](act_refersTo, act_institute, act_person,
-                            act_start,
-                            act_end,
-                            act_tool)
-                
-                list_of_activities.append(result_activity)
-            
-            return list_of_activities
+        return self._activitiesFrom("getActivitiesEndedBefore", date)
 
+    @_tracedMethod
     def getAcquisitionsByTechnique(self, partialName: str) -> list[Acquisition]:
-        df = pd.DataFrame()
-        
-        for process_qh in self.processQuery:
-            process_df_to_add = process_qh.getAcquisitionsByTechnique(partialName)
-            df = pd.concat([df, process_df_to_add], ignore_index=True).drop_duplicates()
-            df.fillna('', inplace=True)
-        
-        if len(df) == 0:
-            return list()
-        
-        else:
-            dict_of_classes = {'acquisition': Acquisition, 'processing': Processing, 'modelling': Modelling,
-                                   'optimising': Optimising, 'exporting': Exporting}
-            list_of_activities = []
-            for i, row in df.iterrows():
-
-                act_refersTo = self.getEntityById(str(df.loc[i]["objectId"]))
-                act_institute = df.loc[i]["responsible institute"]
-                act_person = df.loc[i]["responsible person"]
-                act_start = df.loc[i]["start date"]
-                act_end = df.loc[i]["end date"]
-                act_tool = df.loc[i]["tool"]
-                match_type = re.search(r'^[^-]*', df.loc[i]["acquisitionId"])
-                act_type = match_type.group(0)
-                
-                act_technique = df.loc[i]["technique"]
-                result_activity = dict_of_classes[act_type](act_refersTo, act_institute, act_technique, act_person,
-                        act_start,
-                        act_end,
-                        act_tool)
-                
-                list_of_activities.append(result_activity)
-            
-            return list_of_activities
+        return self._activitiesFrom("getAcquisitionsByTechnique", partialName)
+
+    @_tracedMethod
+    def getActivitiesInTimeFrame(self, start: str, end: str, types: list[str]|None = None) -> list[Activity]:
+        return self._activitiesFrom("getActivitiesInTimeFrame", start, end, types)
+
+    # The iter* methods stream the activities of the process handlers one chunk at a time: the objects referred by a
+    # chunk are fetched together, the activities are built and yielded, and the next chunk is read only when they
+    # have been consumed. The handlers are read one after the other, without removing the rows found in more than one.
+
+    def _iterActivitiesFrom(self, methodName: str, chunkSize: int, *args):
+        for handler in self.processQuery:
+            try:
+                chunks = getattr(handler, methodName)(*args, chunkSize=chunkSize)
+                if chunks is None:
+                    raise ValueError(f"{methodName} returned no result")
+                for df in chunks:
+                    df = df.fillna('')
+                    yield from self._buildActivities(df, self._objectsFor(df["objectId"]))
+            except Exception as e:
+                self._handlerErrors().append({"handler": handler, "method": methodName, "error": e})
+
+    @_tracedIterator
+    def iterAllActivities(self, chunkSize: int = 1000):
+        return self._iterActivitiesFrom("iterAllActivities", chunkSize)
+
+    @_tracedIterator
+    def iterActivitiesByResponsibleInstitution(self, partialName: str, chunkSize: int = 1000):
+        return self._iterActivitiesFrom("iterActivitiesByResponsibleInstitution", chunkSize, partialName)
+
+    @_tracedIterator
+    def iterActivitiesByResponsiblePerson(self, partialName: str, chunkSize: int = 1000):
+        return self._iterActivitiesFrom("iterActivitiesByResponsiblePerson", chunkSize, partialName)
+
+    @_tracedIterator
+    def iterActivitiesUsingTool(self, partialName: str, chunkSize: int = 1000):
+        return self._iterActivitiesFrom("iterActivitiesUsingTool", chunkSize, partialName)
+
+    @_tracedIterator
+    def iterActivitiesStartedAfter(self, date: str, chunkSize: int = 1000):
+        return self._iterActivitiesFrom("iterActivitiesStartedAfter", chunkSize, date)
+
+    @_tracedIterator
+    def iterActivitiesEndedBefore(self, date: str, chunkSize: int = 1000):
+        return self._iterActivitiesFrom("iterActivitiesEndedBefore", chunkSize, date)
+
+    @_tracedIterator
+    def iterAcquisitionsByTechnique(self, partialName: str, chunkSize: int = 1000):
+        return self._iterActivitiesFrom("iterAcquisitionsByTechnique", chunkSize, partialName)
+
+    @_tracedIterator
+    def iterActivitiesInTimeFrame(self, start: str, end: str, types: list[str]|None = None, chunkSize: int = 1000):
+        return self._iterActivitiesFrom("iterActivitiesInTimeFrame", chunkSize, start, end, types)
 
 class AdvancedMashup(BasicMashup):
     def __init__(self):
         super().__init__()
 
+    # The joins between the two kinds of stores resolve the small side first and send its ids to the other side, as
+    # a VALUES block to the graph databases or a JSON array to the relational ones, so their cost grows with the
+    # size of the result and not with the size of the databases
+
+    @_tracedMethod
     def getActivitiesOnObjectsAuthoredBy(self, personId: str) -> list[Activity]:
         
-        list_of_objects = self.getCulturalHeritageObjectsAuthoredBy(personId)
-        all_activities = self.getAllActivities()
-    
-        object_ids = {obj.getId() for obj in list_of_objects}
-        activities = [act for act in all_activities if act.refersTo().id in object_ids]
-        
-        return activities
+        objects = {obj.getId(): obj for obj in self.getCulturalHeritageObjectsAuthoredBy(personId)}
+        if not objects:
+            return list()
 
+        df = self._collect(self.processQuery, "getActivitiesByObjectIds", list(objects))
+        df.fillna('', inplace=True)
+        if len(df) == 0:
+            return list()
 
-    def getObjectsHandledByResponsiblePerson(self, partialName: str) -> list[CulturalHeritageObject]:
-        
-        activites = self.getActivitiesByResponsiblePerson(partialName)
-        objects = []
+        return self._buildActivities(df, objects)
 
-        for act in activites:
-            object = act.refersTo()
-            if object.id not in [obj.id for obj in objects]:
-                objects.append(object)
+    def _objectsHandledBy(self, methodName: str, partialName: str) -> list[CulturalHeritageObject]:
+        # Only the objectIds of the matching activities are needed, in the order of their first activity
+        df = self._collect(self.processQuery, methodName, partialName)
+        if len(df) == 0:
+            return list()
 
-        return objects
+        ids = list(dict.fromkeys(df["objectId"].astype(str)))
+        objects = self._getObjectsByIds(ids)
+        return [objects[obj_id] for obj_id in ids if obj_id in objects]
 
+    @_tracedMethod
+    def getObjectsHandledByResponsiblePerson(self, partialName: str) -> list[CulturalHeritageObject]:
+        return self._objectsHandledBy("getActivitiesByResponsiblePerson", partialName)
 
+    @_tracedMethod
     def getObjectsHandledByResponsibleInstitution(self, partialName: str) -> list[CulturalHeritageObject]:
+        return self._objectsHandledBy("getActivitiesByResponsibleInstitution", partialName)
+
+    @_tracedMethod
+    def getAuthorsOfObjectsAcquiredInTimeFrame(self, start: str, end: str) -> list[Person]:
         
-        activites = self.getActivitiesByResponsibleInstitution(partialName)
-        objects = []
+        # The whole time frame is filtered by the process handlers; only the ids of the acquired objects are needed
+        df = self._collect(self.processQuery, "getActivitiesInTimeFrame", start, end, ["acquisition"])
+        if len(df) == 0:
+            return list()
 
-        for act in activites:
-            object = act.refersTo()
-            if object.id not in [obj.id for obj in objects]:
-                objects.append(object)
+        unique_authors = {}
+        for authors in self._getAuthorsByObjectIds(df["objectId"]).values():
+            for author in authors:
+                unique_authors.setdefault(author.id, author)
+
+        return list(unique_authors.values())
+
+# ASYNC API
+
+# Async counterparts of the query handlers and of the mashups, with the same method names, for applications running
+# on an event loop. The handlers run the SQLite reads and SPARQL requests of their synchronous handler on an executor
+# (the default one of the loop unless another is given), so the loop is never blocked while the shared SparqlClient
+# keeps bounding the requests in flight to each endpoint. The mashups await all their handlers together and split
+# the objects and authors to fetch into batches that are requested concurrently.
+
+def _asyncQuery(name: str):
+    async def method(self, *args):
+        return await self._run(getattr(self.handler, name), *args)
+    method.__name__ = name
+    return method
+
+class AsyncQueryHandler(object):
+    handlerClass = QueryHandler
+
+    def __init__(self, handler: QueryHandler|None = None, executor=None):
+        if handler is None:
+            handler = self.handlerClass()
+        if not isinstance(handler, self.handlerClass):
+            raise TypeError(f"TypeError: handler must be an instance of {self.handlerClass.__name__} class")
+        self.handler = handler
+        self.executor = executor
+
+    def getHandler(self):
+        return self.handler
+
+    def __getattr__(self, name):
+        # The other methods (setDbPathOrUrl, setCache, close...) are the ones of the synchronous handler
+        if name == "handler":
+            raise AttributeError(name)
+        return getattr(self.handler, name)
+
+    async def _run(self, function, *args):
+        # The context is copied into the worker thread, so that instrumentation events are attributed to the
+        # mashup call awaiting them
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(contextvars.copy_context().run, function, *args))
+
+    getById = _asyncQuery("getById")
+
+class AsyncProcessDataQueryHandler(AsyncQueryHandler):
+    handlerClass = ProcessDataQueryHandler
+
+    getAllActivities = _asyncQuery("getAllActivities")
+    getActivitiesByResponsibleInstitution = _asyncQuery("getActivitiesByResponsibleInstitution")
+    getActivitiesByResponsiblePerson = _asyncQuery("getActivitiesByResponsiblePerson")
+    getActivitiesUsingTool = _asyncQuery("getActivitiesUsingTool")
+    getActivitiesStartedAfter = _asyncQuery("getActivitiesStartedAfter")
+    getActivitiesEndedBefore = _asyncQuery("getActivitiesEndedBefore")
+    getActivitiesByObjectIds = _asyncQuery("getActivitiesByObjectIds")
+    getActivitiesInTimeFrame = _asyncQuery("getActivitiesInTimeFrame")
+    getAcquisitionsByTechnique = _asyncQuery("getAcquisitionsByTechnique")
+
+class AsyncMetadataQueryHandler(AsyncQueryHandler):
+    handlerClass = MetadataQueryHandler
+
+    getAllPeople = _asyncQuery("getAllPeople")
+    getAllCulturalHeritageObjects = _asyncQuery("getAllCulturalHeritageObjects")
+    getAuthorsOfCulturalHeritageObject = _asyncQuery("getAuthorsOfCulturalHeritageObject")
+    getAuthorsOfCulturalHeritageObjects = _asyncQuery("getAuthorsOfCulturalHeritageObjects")
+    getCulturalHeritageObjectsAuthoredBy = _asyncQuery("getCulturalHeritageObjectsAuthoredBy")
+    getCulturalHeritageObjectsByIds = _asyncQuery("getCulturalHeritageObjectsByIds")
+
+class AsyncBasicMashup(BasicMashup):
+    # The builders of BasicMashup are reused as they are; only the fetching is asynchronous. Objects and authors are
+    # always loaded eagerly, since loading them on first access would block the loop.
+    def __init__(self, executor=None):
+        super().__init__()
+        self.executor = executor
+        self.batchSize = 500
 
-        return objects
+    def setLazyLoading(self, lazy: bool) -> bool:
+        return False
 
-    def getAuthorsOfObjectsAcquiredInTimeFrame(self, start: str, end: str) -> list[Person]:
-        
-        activities_after = self.getActivitiesStartedAfter(start)
-        filtered_activities_after = [activity for activity in activities_after if isinstance(activity, Acquisition)]
-
-        ids_of_filtered_objects = set()
-        for act in filtered_activities_after:
-            date = datetime.strptime(act.end, '%Y-%m-%d')
-            if date <= datetime.strptime(end, '%Y-%m-%d'):
-                ids_of_filtered_objects.add(act.refersTo().id)
-        
-        result_list = []
-        all_authors = []
-        for id in ids_of_filtered_objects:
-            authors = self.getAuthorsOfCulturalHeritageObject(id)
-            if authors:
-                all_authors = all_authors + authors
-
-        unique_ids = set()
-        # Iterate over the list in reverse order
-        for i in range(len(all_authors) - 1, -1, -1):
-            author = all_authors[i]
-            if author.id in unique_ids:
-                del all_authors[i]  # Remove duplicate author
+    def addMetadataHandler(self, handler: AsyncMetadataQueryHandler|MetadataQueryHandler) -> bool:
+        if isinstance(handler, MetadataQueryHandler):
+            handler = AsyncMetadataQueryHandler(handler, self.executor)
+        try:
+            if not isinstance(handler, AsyncMetadataQueryHandler):
+                raise TypeError("TypeError: handler must be an instance of AsyncMetadataQueryHandler class")
+
+            self.metadataQuery.append(handler)
+            return True
+        except TypeError as e:
+            print(e)
+            return False
+
+    def addProcessHandler(self, handler: AsyncProcessDataQueryHandler|ProcessDataQueryHandler) -> bool:
+        if isinstance(handler, ProcessDataQueryHandler):
+            handler = AsyncProcessDataQueryHandler(handler, self.executor)
+        try:
+            if not isinstance(handler, AsyncProcessDataQueryHandler):
+                raise TypeError("TypeError: handler must be an instance of AsyncProcessDataQueryHandler class")
+
+            self.processQuery.append(handler)
+            return True
+        except TypeError as e:
+            print(e)
+            return False
+
+    async def _collect(self, handlers: list, methodName: str, *args) -> pd.DataFrame:
+        # All the handlers are awaited together; the timeout set with setConcurrency applies to each of them. As in
+        # BasicMashup._collect, a late call keeps its executor thread until it returns, and its handler is skipped by
+        # the next calls meanwhile, so that a handler that hangs holds at most one thread of the executor
+        tasks = {}
+        for handler in handlers:
+            with self.lock:
+                late = handler in self.lateCalls
+            if not late:
+                tasks[handler] = asyncio.ensure_future(getattr(handler, methodName)(*args))
+        try:
+            if tasks:
+                await asyncio.wait(tasks.values(), timeout=self.handlerTimeout)
+        except asyncio.CancelledError:
+            for handler, task in tasks.items():
+                if not task.done():
+                    self._addLateCall(handler, task)
+            raise
+
+        results = []
+        for handler in handlers:
+            task = tasks.get(handler)
+            if task is None:
+                results.append((handler, TimeoutError(f"{methodName} was not called: an earlier call has not answered yet")))
+            elif not task.done():
+                self._addLateCall(handler, task)
+                results.append((handler, TimeoutError(f"{methodName} did not answer within {self.handlerTimeout} seconds")))
             else:
-                unique_ids.add(author.id)
-                result_list.append(author)
-        
-        return result_list
\ No newline at end of file
+                results.append((handler, task.exception() or task.result()))
+        return self._mergeResults(results, methodName)
+
+    async def _collectBatches(self, methodName: str, ids: list[str]) -> pd.DataFrame:
+        frames = await asyncio.gather(*(self._collect(self.metadataQuery, methodName, chunk)
+                                        for chunk in _iterChunks(ids, self.batchSize)))
+        frames = [df for df in frames if len(df)]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    async def _getObjectsByIds(self, objectIds) -> dict[str, CulturalHeritageObject]:
+        ids = list(dict.fromkeys(str(i) for i in objectIds))
+        if not ids:
+            return dict()
+        return self._objectsFromFrame(await self._collectBatches("getCulturalHeritageObjectsByIds", ids))
+
+    async def _getAuthorsByObjectIds(self, objectIds) -> dict[str, list[Person]]:
+        ids = list(dict.fromkeys(str(i) for i in objectIds))
+        if not ids:
+            return dict()
+        return self._authorsFromFrame(await self._collectBatches("getAuthorsOfCulturalHeritageObjects", ids))
+
+    @_tracedMethod
+    async def getEntityById(self, id: str) -> IdentifiableEntity | None:
+        if ":" in id:
+            df = await self._collect(self.metadataQuery, "getById", id)
+            return Person(id, str(df.loc[0]["name"])) if len(df) else None
+
+        # The object and its authors do not depend on each other and are fetched at the same time
+        df, authors = await asyncio.gather(self._collect(self.metadataQuery, "getById", id),
+                                           self._getAuthorsByObjectIds([id]))
+        if len(df) == 0:
+            return None
+        df['id'] = id
+        return self._buildObjects(df.head(1), authors)[0]
+
+    @_tracedMethod
+    async def getAllPeople(self) -> list[Person]:
+        df = await self._collect(self.metadataQuery, "getAllPeople")
+        return self._buildPeople(df) if len(df) else list()
+
+    @_tracedMethod
+    async def getAllCulturalHeritageObjects(self) -> list[CulturalHeritageObject]:
+        df = await self._collect(self.metadataQuery, "getAllCulturalHeritageObjects")
+        if len(df) == 0:
+            return list()
+        df.drop_duplicates(subset='id', inplace=True, ignore_index=True)
+        return self._buildObjects(df, await self._getAuthorsByObjectIds(df["id"]))
+
+    @_tracedMethod
+    async def getAuthorsOfCulturalHeritageObject(self, objectId: str) -> list[Person]:
+        df = await self._collect(self.metadataQuery, "getAuthorsOfCulturalHeritageObject", objectId)
+        return self._buildPeople(df) if len(df) else list()
+
+    @_tracedMethod
+    async def getCulturalHeritageObjectsAuthoredBy(self, personId: str) -> list[CulturalHeritageObject]:
+        df = await self._collect(self.metadataQuery, "getCulturalHeritageObjectsAuthoredBy", personId)
+        if len(df) == 0:
+            return list()
+        df.drop_duplicates(subset='id', inplace=True, ignore_index=True)
+        return self._buildObjects(df, await self._getAuthorsByObjectIds(df["id"]))
+
+    async def _activitiesFrom(self, methodName: str, *args) -> list[Activity]:
+        df = await self._collect(self.processQuery, methodName, *args)
+        df.fillna('', inplace=True)
+        if len(df) == 0:
+            return list()
+        return self._buildActivities(df, await self._getObjectsByIds(df["objectId"]))
+
+    @_tracedMethod
+    async def getAllActivities(self) -> list[Activity]:
+        return await self._activitiesFrom("getAllActivities")
+
+    @_tracedMethod
+    async def getActivitiesByResponsibleInstitution(self, partialName: str) -> list[Activity]:
+        return await self._activitiesFrom("getActivitiesByResponsibleInstitution", partialName)
+
+    @_tracedMethod
+    async def getActivitiesByResponsiblePerson(self, partialName: str) -> list[Activity]:
+        return await self._activitiesFrom("getActivitiesByResponsiblePerson", partialName)
+
+    @_tracedMethod
+    async def getActivitiesUsingTool(self, partialName: str) -> list[Activity]:
+        return await self._activitiesFrom("getActivitiesUsingTool", partialName)
+
+    @_tracedMethod
+    async def getActivitiesStartedAfter(self, date: str) -> list[Activity]:
+        return await self._activitiesFrom("getActivitiesStartedAfter", date)
+
+    @_tracedMethod
+    async def getActivitiesEndedBefore(self, date: str) -> list[Activity]:
+        return await self._activitiesFrom("getActivitiesEndedBefore", date)
+
+    @_tracedMethod
+    async def getAcquisitionsByTechnique(self, partialName: str) -> list[Acquisition]:
+        return await self._activitiesFrom("getAcquisitionsByTechnique", partialName)
+
+    @_tracedMethod
+    async def getActivitiesInTimeFrame(self, start: str, end: str, types: list[str]|None = None) -> list[Activity]:
+        return await self._activitiesFrom("getActivitiesInTimeFrame", start, end, types)
+
+    # The iter* methods are async generators here: each page or chunk is read on the executor, and its objects or
+    # authors are fetched with the batched coroutines above
+
+    async def _iterHandler(self, handler: AsyncQueryHandler, methodName: str, *args):
+        chunks = getattr(handler.getHandler(), methodName)(*args)
+        if chunks is None:
+            raise ValueError(f"{methodName} returned no result")
+        while True:
+            df = await handler._run(next, chunks, None)
+            if df is None:
+                return
+            yield df
+
+    async def _iterPages(self, methodName: str, pageSize: int):
+        seen = set()
+        for handler in self.metadataQuery:
+            try:
+                async for df in self._iterHandler(handler, methodName, pageSize):
+                    df = df[~df['id'].astype(str).isin(seen)]
+                    if len(df):
+                        seen.update(df['id'].astype(str))
+                        yield df
+            except Exception as e:
+                self._handlerErrors().append({"handler": handler, "method": methodName, "error": e})
+
+    @_tracedIterator
+    async def iterAllPeople(self, pageSize: int = 1000):
+        async for df in self._iterPages("iterAllPeople", pageSize):
+            for person in self._buildPeople(df):
+                yield person
+
+    @_tracedIterator
+    async def iterAllCulturalHeritageObjects(self, pageSize: int = 1000):
+        async for df in self._iterPages("iterAllCulturalHeritageObjects", pageSize):
+            df = df.drop_duplicates(subset='id', ignore_index=True)
+            for obj in self._buildObjects(df, await self._getAuthorsByObjectIds(df["id"])):
+                yield obj
+
+    async def _iterActivitiesFrom(self, methodName: str, chunkSize: int, *args):
+        for handler in self.processQuery:
+            try:
+                async for df in self._iterHandler(handler, methodName, *args, chunkSize):
+                    df = df.fillna('')
+                    for activity in self._buildActivities(df, await self._getObjectsByIds(df["objectId"])):
+                        yield activity
+            except Exception as e:
+                self._handlerErrors().append({"handler": handler, "method": methodName, "error": e})
+
+class AsyncAdvancedMashup(AsyncBasicMashup):
+    @_tracedMethod
+    async def getActivitiesOnObjectsAuthoredBy(self, personId: str) -> list[Activity]:
+        objects = {obj.getId(): obj for obj in await self.getCulturalHeritageObjectsAuthoredBy(personId)}
+        if not objects:
+            return list()
+
+        df = await self._collect(self.processQuery, "getActivitiesByObjectIds", list(objects))
+        df.fillna('', inplace=True)
+        if len(df) == 0:
+            return list()
+
+        return self._buildActivities(df, objects)
+
+    async def _objectsHandledBy(self, methodName: str, partialName: str) -> list[CulturalHeritageObject]:
+        df = await self._collect(self.processQuery, methodName, partialName)
+        if len(df) == 0:
+            return list()
+
+        ids = list(dict.fromkeys(df["objectId"].astype(str)))
+        objects = await self._getObjectsByIds(ids)
+        return [objects[obj_id] for obj_id in ids if obj_id in objects]
+
+    @_tracedMethod
+    async def getObjectsHandledByResponsiblePerson(self, partialName: str) -> list[CulturalHeritageObject]:
+        return await self._objectsHandledBy("getActivitiesByResponsiblePerson", partialName)
+
+    @_tracedMethod
+    async def getObjectsHandledByResponsibleInstitution(self, partialName: str) -> list[CulturalHeritageObject]:
+        return await self._objectsHandledBy("getActivitiesByResponsibleInstitution", partialName)
+
+    @_tracedMethod
+    async def getAuthorsOfObjectsAcquiredInTimeFrame(self, start: str, end: str) -> list[Person]:
+        df = await self._collect(self.processQuery, "getActivitiesInTimeFrame", start, end, ["acquisition"])
+        if len(df) == 0:
+            return list()
+
+        unique_authors = {}
+        for authors in (await self._getAuthorsByObjectIds(df["objectId"])).values():
+            for author in authors:
+                unique_authors.setdefault(author.id, author)
+
+        return list(unique_authors.values())
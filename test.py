@@ -13,15 +13,31 @@
 # ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS
 # SOFTWARE.
 import unittest
+import re
+import os
+import shutil
+import tempfile
+import asyncio
+import socket
+import threading
+import time
 from os import sep
-from pandas import DataFrame
+from pandas import DataFrame, read_csv, concat
+from rdflib import Graph, URIRef, Literal, RDF
 from impl import MetadataUploadHandler, ProcessDataUploadHandler, MetadataQueryHandler, ProcessDataQueryHandler
-from impl import AdvancedMashup
+from impl import AdvancedMashup, QueryCache, Instrumentation, QueryStats, SparqlClient
+from impl import AsyncAdvancedMashup, AsyncMetadataQueryHandler, AsyncProcessDataQueryHandler
+from benchmark import LocalSparqlEndpoint, generateDataset
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 from impl import Person, CulturalHeritageObject, Activity, Acquisition
+from impl import _iterJsonArray
 
 # REMEMBER: before launching the tests, please run the Blazegraph instance!
 
-class TestProjectBasic(unittest.TestCase):
+class ProjectTestCase(unittest.TestCase):
 
     # The paths of the files used in the test should change depending on what you want to use
     # and the folder where they are. Instead, for the graph database, the URL to talk with
@@ -32,7 +48,27 @@ class TestProjectBasic(unittest.TestCase):
     process = "data" + sep + "process.json"
     relational = "." + sep + "relational.db"
     graph = "http://127.0.0.1:9999/blazegraph/sparql"
-    
+
+    @classmethod
+    def setUpClass(cls):
+        # The tests run in a temporary directory, on a copy of relational.db, so that neither the database nor the
+        # Graph_db.ttl written by the graph uploads are changed in the working tree
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.cwd = os.getcwd()
+        cls.metadata, cls.process = os.path.abspath(cls.metadata), os.path.abspath(cls.process)
+        if os.path.exists(cls.relational):
+            shutil.copy(cls.relational, cls.directory.name)
+        cls.relational = cls.directory.name + sep + "relational.db"
+        os.chdir(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        cls.directory.cleanup()
+
+class TestProjectBasic(ProjectTestCase):
+    # The original tests, which share the database of the class
+
     def test_01_MetadataUploadHandler(self):
         u = MetadataUploadHandler()
         self.assertTrue(u.setDbPathOrUrl(self.graph))
@@ -161,4 +197,802 @@ class TestProjectBasic(unittest.TestCase):
         r = am.getAuthorsOfObjectsAcquiredInTimeFrame("1088-01-01", "2029-01-01")
         self.assertIsInstance(r, list)
         for i in r:
-            self.assertIsInstance(i, Person)   
+            self.assertIsInstance(i, Person)
+
+class TestProjectExtensions(ProjectTestCase):
+    # Each of these tests gets a copy of the database of its own, in a directory of its own
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        if os.path.exists(self.relational):
+            shutil.copy(self.relational, directory.name)
+        self.relational = directory.name + sep + "relational.db"
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory.name)
+
+    def uploadProcess(self) -> ProcessDataUploadHandler:
+        u = ProcessDataUploadHandler()
+        self.assertTrue(u.setDbPathOrUrl(self.relational))
+        self.assertTrue(u.pushDataToDb(self.process))
+        return u
+
+    def uploadMetadata(self, graph: str = "graph.ttl") -> str:
+        # meta.csv in a local RDF file, in the directory of the test
+        m = MetadataUploadHandler()
+        self.assertTrue(m.setDbPathOrUrl(graph))
+        self.assertTrue(m.pushDataToDb(self.metadata))
+        return graph
+
+    def mashup(self, qm: MetadataQueryHandler|None = None, qp: ProcessDataQueryHandler|None = None):
+        # Both datasets uploaded, and an AdvancedMashup on a handler of each (new ones unless given)
+        self.uploadProcess()
+        graph = self.uploadMetadata()
+        qm = MetadataQueryHandler() if qm is None else qm
+        qm.setDbPathOrUrl(graph)
+        qp = ProcessDataQueryHandler() if qp is None else qp
+        qp.setDbPathOrUrl(self.relational)
+        self.addCleanup(qp.close)
+        am = AdvancedMashup()
+        am.addMetadataHandler(qm)
+        am.addProcessHandler(qp)
+        return am, qm, qp
+
+    def test_06_QueryCache(self):
+        c = QueryCache(maxSize=2, ttl=60)
+        q = ProcessDataQueryHandler()
+        self.assertTrue(q.setDbPathOrUrl(self.relational))
+        self.assertTrue(q.setCache(c))
+        self.assertEqual(q.getCache(), c)
+
+        self.assertIsInstance(q.getAllActivities(), DataFrame)
+        self.assertIsInstance(q.getAllActivities(), DataFrame)
+        self.assertEqual(c.getHits(), 1)
+        self.assertEqual(c.getMisses(), 1)
+
+        q.getActivitiesUsingTool("just_a_test")
+        q.getActivitiesByResponsiblePerson("just_a_test")
+        self.assertEqual(c.getSize(), 2)
+
+        u = ProcessDataUploadHandler()
+        u.setDbPathOrUrl(self.relational)
+        u.pushDataToDb(self.process)
+        self.assertEqual(c.getSize(), 0)
+
+    def test_07_SearchIndex(self):
+        # The same data with and without the full-text index: every lookup must return the same rows
+        shutil.copy(self.relational, "plain.db")
+        handlers = []
+        for path, searchIndex in [(self.relational, True), ("plain.db", False)]:
+            u = ProcessDataUploadHandler()
+            self.assertTrue(u.setDbPathOrUrl(path))
+            self.assertTrue(u.setSearchIndex(searchIndex))
+            self.assertTrue(u.setUpsert(True))
+            self.assertTrue(u.pushDataToDb(self.process))
+            self.assertEqual(u.getLastReport()["searchIndex"], searchIndex)
+            q = ProcessDataQueryHandler()
+            q.setDbPathOrUrl(path)
+            q.setCache(None)
+            handlers.append((u, q))
+        (indexed_upload, indexed), (plain_upload, plain) = handlers
+
+        def rows(df):
+            return sorted(map(tuple, df.astype(str).values.tolist()))
+
+        def assertSameRows(terms):
+            for term in terms:
+                for method in ["getActivitiesByResponsibleInstitution", "getActivitiesByResponsiblePerson",
+                               "getActivitiesUsingTool", "getAcquisitionsByTechnique"]:
+                    expected = getattr(plain, method)(term)
+                    result = getattr(indexed, method)(term)
+                    self.assertEqual(list(result.columns), list(expected.columns), (method, term))
+                    self.assertEqual(rows(result), rows(expected), (method, term))
+
+        terms = ["Council", "Alice", "Zephyr", "Photogrammetry", "cOUNcIL", "aLiCe lid", "co", "Z", "",
+                 "%", "_", "Co%il", "Ali_e", "100%", "just_a_test"]
+        assertSameRows(terms)
+        self.assertGreater(len(indexed.getActivitiesByResponsibleInstitution("Council")), 0)
+        self.assertGreater(len(indexed.getActivitiesByResponsibleInstitution("cOUNcIL")), 0)
+
+        # The index follows the rows changed by an upsert
+        import json
+        with open(self.process, encoding="utf-8") as f:
+            records = json.load(f)
+        records[0]["acquisition"]["responsible institute"] = "Renamed 100% Institute"
+        with open("changed.json", mode="w", encoding="utf-8") as f:
+            json.dump(records, f)
+        for u, q in handlers:
+            self.assertTrue(u.pushDataToDb("changed.json"))
+        self.assertGreater(indexed_upload.getLastReport()["updated"], 0)
+        assertSameRows(terms + ["Renamed", "100%", "0% I"])
+        self.assertEqual(len(indexed.getActivitiesByResponsibleInstitution("0% I")), 1)
+
+    def test_08_ConnectionPool(self):
+        self.uploadProcess()
+
+        with ProcessDataQueryHandler() as q:
+            q.setDbPathOrUrl(self.relational)
+            self.assertTrue(q.setPoolSize(2))
+            self.assertFalse(q.setPoolSize(-1))
+            q.setCache(None)
+            self.assertIsInstance(q.getAllActivities(), DataFrame)
+            self.assertEqual(len(q.pool), 1)
+            connection = q.pool[0]
+            self.assertIsInstance(q.getActivitiesStartedAfter("1088-01-01"), DataFrame)
+            self.assertIs(q.pool[0], connection)
+        self.assertEqual(q.pool, [])
+
+    def test_09_BulkUpload(self):
+        for singleTransaction in [False, True]:
+            with LocalSparqlEndpoint() as endpoint:
+                u = MetadataUploadHandler()
+                self.assertTrue(u.setDbPathOrUrl(endpoint.getUrl()))
+                self.assertTrue(u.setBatchSize(50))
+                self.assertFalse(u.setBatchSize(0))
+                self.assertTrue(u.setSingleTransaction(singleTransaction))
+                self.assertTrue(u.pushDataToDb(self.metadata))
+
+                report = u.getLastReport()
+                self.assertEqual(report["triples"], len(endpoint.graph))
+                self.assertEqual(report["batches"], -(-report["triples"] // 50))
+                self.assertEqual(report["requests"], 1 if singleTransaction else report["batches"])
+
+                q = MetadataQueryHandler()
+                q.setDbPathOrUrl(endpoint.getUrl())
+                self.assertEqual(len(q.getAllCulturalHeritageObjects()), 35)
+
+    def test_10_MetadataUpsert(self):
+        with LocalSparqlEndpoint() as endpoint:
+            u = MetadataUploadHandler()
+            self.assertTrue(u.setDbPathOrUrl(endpoint.getUrl()))
+            self.assertTrue(u.setUpsert(True))
+            self.assertTrue(u.pushDataToDb(self.metadata))
+            self.assertEqual(u.getLastReport()["changedObjects"], 35)
+            triples = set(endpoint.graph)
+
+            # Loading the same file again changes nothing
+            self.assertTrue(u.pushDataToDb(self.metadata))
+            self.assertEqual(u.getLastReport()["unchangedObjects"], 35)
+            self.assertEqual(u.getLastReport()["triples"], 0)
+            self.assertEqual(set(endpoint.graph), triples)
+
+    def test_11_ProcessDataUpsert(self):
+        u = ProcessDataUploadHandler()
+        self.assertTrue(u.setDbPathOrUrl(self.relational))
+        self.assertTrue(u.setUpsert(True))
+        self.assertFalse(u.setUpsert("yes"))
+        self.assertTrue(u.pushDataToDb(self.process))
+        self.assertTrue(u.pushDataToDb(self.process))
+
+        # Loading the same file again changes nothing
+        report = u.getLastReport()
+        self.assertEqual(report["records"] * 5, report["unchanged"])
+        self.assertEqual(report["inserted"], 0)
+        self.assertEqual(report["updated"], 0)
+
+    def test_12_LocalGraphFile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            graph = directory + sep + "graph.ttl"
+            u = MetadataUploadHandler()
+            self.assertTrue(u.setDbPathOrUrl(graph))
+            self.assertTrue(u.pushDataToDb(self.metadata))
+
+            q = MetadataQueryHandler()
+            self.assertTrue(q.setDbPathOrUrl(graph))
+            self.assertEqual(len(q.getAllCulturalHeritageObjects()), 35)
+            self.assertEqual(len(q.getById("VIAF:78822798")), 1)
+            self.assertFalse(q.setDbPathOrUrl(directory + sep + "graph.csv"))
+
+            # Each handler only takes the kinds of local files it can use
+            self.assertFalse(q.setDbPathOrUrl(directory + sep + "process.parquet"))
+            self.assertFalse(ProcessDataUploadHandler().setDbPathOrUrl(graph))
+            self.assertFalse(ProcessDataUploadHandler().setDbPathOrUrl(directory + sep + "process.parquet"))
+            self.assertFalse(ProcessDataQueryHandler().setDbPathOrUrl(graph))
+            self.assertTrue(ProcessDataQueryHandler().setDbPathOrUrl(directory + sep + "process.parquet"))
+            self.assertFalse(MetadataUploadHandler().setDbPathOrUrl(directory + sep + "process.parquet"))
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_13_ParquetSnapshot(self):
+        u = self.uploadProcess()
+
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot = directory + sep + "process.parquet"
+            q = ProcessDataQueryHandler()
+            q.setDbPathOrUrl(self.relational)
+            self.assertFalse(q.exportToParquet(directory + sep + "process"))
+            self.assertTrue(q.exportToParquet(snapshot))
+
+            p = ProcessDataQueryHandler()
+            self.assertTrue(p.setDbPathOrUrl(snapshot))
+            self.assertEqual(len(p.getAllActivities()), len(q.getAllActivities()))
+            self.assertEqual(len(p.getActivitiesStartedAfter("2023-06-01")), len(q.getActivitiesStartedAfter("2023-06-01")))
+            self.assertEqual(list(p.getAcquisitionsByTechnique("just_a_test").columns),
+                             list(q.getAcquisitionsByTechnique("just_a_test").columns))
+            self.assertEqual(len(p.getActivitiesInTimeFrame("2023-04-01", "2023-06-10", ["acquisition"])),
+                             len(q.getActivitiesInTimeFrame("2023-04-01", "2023-06-10", ["acquisition"])))
+            self.assertEqual(len(p.getActivitiesByObjectIds(["1", "2", "just_a_test"])),
+                             len(q.getActivitiesByObjectIds(["1", "2", "just_a_test"])))
+
+        # Object ids stored as text are exported too, and the partial names are LIKE patterns on both backends
+        import json
+        with open(self.process, encoding="utf-8") as f:
+            records = json.load(f)[:1]
+        records[0]["object id"] = "A-12"
+        records[0]["acquisition"]["responsible institute"] = "Council 100%_off"
+        with open("text_ids.json", mode="w", encoding="utf-8") as f:
+            json.dump(records, f)
+        self.assertTrue(u.pushDataToDb("text_ids.json"))
+
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot = directory + sep + "process.parquet"
+            q = ProcessDataQueryHandler()
+            q.setDbPathOrUrl(self.relational)
+            self.assertTrue(q.exportToParquet(snapshot))
+            p = ProcessDataQueryHandler()
+            self.assertTrue(p.setDbPathOrUrl(snapshot))
+
+            def rows(df):
+                return sorted(map(tuple, df.astype(str).values.tolist()))
+
+            self.assertEqual(list(p.getActivitiesEndedBefore("9999")["objectId"]),
+                             list(q.getActivitiesEndedBefore("9999")["objectId"]))
+            self.assertEqual(rows(p.getAllActivities()), rows(q.getAllActivities()))
+            self.assertEqual(list(p.getActivitiesByObjectIds(["A-12", "1"])["objectId"]),
+                             list(q.getActivitiesByObjectIds(["A-12", "1"])["objectId"]))
+            self.assertEqual(len(p.getActivitiesByObjectIds(["A-12"])), 5)
+            for term in ["cOUNcil", "%", "_", "0%_", "Co%il", "Ali_e", "\\", "just_a_test"]:
+                self.assertEqual(rows(p.getActivitiesByResponsibleInstitution(term)),
+                                 rows(q.getActivitiesByResponsibleInstitution(term)), term)
+                self.assertEqual(rows(p.getAcquisitionsByTechnique(term)), rows(q.getAcquisitionsByTechnique(term)), term)
+            self.assertEqual(len(p.getActivitiesByResponsibleInstitution("0%_")), 1)
+            streamed = concat(p.iterAllActivities(7))
+            self.assertEqual(rows(streamed), rows(q.getAllActivities()))
+
+    def test_14_TimeFrame(self):
+        self.uploadProcess()
+
+        q = ProcessDataQueryHandler()
+        q.setDbPathOrUrl(self.relational)
+        started = q.getActivitiesStartedAfter("2023-04-01")
+        expected = started[(started["end date"] != "") & (started["end date"] <= "2023-06-10")]
+        result = q.getActivitiesInTimeFrame("2023-04-01", "2023-06-10")
+        self.assertEqual(sorted(result["activityId"]), sorted(expected["activityId"]))
+        acquisitions = q.getActivitiesInTimeFrame("2023-04-01", "2023-06-10", ["Acquisition"])
+        self.assertTrue(all(acquisitions["activityId"].str.startswith("acquisition-")))
+        self.assertIsNone(q.getActivitiesInTimeFrame("2023-04-01", "June"))
+        self.assertIsNone(q.getActivitiesInTimeFrame("2023-04-01", "2023-06-10", ["restoration"]))
+
+    def test_15_JoinPushdown(self):
+        am, qm, q = self.mashup()
+        result = q.getActivitiesByObjectIds(["1", "2", "just_a_test"])
+        self.assertIsInstance(result, DataFrame)
+        self.assertEqual(set(result["objectId"].astype(str)), {"1", "2"})
+        self.assertEqual(len(result), 10)
+        self.assertEqual(len(q.getActivitiesByObjectIds([])), 0)
+
+        # Ids that are not numbers are looked up as text, not dropped
+        import json
+        with open(self.process, encoding="utf-8") as f:
+            records = json.load(f)[:1]
+        records[0]["object id"] = "A-12"
+        with open("text_ids.json", mode="w", encoding="utf-8") as f:
+            json.dump(records, f)
+        u = ProcessDataUploadHandler()
+        self.assertTrue(u.setDbPathOrUrl(self.relational))
+        self.assertTrue(u.pushDataToDb("text_ids.json"))
+        result = q.getActivitiesByObjectIds(["A-12", "1"])
+        self.assertEqual(sorted(result["objectId"].astype(str).unique()), ["1", "A-12"])
+        self.assertEqual(len(result), 10)
+
+        objects = {o.getId() for o in am.getCulturalHeritageObjectsAuthoredBy("VIAF:78822798")}
+        activities = am.getActivitiesOnObjectsAuthoredBy("VIAF:78822798")
+        self.assertTrue(activities)
+        self.assertEqual({a.refersTo().getId() for a in activities}, objects)
+        handled = am.getObjectsHandledByResponsiblePerson("a")
+        self.assertEqual(len(handled), len({o.getId() for o in handled}))
+
+    def test_16_GeneratedDataset(self):
+        with tempfile.TemporaryDirectory() as directory:
+            meta, process = generateDataset(directory, 50)
+            u = ProcessDataUploadHandler()
+            self.assertTrue(u.setDbPathOrUrl(directory + sep + "relational.db"))
+            self.assertTrue(u.pushDataToDb(process))
+            self.assertEqual(u.getLastReport()["records"], 50)
+
+            graph = directory + sep + "graph.ttl"
+            m = MetadataUploadHandler()
+            self.assertTrue(m.setDbPathOrUrl(graph))
+            self.assertTrue(m.pushDataToDb(meta))
+            q = MetadataQueryHandler()
+            q.setDbPathOrUrl(graph)
+            self.assertEqual(len(q.getAllCulturalHeritageObjects().drop_duplicates(subset="id")), 50)
+
+    def test_17_Instrumentation(self):
+        am, _, qp = self.mashup()
+
+        stats, events = QueryStats(), []
+        self.assertFalse(Instrumentation.addListener("not a function"))
+        self.assertTrue(Instrumentation.addListener(stats))
+        self.assertTrue(Instrumentation.addListener(events.append))
+        try:
+            am.getActivitiesOnObjectsAuthoredBy("VIAF:78822798")
+            am.getAllActivities()
+            streamed = list(am.iterActivitiesUsingTool("Blender", 25))
+        finally:
+            self.assertTrue(Instrumentation.removeListener(stats))
+            self.assertTrue(Instrumentation.removeListener(events.append))
+        qp.close()
+        self.assertEqual(Instrumentation.listeners, ())
+
+        report = stats.getReport()
+        self.assertEqual(report["AdvancedMashup.getActivitiesOnObjectsAuthoredBy"]["calls"], 1)
+        self.assertGreater(report["AdvancedMashup.getActivitiesOnObjectsAuthoredBy"]["roundTripsPerCall"], 1)
+        self.assertEqual(len([e for e in events if e["kind"] == "sqlite" and e["event"] == "end"
+                              and e["call"] != "AdvancedMashup.iterActivitiesUsingTool"]), 2)
+
+        # A streamed call ends with the generator, and counts the chunks read and the objects fetched for them
+        end = [e for e in events if e["name"] == "AdvancedMashup.iterActivitiesUsingTool" and e["event"] == "end"]
+        self.assertEqual(len(end), 1)
+        self.assertEqual(end[0]["rows"], len(streamed))
+        chunks = [e for e in events if e["kind"] == "sqlite" and e["event"] == "end" and e["callId"] == end[0]["callId"]]
+        self.assertEqual([e["rows"] for e in chunks], [25, 25, 11, None])
+        self.assertGreater(end[0]["roundTrips"], len(chunks))
+        self.assertTrue(all(e["queryHash"] for e in events if e["kind"] == "sparql"))
+        self.assertEqual(len(events), len([e for e in events if e["event"] == "start"]) * 2)
+
+    def test_18_SparqlClient(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from sparql_dataframe import get
+        with LocalSparqlEndpoint() as endpoint:
+            u = MetadataUploadHandler()
+            self.assertTrue(u.setDbPathOrUrl(endpoint.getUrl()))
+            self.assertTrue(u.pushDataToDb(self.metadata))
+            connections, requests = endpoint.connections, endpoint.requests
+
+            # The queries share one kept-alive connection
+            q = MetadataQueryHandler()
+            q.setDbPathOrUrl(endpoint.getUrl())
+            for _ in range(5):
+                self.assertEqual(len(q.getAllPeople()), len(q.getAllPeople()))
+            self.assertEqual(endpoint.requests - requests, 10)
+            self.assertLessEqual(endpoint.connections - connections, 1)
+
+            # Same frames as sparql_dataframe, columns and types included
+            query = "SELECT ?s ?p ?o WHERE { ?s ?p ?o } ORDER BY ?s ?p ?o"
+            client = SparqlClient.forEndpoint(endpoint.getUrl())
+            self.assertTrue(client.select(query).equals(get(endpoint.getUrl(), query, True)))
+
+            self.assertFalse(client.setMaxConnections(0))
+            self.assertTrue(client.setMaxConnections(2))
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                frames = list(executor.map(lambda _: client.select(query), range(16)))
+            self.assertTrue(all(len(df) == len(frames[0]) for df in frames))
+            self.assertLessEqual(endpoint.connections - connections, 2)
+
+            with self.assertRaises(ValueError):
+                client.select("SELECT WHERE {")
+            SparqlClient.closeAll()
+
+    def test_19_AsyncMashup(self):
+        sm, _, qp = self.mashup()
+        qm = AsyncMetadataQueryHandler()
+        self.assertTrue(qm.setDbPathOrUrl("graph.ttl"))
+        am = AsyncAdvancedMashup()
+        self.assertTrue(am.addMetadataHandler(qm))
+        self.assertTrue(am.addProcessHandler(qp))
+        self.assertFalse(am.addProcessHandler(qm))
+
+        async def run():
+            return await asyncio.gather(am.getAllCulturalHeritageObjects(), am.getAllActivities(),
+                                        am.getEntityById("VIAF:78822798"), am.getEntityById("1"),
+                                        am.getActivitiesOnObjectsAuthoredBy("VIAF:78822798"),
+                                        am.getAuthorsOfObjectsAcquiredInTimeFrame("2023-04-01", "2023-06-10"))
+
+        objects, activities, person, entity, authored, authors = asyncio.run(run())
+        self.assertEqual(sorted(o.getId() for o in objects), sorted(o.getId() for o in sm.getAllCulturalHeritageObjects()))
+        self.assertEqual(len(activities), len(sm.getAllActivities()))
+        self.assertIsInstance(person, Person)
+        self.assertIsInstance(entity, CulturalHeritageObject)
+        self.assertEqual([a.getId() for a in entity.getAuthors()], [a.getId() for a in sm.getEntityById("1").getAuthors()])
+        self.assertEqual(len(authored), len(sm.getActivitiesOnObjectsAuthoredBy("VIAF:78822798")))
+        self.assertEqual(sorted(a.getId() for a in authors),
+                         sorted(a.getId() for a in sm.getAuthorsOfObjectsAcquiredInTimeFrame("2023-04-01", "2023-06-10")))
+
+    def test_20_Pagination(self):
+        with LocalSparqlEndpoint() as endpoint, tempfile.TemporaryDirectory() as directory:
+            graph = directory + sep + "graph.ttl"
+            for target in [endpoint.getUrl(), graph]:
+                m = MetadataUploadHandler()
+                self.assertTrue(m.setDbPathOrUrl(target))
+                self.assertTrue(m.pushDataToDb(self.metadata))
+
+            # Keyset pages from the endpoint, in the order of the IRIs, pages of the full result from the local file
+            for target in [endpoint.getUrl(), graph]:
+                q = MetadataQueryHandler()
+                q.setDbPathOrUrl(target)
+                ordered = sorted if target == endpoint.getUrl() else list
+                pages = list(q.iterAllPeople(5))
+                self.assertTrue(all(len(page) <= 5 for page in pages))
+                people = q.getAllPeople()
+                self.assertEqual(sorted(row for page in pages for row in page["id"]), sorted(people["id"]))
+                entities = [entity for page in pages for entity in page["entity"]]
+                self.assertEqual(entities, ordered(people["entity"]))
+
+                pages = list(q.iterAllCulturalHeritageObjects(10))
+                self.assertEqual(len(pages), 4)
+                self.assertEqual(list(pages[0].columns), list(q.getAllCulturalHeritageObjects().columns))
+                self.assertEqual([entity for page in pages for entity in page["entity"].drop_duplicates()],
+                                 ordered(q.getAllCulturalHeritageObjects()["entity"].drop_duplicates()))
+                self.assertEqual(sorted(map(tuple, concat(pages).fillna("").values.tolist())),
+                                 sorted(map(tuple, q.getAllCulturalHeritageObjects().fillna("").values.tolist())))
+                self.assertEqual(list(q.iterAllPeople(0)), [])
+
+            # An object without an owner is left out of its page as it is of getAll, and the later pages still come
+            metadata = read_csv(self.metadata, keep_default_na=False, dtype=str)
+            metadata.loc[3, "Owner"] = ""
+            metadata.to_csv(directory + sep + "sparse.csv", index=False)
+            with LocalSparqlEndpoint() as sparse:
+                m = MetadataUploadHandler()
+                self.assertTrue(m.setDbPathOrUrl(sparse.getUrl()))
+                self.assertTrue(m.pushDataToDb(directory + sep + "sparse.csv"))
+                s = MetadataQueryHandler()
+                s.setDbPathOrUrl(sparse.getUrl())
+                full = s.getAllCulturalHeritageObjects()
+                self.assertEqual(full["id"].nunique(), 34)
+                pages = list(s.iterAllCulturalHeritageObjects(5))
+                self.assertEqual(sorted(concat(pages)["id"].unique()), sorted(full["id"].unique()))
+
+            am = AdvancedMashup()
+            am.addMetadataHandler(q)
+            am.addMetadataHandler(q)
+            self.assertEqual([p.getId() for p in am.iterAllPeople(3)], [p.getId() for p in am.getAllPeople()])
+            objects = list(am.iterAllCulturalHeritageObjects(7))
+            self.assertEqual(len(objects), 35)
+            self.assertEqual([a.getId() for a in objects[0].getAuthors()],
+                             [a.getId() for a in am.getAllCulturalHeritageObjects()[0].getAuthors()])
+
+    def test_21_Streaming(self):
+        am, _, qp = self.mashup()
+        chunks = list(qp.iterAllActivities(20))
+        self.assertTrue(all(len(chunk) <= 20 for chunk in chunks))
+        self.assertEqual(sorted(id for chunk in chunks for id in chunk["activityId"]),
+                         sorted(qp.getAllActivities()["activityId"]))
+        self.assertEqual(list(qp.iterAllActivities(0)), [])
+
+        key = lambda a: (type(a).__name__, a.refersTo().getId(), sorted(a.getTools()))
+        streamed = list(am.iterActivitiesUsingTool("Blender", 7))
+        self.assertEqual(len(streamed), 61)
+        self.assertEqual(sorted(map(key, streamed)), sorted(map(key, am.getActivitiesUsingTool("Blender"))))
+        self.assertEqual(len(list(am.iterActivitiesInTimeFrame("2023-04-01", "2023-06-10", ["acquisition"]))),
+                         len(am.getActivitiesInTimeFrame("2023-04-01", "2023-06-10", ["acquisition"])))
+
+    def test_22_ParallelUpload(self):
+        graphs = []
+        for workers in [1, 3]:
+            with LocalSparqlEndpoint() as endpoint:
+                u = MetadataUploadHandler()
+                self.assertTrue(u.setDbPathOrUrl(endpoint.getUrl()))
+                self.assertTrue(u.setWorkers(workers))
+                self.assertFalse(u.setWorkers(0))
+                self.assertEqual(u.getWorkers(), workers)
+                self.assertTrue(u.pushDataToDb(self.metadata))
+                self.assertEqual(u.getLastReport()["triples"], len(endpoint.graph))
+                graphs.append(set(endpoint.graph))
+
+                # The objects and persons get the same ids as in a serial upload
+                q = MetadataQueryHandler()
+                q.setDbPathOrUrl(endpoint.getUrl())
+                self.assertEqual(len(q.getAllCulturalHeritageObjects()), 35)
+                self.assertEqual(set(Graph().parse("Graph_db.ttl")), graphs[-1])
+                os.remove("Graph_db.ttl")
+        self.assertEqual(graphs[0], graphs[1])
+
+        # A failed parallel upload does not log the statements it did not send, as a failed serial one does not
+        import benchmark
+        applyUpdate = benchmark._applyUpdate
+        def failingUpdate(graph, update):
+            raise ValueError("update refused")
+        benchmark._applyUpdate = failingUpdate
+        try:
+            for workers in [1, 3]:
+                with LocalSparqlEndpoint() as endpoint:
+                    u = MetadataUploadHandler()
+                    self.assertTrue(u.setDbPathOrUrl(endpoint.getUrl()))
+                    self.assertTrue(u.setWorkers(workers))
+                    self.assertFalse(u.pushDataToDb(self.metadata))
+                    self.assertFalse(os.path.exists("Graph_db.ttl"))
+        finally:
+            benchmark._applyUpdate = applyUpdate
+
+    def test_23_SparqlClientRefused(self):
+        # A port nobody listens on: every connection is refused
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        client = SparqlClient(f"http://127.0.0.1:{port}/sparql", timeout=5)
+        for _ in range(client.getMaxConnections() + 2):
+            with self.assertRaises(OSError):
+                client.select("SELECT * WHERE { ?s ?p ?o }")
+        self.assertEqual(client.active, 0)
+
+    def test_24_HandlerErrors(self):
+        release = threading.Event()
+
+        class SlowHandler(ProcessDataQueryHandler):
+            def getAllActivities(self):
+                release.wait(10)
+                return DataFrame()
+
+        class FailingHandler(ProcessDataQueryHandler):
+            def getAllActivities(self):
+                raise ValueError("broken handler")
+
+        am, qm, qp = self.mashup()
+        slow, failing = SlowHandler(), FailingHandler()
+        expected = len(am.getAllActivities())
+        am.addProcessHandler(slow)
+        am.addProcessHandler(failing)
+        self.assertTrue(am.setConcurrency(3, 0.5))
+
+        threads = threading.active_count()
+        try:
+            for _ in range(4):
+                # The partial result of the working handler, and only the errors of this call
+                self.assertEqual(len(am.getAllActivities()), expected)
+                errors = am.getHandlerErrors()
+                self.assertEqual([error["handler"] for error in errors], [slow, failing])
+                self.assertTrue(all(error["method"] == "getAllActivities" for error in errors))
+                self.assertIsInstance(errors[0]["error"], TimeoutError)
+                self.assertIsInstance(errors[1]["error"], ValueError)
+
+            # The hanging handler holds one thread, not one per call
+            self.assertEqual(list(am.lateCalls), [slow])
+            for _ in range(50):
+                if threading.active_count() - threads <= 1:
+                    break
+                time.sleep(0.05)
+            self.assertLessEqual(threading.active_count() - threads, 1)
+        finally:
+            release.set()
+
+        # The same on an event loop, where each call, even among gathered ones, gets the errors of its own handlers
+        release.clear()
+        am = AsyncAdvancedMashup()
+        am.addMetadataHandler(qm)
+        am.addProcessHandler(AsyncProcessDataQueryHandler(qp))
+        am.addProcessHandler(AsyncProcessDataQueryHandler(slow))
+        am.addProcessHandler(failing)
+        self.assertTrue(am.setConcurrency(3, 0.5))
+
+        async def call(methodName, *args):
+            result = await getattr(am, methodName)(*args)
+            return result, am.getHandlerErrors()
+
+        async def run():
+            try:
+                results = []
+                for _ in range(4):
+                    results.append(await call("getAllActivities"))
+                late = list(am.lateCalls)
+                gathered = await asyncio.gather(call("getAllActivities"), call("getActivitiesStartedAfter", "1088-01-01"))
+                return results, late, gathered
+            finally:
+                release.set()
+
+        threads = threading.active_count()
+        results, late, gathered = asyncio.run(run())
+        for activities, errors in results:
+            self.assertEqual(len(activities), expected)
+            self.assertEqual([error["handler"].getHandler() for error in errors], [slow, failing])
+            self.assertIsInstance(errors[0]["error"], TimeoutError)
+            self.assertIsInstance(errors[1]["error"], ValueError)
+        self.assertEqual([handler.getHandler() for handler in late], [slow])
+        self.assertLessEqual(threading.active_count() - threads, 1)
+        (activities, errors), (started, started_errors) = gathered
+        self.assertEqual(len(activities), expected)
+        self.assertEqual([error["handler"].getHandler() for error in errors], [slow, failing])
+        self.assertTrue(all(error["method"] == "getAllActivities" for error in errors))
+        self.assertEqual([error["handler"].getHandler() for error in started_errors], [slow, failing])
+        self.assertTrue(all(error["method"] == "getActivitiesStartedAfter" for error in started_errors))
+
+    def test_25_JournalMode(self):
+        import sqlite3
+        with tempfile.TemporaryDirectory() as directory:
+            for writeAheadLog, mode in [(False, "delete"), (True, "wal")]:
+                database = directory + sep + f"{mode}.db"
+                u = ProcessDataUploadHandler()
+                self.assertTrue(u.setDbPathOrUrl(database))
+                self.assertTrue(u.setWriteAheadLog(writeAheadLog))
+                self.assertFalse(u.setWriteAheadLog("yes"))
+                self.assertTrue(u.pushDataToDb(self.process))
+                con = sqlite3.connect(database)
+                self.assertEqual(con.execute("PRAGMA journal_mode").fetchone()[0], mode)
+                con.close()
+
+    def test_26_BatchedHydration(self):
+        calls = []
+
+        class CountingHandler(MetadataQueryHandler):
+            def getCulturalHeritageObjectsByIds(self, objectIds, batchSize=500):
+                calls.append(len(objectIds))
+                return super().getCulturalHeritageObjectsByIds(objectIds, batchSize)
+
+        am, qm, qp = self.mashup(CountingHandler())
+
+        # All the objects of the activities are fetched by one batched query
+        activities = am.getAllActivities()
+        self.assertEqual(len(activities), len(qp.getAllActivities()))
+        self.assertEqual(len(calls), 1)
+
+        # and are the same as the ones fetched one by one
+        describe = lambda o: (type(o), o.getId(), o.getTitle(), o.getOwner(), o.getPlace(), o.getDate(),
+                              [(a.getId(), a.getName()) for a in o.getAuthors()])
+        for activity in activities:
+            self.assertEqual(describe(activity.refersTo()), describe(am.getEntityById(activity.refersTo().getId())))
+
+        # Smaller VALUES blocks give the same rows
+        ids = [str(i) for i in range(1, 36)]
+        key = ["id", "authorId"]
+        self.assertTrue(qm.getCulturalHeritageObjectsByIds(ids, 4).sort_values(key, ignore_index=True).equals(
+            qm.getCulturalHeritageObjectsByIds(ids).sort_values(key, ignore_index=True)))
+
+    def test_27_AuthorsJoin(self):
+        q = MetadataQueryHandler()
+        q.setDbPathOrUrl(self.uploadMetadata())
+
+        # The authors of every object, as written in the CSV
+        csv = read_csv(self.metadata, keep_default_na=False)
+        bulk = q.getAuthorsOfCulturalHeritageObjects([str(i) for i in csv["Id"]])
+        for object_id, authors in zip(csv["Id"].astype(str), csv["Author"]):
+            expected = sorted(tuple(part.strip() for part in re.match(r"([^()]+)\((.*)\)", author.strip()).groups())[::-1]
+                              for author in authors.split(";") if author.strip())
+            df = q.getAuthorsOfCulturalHeritageObject(object_id)
+            self.assertEqual(sorted(zip(df["id"], df["name"])) if len(df) else [], expected)
+            rows = bulk[bulk["objectId"] == object_id]
+            self.assertEqual(sorted(zip(rows["id"], rows["name"])), expected)
+        self.assertEqual(len(q.getAuthorsOfCulturalHeritageObject("not an id")), 0)
+
+    def test_28_Materialization(self):
+        q = MetadataQueryHandler()
+        q.setDbPathOrUrl(self.uploadMetadata())
+        am = AdvancedMashup()
+        am.addMetadataHandler(q)
+
+        # The objects built from the query frames are the rows of the CSV
+        objects = {o.getId(): o for o in am.getAllCulturalHeritageObjects()}
+        csv = read_csv(self.metadata, keep_default_na=False, dtype=str)
+        self.assertEqual(sorted(objects), sorted(csv["Id"]))
+        for row in csv.itertuples():
+            o = objects[row.Id]
+            self.assertEqual(type(o).__name__, "".join(word.capitalize() for word in row.Type.split()))
+            self.assertEqual((o.getTitle(), o.getOwner(), o.getPlace(), o.getDate()),
+                             (row.Title.strip(), row.Owner.strip(), row.Place.strip(), row.Date.strip() or None))
+            self.assertEqual(sorted(a.getId() for a in o.getAuthors()), sorted(re.findall(r"\(([^)]*)\)", row.Author)))
+
+        people = {p.getId(): p.getName() for p in am.getAllPeople()}
+        self.assertEqual(len(people), len(am.getAllPeople()))
+        self.assertEqual(people["VIAF:78822798"], "Dioscorides Pedanius")
+
+    def test_29_LazyLoading(self):
+        calls = {"objects": 0, "authors": 0}
+
+        class CountingHandler(MetadataQueryHandler):
+            def getCulturalHeritageObjectsByIds(self, objectIds, batchSize=500):
+                calls["objects"] += 1
+                return super().getCulturalHeritageObjectsByIds(objectIds, batchSize)
+
+            def getAuthorsOfCulturalHeritageObjects(self, objectIds, batchSize=500):
+                calls["authors"] += 1
+                return super().getAuthorsOfCulturalHeritageObjects(objectIds, batchSize)
+
+        am, qm, qp = self.mashup(CountingHandler())
+        eager = am.getAllActivities()
+        self.assertTrue(am.setLazyLoading(True))
+
+        # The objects are loaded on the first access, all together, and only once
+        calls["objects"] = 0
+        activities = am.getAllActivities()
+        self.assertEqual(calls["objects"], 0)
+        self.assertIsInstance(activities[0].refersTo(), CulturalHeritageObject)
+        self.assertEqual(calls["objects"], 1)
+        self.assertEqual([a.refersTo().getId() for a in activities], [a.refersTo().getId() for a in eager])
+        self.assertEqual(calls["objects"], 1)
+
+        # and so are the authors
+        objects = am.getAllCulturalHeritageObjects()
+        self.assertEqual(calls["authors"], 0)
+        authors = [[a.getId() for a in o.getAuthors()] for o in objects]
+        self.assertEqual(calls["authors"], 1)
+        self.assertEqual([[a.getId() for a in o.getAuthors()] for o in objects], authors)
+        self.assertEqual(calls["authors"], 1)
+
+        # The model classes have no per-instance dictionary
+        for instance in [activities[0], objects[0], objects[0].getAuthors()[0]]:
+            self.assertFalse(hasattr(instance, "__dict__"))
+
+    def test_30_IndexedQueries(self):
+        import sqlite3
+        self.uploadProcess()
+
+        # The lookups by object and the date filters are answered from the indexes
+        con = sqlite3.connect(self.relational)
+        for table in ["acquisition", "processing", "modelling", "optimising", "exporting"]:
+            for condition, index in [('"objectId" = ?', f"{table}_objectId"),
+                                     ('"start date" >= ?', f"{table}_start_date"),
+                                     ('"end date" <= ?', f"{table}_end_date")]:
+                plan = " ".join(row[-1] for row in con.execute(f'EXPLAIN QUERY PLAN SELECT * FROM "{table}" WHERE {condition}', ("1",)))
+                self.assertIn(f"USING INDEX {index}", plan)
+        con.close()
+
+        # The values are bound as parameters, never pasted into the SQL
+        q = ProcessDataQueryHandler()
+        q.setDbPathOrUrl(self.relational)
+        activities = len(q.getAllActivities())
+        self.assertEqual(len(q.getActivitiesUsingTool("x' OR '1'='1")), 0)
+        self.assertEqual(len(q.getActivitiesByResponsiblePerson("%' OR 1=1 --")), 0)
+        self.assertEqual(len(q.getActivitiesStartedAfter("9999' OR '1'='1")), 0)
+        self.assertEqual(len(q.getAllActivities()), activities)
+        self.assertEqual(len(q.getActivitiesUsingTool("Blender")), 61)
+        q.close()
+
+    def test_31_AuthorParsing(self):
+        m = MetadataUploadHandler()
+        self.assertTrue(m.setDbPathOrUrl("graph.ttl"))
+        self.assertTrue(m.pushDataToDb(self.metadata))
+
+        # The triples of the row-by-row parsing the upload used before, on an empty graph
+        ns = "https://github.com/Sergpoipoip/DHDK_DS-project/"
+        expected, people, object_authors = Graph(), {}, {}
+        meta_df = read_csv(self.metadata, keep_default_na=False)
+        for _, row in meta_df.iterrows():
+            for author in [part.strip() for part in row["Author"].split(";")] if row["Author"] else []:
+                match_id, match_name = re.search(r"\((.*?)\)", author), re.search(r"^([^()]+)", author)
+                if match_id and match_name:
+                    person_id = match_id.group(1)
+                    if person_id not in people:
+                        people[person_id] = URIRef(ns + f"entities/person-{len(people)}")
+                        expected.add((people[person_id], RDF.type, URIRef(ns + "classes/Person")))
+                        expected.add((people[person_id], URIRef(ns + "attributes/id"), Literal(person_id)))
+                        expected.add((people[person_id], URIRef(ns + "attributes/name"), Literal(match_name.group(1).strip())))
+                    object_authors.setdefault(row["Id"], []).append(people[person_id])
+        for idx, row in meta_df.iterrows():
+            subject = URIRef(ns + f"entities/culturalObject-{idx}")
+            expected.add((subject, RDF.type, URIRef(ns + "classes/" + "".join(word.capitalize() for word in row["Type"].lower().split()))))
+            for column in meta_df.columns:
+                if column not in ["Type", "Author"] and row[column]:
+                    expected.add((subject, URIRef(ns + "attributes/" + column.lower()), Literal(str(row[column]).strip())))
+            for person in object_authors.get(row["Id"], []):
+                expected.add((subject, URIRef(ns + "relations/author"), person))
+
+        self.assertEqual(set(Graph().parse("graph.ttl")), set(expected))
+
+    def test_32_StreamingJsonParser(self):
+        import json
+        with open(self.process, encoding="utf-8") as f:
+            records = json.load(f)
+        for blockSize in [1, 3, 64, 4096]:
+            self.assertEqual(list(_iterJsonArray(self.process, blockSize)), records)
+
+        # Whitespace longer than a block, and numbers split between blocks
+        for text in [" [ ] ", "[1.5e10]", '  \n [1, -2.5E-3, true, null, "a,]", {"x": [1, 2.0]}, 10]  ']:
+            with open("array.json", mode="w", encoding="utf-8") as f:
+                f.write(text)
+            for blockSize in range(1, 8):
+                self.assertEqual(list(_iterJsonArray("array.json", blockSize)), json.loads(text))
+        for text in ["", "  ", "{}", "[1 2]", "[1,]", "[1"]:
+            with open("array.json", mode="w", encoding="utf-8") as f:
+                f.write(text)
+            with self.assertRaises(ValueError):
+                list(_iterJsonArray("array.json", 3))
+
+        # The chunked upload stores the same rows as the whole-file one
+        tables = []
+        for database, chunkSize in [("whole.db", None), ("chunked.db", 7)]:
+            u = ProcessDataUploadHandler()
+            self.assertTrue(u.setDbPathOrUrl(database))
+            self.assertTrue(u.pushDataToDb(self.process, chunkSize))
+            q = ProcessDataQueryHandler()
+            q.setDbPathOrUrl(database)
+            tables.append(q.getAllActivities().sort_values("activityId", ignore_index=True))
+            q.close()
+        self.assertTrue(tables[0].equals(tables[1]))